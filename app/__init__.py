@@ -3,8 +3,21 @@
 from flask_injector import FlaskInjector
 from flask import Flask
 from flask_cors import CORS
-from app.v1.api import ping, users, invoices
-from app.v1.module import dependencies
+from app.v1.api import ping, users, invoices, profiles
+from app.v1.api.hooks import (
+    start_request_deadline,
+    record_request_metrics,
+    end_request_deadline,
+    start_request_profile,
+    finish_request_profile,
+    start_request_log,
+    finish_request_log,
+    end_request_log,
+    start_request_cache_reads,
+    add_cache_headers,
+    end_request_cache_reads,
+)
+from app.v1.module import dependencies, profiling_enabled
 
 # Active endpoints noted as following:
 # (url_prefix, blueprint_object)
@@ -33,5 +46,23 @@ def create_app() -> Flask:
             name=f"suscriber-{blueprint.name}",
         )
 
+    # hooks must be registered before the injector so it can fill their arguments
+    app.before_request(start_request_deadline)
+    app.before_request(start_request_log)
+    app.before_request(start_request_cache_reads)
+    app.after_request(add_cache_headers)
+    app.after_request(record_request_metrics)
+    app.after_request(finish_request_log)
+    app.teardown_request(end_request_cache_reads)
+    app.teardown_request(end_request_log)
+    app.teardown_request(end_request_deadline)
+    # profiling adds nothing to the requests unless it is enabled
+    if profiling_enabled():
+        app.before_request(start_request_profile)
+        app.after_request(finish_request_profile)
+        app.register_blueprint(
+            profiles, url_prefix=f"/{PUBLIC_URL_PREFIX}/profiles", name=f"suscriber-{profiles.name}"
+        )
+
     FlaskInjector(app=app, modules=[dependencies])
     return app
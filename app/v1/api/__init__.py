@@ -2,6 +2,7 @@
 from app.v1.api.ping.views import ping
 from app.v1.api.users.views import users
 from app.v1.api.invoices.views import invoices
+from app.v1.api.profiles.views import profiles
 
 
-__all__ = ["ping", "users", "invoices"]
+__all__ = ["ping", "users", "invoices", "profiles"]
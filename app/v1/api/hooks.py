@@ -0,0 +1,167 @@
+"""Hooks run around every request."""
+
+from logging import Logger
+import time
+import uuid
+from flask import Response, g, request
+from app.v1.utils.cache import get_cache_reads, reset_cache_reads, start_cache_reads
+from app.v1.utils.deadline import DeadlinePolicy, set_deadline, reset_deadline
+from app.v1.utils.metrics import MetricsRegistry
+from app.v1.utils.profiling import RequestProfiler
+from app.v1.utils.log import start_log_context, reset_log_context
+
+
+REQUEST_ID_HEADER = "X-Request-Id"
+CACHE_HEADER = "X-Cache"
+# blueprints hit by health checks, their request logs are rate limited
+RATE_LIMITED_BLUEPRINTS = ("ping",)
+
+
+def start_request_log() -> None:
+    """Start the log context of the request with its id and route."""
+    request_id = request.headers.get(REQUEST_ID_HEADER, "")[:128] or uuid.uuid4().hex
+    g.request_id = request_id
+    g.log_token = start_log_context(request_id=request_id, route=request.endpoint or "unmatched")
+
+
+def finish_request_log(response: Response, logger: Logger) -> Response:
+    """Log the finished request with its upstream timings and cache outcomes.
+
+    Args:
+        response (Response): Response of the request.
+        logger (Logger): Logger.
+
+    Returns:
+        Response: The response, with the request id.
+    """
+    extra = {
+        "method": request.method,
+        "status": response.status_code,
+        "duration_ms": round((time.monotonic() - g.get("started_at", time.monotonic())) * 1000, 1),
+    }
+    if request.blueprint and request.blueprint.removeprefix("suscriber-") in RATE_LIMITED_BLUEPRINTS:
+        extra["rate_limit"] = request.blueprint
+    logger.info("Request finished", extra=extra)
+    if "request_id" in g:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    return response
+
+
+def end_request_log(_error: object) -> None:
+    """Remove the log context of the finished request."""
+    token = g.pop("log_token", None)
+    if token is not None:
+        reset_log_context(token)
+
+
+def start_request_cache_reads() -> None:
+    """Start tracking the cached data served by the request."""
+    g.cache_reads_token = start_cache_reads()
+
+
+def add_cache_headers(response: Response) -> Response:
+    """Tell how old the data of the response is.
+
+    `X-Cache` is HIT when every value came from a fresh cache entry, STALE
+    when a value was served while it is refreshed and MISS when a value was
+    fetched from the upstream. `Age` is the age in seconds of the oldest value.
+
+    Args:
+        response (Response): Response of the request.
+
+    Returns:
+        Response: The response, with the headers when the request read cached data.
+    """
+    reads = get_cache_reads()
+    if reads is not None:
+        freshness, age = reads
+        response.headers[CACHE_HEADER] = freshness.upper()
+        response.headers["Age"] = str(int(age))
+    return response
+
+
+def end_request_cache_reads(_error: object) -> None:
+    """Stop tracking the cached data of the finished request."""
+    token = g.pop("cache_reads_token", None)
+    if token is not None:
+        reset_cache_reads(token)
+
+
+def start_request_deadline(policy: DeadlinePolicy) -> None:
+    """Give the request the time budget of its endpoint.
+
+    Args:
+        policy (DeadlinePolicy): Budget of each endpoint.
+    """
+    g.started_at = time.monotonic()
+    budget = policy.get_budget(request.endpoint, request.headers.get(policy.header))
+    g.deadline_token = set_deadline(budget)
+
+
+def record_request_metrics(response: Response, metrics: MetricsRegistry) -> Response:
+    """Record the latency of the request by endpoint.
+
+    Streamed responses are measured until their first byte.
+
+    Args:
+        response (Response): Response of the request.
+        metrics (MetricsRegistry): Registry of the instance.
+
+    Returns:
+        Response: The same response.
+    """
+    started_at = g.get("started_at")
+    if started_at is not None:
+        metrics.histogram(
+            "http_request_duration_seconds", "Request latency by endpoint."
+        ).observe(
+            time.monotonic() - started_at,
+            endpoint=request.endpoint or "unmatched",
+            method=request.method,
+            status=str(response.status_code),
+        )
+    return response
+
+
+def start_request_profile(profiler: RequestProfiler) -> None:
+    """Profile the request when it is marked or sampled.
+
+    Args:
+        profiler (RequestProfiler): Profiler of the worker.
+    """
+    forced = request.headers.get(profiler.header, "").lower() in ("1", "true")
+    profile = profiler.start(forced)
+    if profile is not None:
+        g.profile = profile
+        g.profile_forced = forced
+        g.profile_started_at = time.monotonic()
+
+
+def finish_request_profile(response: Response, profiler: RequestProfiler) -> Response:
+    """Store the profile of a slow or marked request.
+
+    Args:
+        response (Response): Response of the request.
+        profiler (RequestProfiler): Profiler of the worker.
+
+    Returns:
+        Response: The response, with the profile name when it was stored.
+    """
+    profile = g.pop("profile", None)
+    if profile is not None:
+        name = profiler.stop(
+            profile,
+            request.endpoint or "unmatched",
+            time.monotonic() - g.profile_started_at,
+            g.profile_forced,
+        )
+        if name:
+            response.headers["X-Profile-Name"] = name
+    return response
+
+
+def end_request_deadline(_error: object) -> None:
+    """Remove the deadline of the finished request."""
+    token = g.pop("deadline_token", None)
+    if token is not None:
+        reset_deadline(token)
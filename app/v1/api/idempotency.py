@@ -0,0 +1,109 @@
+"""Idempotency keys for the endpoints that write to the POS system."""
+
+from typing import Callable
+from http import HTTPStatus
+import hashlib
+import time
+from flask import Response, g, request
+from app.v1.storage.idempotency import (
+    IdempotencyStore,
+    StoredResponse,
+    COMPLETED,
+    CONFLICT,
+    STARTED,
+)
+from app.v1.utils.deadline import get_remaining
+from app.v1.utils.errors import DeadlineExceededError
+
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADERS = ("Content-Type", "Location")
+
+
+def get_fingerprint() -> str:
+    """Hash the method, path, query and body of the current request."""
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.query_string, request.get_data()):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def forget_response() -> None:
+    """Don't keep the response of the current request for its key.
+
+    For answers that a retry can change, like an upstream failure reported
+    with a 4xx status. The key is released and the retry runs the request.
+    """
+    g.idempotency_forget = True
+
+
+def run_idempotent(
+    store: IdempotencyStore, handler: Callable[[], Response], max_poll_interval: float = 0.5
+) -> Response:
+    """Run a request once per `Idempotency-Key` header.
+
+    Requests without the header run as usual. A repeated key gets the stored
+    response without running the request again, and a request arriving while
+    another one with the same key runs waits for its response. Errors, 5xx
+    responses and the responses passed to `forget_response` are not stored,
+    so they can be retried.
+
+    Args:
+        store (IdempotencyStore): Responses by key, shared by the workers.
+        handler (Callable[[], Response]): Runs the request.
+        max_poll_interval (float): Max seconds between checks of a running request.
+
+    Raises:
+        DeadlineExceededError: Raised when the deadline passes while waiting
+            for the running request.
+
+    Returns:
+        Response: Response of the first request with the key.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            response=f"{IDEMPOTENCY_HEADER} is longer than {MAX_KEY_LENGTH} characters",
+            status=HTTPStatus.BAD_REQUEST,
+            content_type="text/plain",
+        )
+
+    fingerprint = get_fingerprint()
+    poll_interval = 0.05
+    while True:
+        state, stored = store.begin(key, fingerprint)
+        if state == STARTED:
+            break
+        if state == COMPLETED and stored:
+            response = Response(response=stored.body, status=stored.status, headers=stored.headers)
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+        if state == CONFLICT:
+            return Response(
+                response=f"{IDEMPOTENCY_HEADER} was already used for a different request",
+                status=HTTPStatus.UNPROCESSABLE_ENTITY,
+                content_type="text/plain",
+            )
+        remaining = get_remaining()
+        if remaining is not None and remaining <= poll_interval:
+            raise DeadlineExceededError("Request deadline exceeded waiting for a request with the same key")
+        time.sleep(poll_interval)
+        poll_interval = min(poll_interval * 2, max_poll_interval)
+
+    try:
+        response = handler()
+    except BaseException:
+        store.release(key)
+        raise
+    if response.status_code >= 500 or g.pop("idempotency_forget", False):
+        store.release(key)
+    else:
+        headers = {name: response.headers[name] for name in REPLAYED_HEADERS if name in response.headers}
+        store.complete(
+            key, StoredResponse(status=response.status_code, headers=headers, body=response.get_data())
+        )
+    return response
@@ -0,0 +1,38 @@
+"""Utils invoices view."""
+
+from typing import Optional
+import json
+from pydantic import BaseModel, Field, model_validator
+from app.v1.models import Invoice
+
+
+MAX_INVOICE_RANGE = 100_000
+INVOICES_PREFETCH_WINDOW = 8
+
+
+class InvoiceRangeValidator(BaseModel):
+    """Invoice range validator."""
+
+    first: int = Field(alias="from", ge=0)
+    last: int = Field(alias="to", ge=0)
+
+    @model_validator(mode="after")
+    def check_range(self) -> "InvoiceRangeValidator":
+        """Check the range is ordered and not too large."""
+        if self.last < self.first:
+            raise ValueError("'to' must be greater than or equal to 'from'")
+        if self.last - self.first + 1 > MAX_INVOICE_RANGE:
+            raise ValueError(f"At most {MAX_INVOICE_RANGE} invoices can be exported at once")
+        return self
+
+
+def define_invoice_line(
+    number: int, invoice: Optional[Invoice], error: Optional[Exception]
+) -> str:
+    """Create the NDJSON line reporting one invoice of a range."""
+    if error is not None:
+        line = json.dumps({"invoice_number": number, "status": "error", "error": str(error)})
+        return f"{line}\n"
+    if invoice is None:
+        return f'{{"invoice_number":{number},"status":"not_found"}}\n'
+    return f'{{"invoice_number":{number},"status":"found","invoice":{invoice.model_dump_json()}}}\n'
@@ -1,10 +1,17 @@
 """Module with ping endpoint."""
 
 from logging import Logger
+import math
 from http import HTTPStatus
-from flask import Blueprint, Response
+from flask import Blueprint, Response, request, stream_with_context
 from pydantic import ValidationError
 from app.v1.use_cases import InvoicesManager
+from app.v1.api.invoices.utils import (
+    InvoiceRangeValidator,
+    INVOICES_PREFETCH_WINDOW,
+    define_invoice_line,
+)
+from app.v1.utils.errors import get_upstream_error_status, get_retry_after
 
 
 invoices = Blueprint("invoices", __name__)
@@ -23,6 +30,22 @@ def get_user(
     return Response(response="Invoice not found", status=404, content_type="text/plain")
 
 
+@invoices.route("/<string:prefix>", methods=["GET"])
+def export_invoices(prefix: str, invoices_manager: InvoicesManager) -> Response:
+    """Stream a range of invoices as NDJSON."""
+    validator = InvoiceRangeValidator(**request.args)  # type: ignore
+    results = invoices_manager.iter_invoices(
+        prefix, validator.first, validator.last, INVOICES_PREFETCH_WINDOW
+    )
+    lines = (
+        define_invoice_line(number, invoice, error)
+        for number, invoice, error in results
+    )
+    return Response(
+        stream_with_context(lines), status=200, content_type="application/x-ndjson"
+    )
+
+
 @invoices.errorhandler(ValidationError)  # type: ignore
 def input_error(error: ValidationError) -> Response:
     """Handle input validation errors.
@@ -51,6 +74,14 @@ def handle_all_errors(error: Exception, logger: Logger) -> Response:
     Returns:
         Response: Response with the error.
     """
+    status = get_upstream_error_status(error)
+    if status:
+        logger.warning(f"Upstream error {error}")
+        response = Response(str(error), status=status, content_type="text/plain")
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return response
     logger.error(f"System error {error}")
     return Response(
         str(error), status=HTTPStatus.INTERNAL_SERVER_ERROR, content_type="text/plain"
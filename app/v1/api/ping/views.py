@@ -1,6 +1,8 @@
 """Module with ping endpoint."""
 from logging import Logger
 from flask import Blueprint, Response
+from app.v1.clients import SystemProvider
+from app.v1.utils.metrics import MetricsRegistry
 
 
 ping = Blueprint("ping", __name__)
@@ -9,5 +11,21 @@ ping = Blueprint("ping", __name__)
 @ping.route("/ping")
 def main(logger: Logger) -> Response:
     """Ping endpoint, used to know if the app is up."""
-    logger.info("Ping endpoint called")
+    logger.info("Ping endpoint called", extra={"rate_limit": "ping"})
     return Response(response="pong", status=200, content_type="text/plain")
+
+
+@ping.route("/ready")
+def ready(connector: SystemProvider) -> Response:
+    """Readiness endpoint, used to know if the worker can reach the POS system."""
+    if connector.check_ready():
+        return Response(response="ready", status=200, content_type="text/plain")
+    return Response(response="not ready", status=503, content_type="text/plain")
+
+
+@ping.route("/metrics")
+def metrics(registry: MetricsRegistry) -> Response:
+    """Metrics of every worker in the Prometheus text format."""
+    return Response(
+        response=registry.render(), status=200, content_type="text/plain; version=0.0.4"
+    )
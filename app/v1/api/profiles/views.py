@@ -0,0 +1,30 @@
+"""Module with the request profiles endpoints."""
+
+import json
+from flask import Blueprint, Response, request, send_file
+from app.v1.utils.profiling import RequestProfiler
+
+
+profiles = Blueprint("profiles", __name__)
+
+
+@profiles.route("/", methods=["GET"])
+def list_profiles(profiler: RequestProfiler) -> Response:
+    """List the newest profiles of slow or marked requests."""
+    limit = request.args.get("limit", default=50, type=int)
+    response = json.dumps({"profiles": profiler.list_profiles(limit)})
+    return Response(response=response, status=200, content_type="application/json")
+
+
+@profiles.route("/<string:name>", methods=["GET"])
+def get_profile(name: str, profiler: RequestProfiler) -> Response:
+    """Get a profile report, or the pstats file with `?format=pstats`."""
+    if request.args.get("format") == "pstats":
+        path = profiler.get_path(name)
+        if path:
+            return send_file(path, mimetype="application/octet-stream", as_attachment=True)
+    else:
+        report = profiler.summarize(name)
+        if report:
+            return Response(response=report, status=200, content_type="text/plain")
+    return Response(response="Profile not found", status=404, content_type="text/plain")
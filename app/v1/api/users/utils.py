@@ -1,9 +1,35 @@
 """Utils users view."""
 
-from typing import Union
-from pydantic import BaseModel, field_validator
-from email_validator import validate_email
-from app.v1.models import DocumentType, Client
+from typing import Any, Dict, List, Optional, Union
+import csv
+import io
+from pydantic import BaseModel, Field, field_validator
+from app.v1.models import DocumentType, Client, ImportFormat
+from app.v1.use_cases import EmailVerifier
+
+
+MAX_BATCH_DOCUMENTS = 500
+BATCH_CONCURRENCY = 8
+MAX_IMPORT_ERRORS_PAGE = 1000
+EXPORT_PAGE_SIZE = 100
+EXPORT_PREFETCH_PAGES = 2
+# Columns of an exported CSV, it can be imported again
+EXPORT_CSV_COLUMNS = (
+    "name",
+    "last_name",
+    "email",
+    "document",
+    "check_digit",
+    "document_type",
+    "phone",
+    "address",
+    "responsibilities",
+)
+IMPORT_CONTENT_TYPES = {
+    "text/csv": ImportFormat.CSV,
+    "application/x-ndjson": ImportFormat.NDJSON,
+    "application/jsonl": ImportFormat.NDJSON,
+}
 
 
 class GetClientValidator(BaseModel):
@@ -26,10 +52,57 @@ class GetClientValidator(BaseModel):
         raise ValueError(f"Invalid document type: {value}")
 
 
-def validate_user(user: Client) -> None:
+class BatchClientsValidator(BaseModel):
+    """Batch lookup validator."""
+
+    documents: List[int] = Field(min_length=1, max_length=MAX_BATCH_DOCUMENTS)
+
+
+class ImportErrorsValidator(BaseModel):
+    """Import status validator."""
+
+    offset: int = Field(default=0, ge=0)
+    limit: int = Field(default=100, ge=0, le=MAX_IMPORT_ERRORS_PAGE)
+
+
+class ExportValidator(BaseModel):
+    """Clients export validator."""
+
+    format: ImportFormat = ImportFormat.NDJSON
+
+
+def define_csv_line(values: Dict[str, Any]) -> str:
+    """Define a CSV line with the export columns."""
+    output = io.StringIO()
+    csv.DictWriter(output, EXPORT_CSV_COLUMNS, extrasaction="ignore").writerow(values)
+    return output.getvalue()
+
+
+def define_client_line(client: Client, file_format: ImportFormat) -> str:
+    """Define the line of a client in an export."""
+    if file_format == ImportFormat.CSV:
+        return define_csv_line(client.model_dump(mode="json", include=set(EXPORT_CSV_COLUMNS)))
+    return client.model_dump_json(include=set(Client.model_fields)) + "\n"
+
+
+def get_import_format(content_type: Optional[str], requested: Optional[str]) -> Optional[ImportFormat]:
+    """Get the format of an import file from the `format` argument or the content type."""
+    if requested:
+        try:
+            return ImportFormat(requested.lower())
+        except ValueError:
+            return None
+    return IMPORT_CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+
+
+def validate_user(user: Client, emails: EmailVerifier) -> None:
     """Validate user data."""
-    validate_email(str(user.email))
+    emails.check(str(user.email))
+    validate_fields(user)
+
 
+def validate_fields(user: Client) -> None:
+    """Validate user data other than the email."""
     if not user.name or user.name == "":
         raise ValueError("Name is required")
 
@@ -1,14 +1,39 @@
 """Module with ping endpoint."""
 
+from typing import Iterator
 from logging import Logger
+import math
+import asyncio
+import itertools
 import json
 from http import HTTPStatus
-from flask import Blueprint, Response, request
+from flask import Blueprint, Response, request, stream_with_context, url_for
 from pydantic import ValidationError
-from app.v1.use_cases import UsersManager
-from app.v1.models import Client
-from app.v1.api.users.utils import GetClientValidator, validate_user
-from app.v1.utils.errors import SendDataError
+from app.v1.use_cases import UsersManager, EmailVerifier, ImportWorker
+from app.v1.models import Client, ImportFormat
+from app.v1.api.users.utils import (
+    GetClientValidator,
+    BatchClientsValidator,
+    ImportErrorsValidator,
+    ExportValidator,
+    BATCH_CONCURRENCY,
+    EXPORT_CSV_COLUMNS,
+    EXPORT_PAGE_SIZE,
+    EXPORT_PREFETCH_PAGES,
+    define_client_line,
+    define_csv_line,
+    get_import_format,
+    validate_user,
+)
+from app.v1.api.idempotency import forget_response, run_idempotent
+from app.v1.storage import IdempotencyStore
+from app.v1.utils.errors import (
+    AlreadyExistsError,
+    FileTooLargeError,
+    SendDataError,
+    get_upstream_error_status,
+    get_retry_after,
+)
 
 
 users = Blueprint("users", __name__)
@@ -26,7 +51,7 @@ def get_user(user_id: int, users_manager: UsersManager) -> Response:
         and user.document_type == validator.document_type
     ):
         return Response(
-            response=user.json(), status=200, content_type="application/json"
+            response=user.model_dump_json(), status=200, content_type="application/json"
         )
     return Response(response="Client not found", status=404, content_type="text/plain")
 
@@ -42,25 +67,155 @@ def check_exists(user_id: int, users_manager: UsersManager) -> Response:
     return Response(response="user is not present", status=404, content_type="text/plain")
 
 
+@users.route("/batch", methods=["POST"])
+def check_batch(users_manager: UsersManager, logger: Logger) -> Response:
+    """Check if several users exist."""
+    validator = BatchClientsValidator.model_validate_json(request.get_data())
+    found = asyncio.run(
+        users_manager.get_users_async(validator.documents, BATCH_CONCURRENCY)
+    )
+
+    results = []
+    for document, user in found.items():
+        if isinstance(user, Exception):
+            logger.error(f"Batch lookup error for document {document}: {user}")
+            results.append({"document": document, "exists": None, "error": str(user)})
+        else:
+            exists = user is not None and user.document == document
+            results.append({"document": document, "exists": exists, "error": None})
+    response = json.dumps({"results": results})
+    return Response(response=response, status=200, content_type="application/json")
+
+
+@users.route("/export", methods=["GET"])
+def export_users(users_manager: UsersManager, logger: Logger) -> Response:
+    """Stream every user as CSV or NDJSON.
+
+    An error after the first page can't change the status anymore, so it is
+    raised to cut the stream and the client doesn't take a partial export as
+    complete.
+    """
+    validator = ExportValidator(**request.args)  # type: ignore
+    users_found = users_manager.iter_users(EXPORT_PAGE_SIZE, EXPORT_PREFETCH_PAGES)
+    # the first page is downloaded before answering, so an unreachable upstream gets an error status
+    first = list(itertools.islice(users_found, 1))
+
+    def define_lines() -> Iterator[str]:
+        try:
+            for user in itertools.chain(first, users_found):
+                yield define_client_line(user, validator.format)
+        except Exception as error:
+            logger.error(f"Export interrupted: {error}")
+            raise
+
+    lines = define_lines()
+    if validator.format == ImportFormat.CSV:
+        header = define_csv_line({column: column for column in EXPORT_CSV_COLUMNS})
+        return Response(
+            stream_with_context(itertools.chain([header], lines)), status=200, content_type="text/csv"
+        )
+    return Response(stream_with_context(lines), status=200, content_type="application/x-ndjson")
+
+
 @users.route("/", methods=["POST"])
-def post_user(users_manager: UsersManager) -> Response:
-    """Create an user."""
-    user = Client(**request.json)  # type: ignore
-    validate_user(user)
+def post_user(
+    users_manager: UsersManager, emails: EmailVerifier, idempotency: IdempotencyStore
+) -> Response:
+    """Create an user. Retries with the same Idempotency-Key get the first response."""
+    return run_idempotent(idempotency, lambda: create_user(users_manager, emails))
+
+
+def create_user(users_manager: UsersManager, emails: EmailVerifier) -> Response:
+    """Create the user sent in the request."""
+    user = Client.model_validate_json(request.get_data())
+    validate_user(user, emails)
     try:
+        if users_manager.queues_registrations:
+            ticket = users_manager.enqueue_user(user)
+            response = json.dumps({"ticket": ticket, "status": "pending"})
+            location = url_for(".get_registration", ticket=ticket)
+            return Response(
+                response=response,
+                status=HTTPStatus.ACCEPTED,
+                content_type="application/json",
+                headers={"Location": location},
+            )
         users_manager.upload_user(user)
         response = json.dumps({"message": "User created successfully"})
         return Response(response=response, status=200, content_type="application/json")
-    except SendDataError:
+    except SendDataError as error:
+        if get_upstream_error_status(error):
+            raise
+        if not isinstance(error, AlreadyExistsError):
+            # PirPos failed, a retry with the same key must try again
+            forget_response()
         return Response(response="client not created", status=HTTPStatus.BAD_REQUEST, content_type="text/plain")
 
 
+@users.route("/registrations/<string:ticket>", methods=["GET"])
+def get_registration(ticket: str, users_manager: UsersManager) -> Response:
+    """Get the progress of a background registration."""
+    registration = users_manager.get_registration(ticket)
+    if registration:
+        return Response(
+            response=registration.model_dump_json(), status=200, content_type="application/json"
+        )
+    return Response(response="Registration not found", status=404, content_type="text/plain")
+
+
+@users.route("/imports", methods=["POST"])
+def post_import(imports: ImportWorker) -> Response:
+    """Queue a CSV or NDJSON file of clients to import in the background."""
+    file_format = get_import_format(request.content_type, request.args.get("format"))
+    if file_format is None:
+        return Response(
+            response="Send a CSV or NDJSON file",
+            status=HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+            content_type="text/plain",
+        )
+    try:
+        job_id = imports.submit(request.stream, file_format)
+    except FileTooLargeError as error:
+        return Response(
+            response=str(error), status=HTTPStatus.REQUEST_ENTITY_TOO_LARGE, content_type="text/plain"
+        )
+    response = json.dumps({"job_id": job_id, "status": "queued"})
+    return Response(
+        response=response,
+        status=HTTPStatus.ACCEPTED,
+        content_type="application/json",
+        headers={"Location": url_for(".get_import", job_id=job_id)},
+    )
+
+
+@users.route("/imports/<string:job_id>", methods=["GET"])
+def get_import(job_id: str, imports: ImportWorker) -> Response:
+    """Get the progress of an import and the rows that failed."""
+    validator = ImportErrorsValidator(**request.args)  # type: ignore
+    job = imports.get(job_id)
+    if job is None:
+        return Response(response="Import not found", status=404, content_type="text/plain")
+    errors = imports.get_errors(job_id, validator.offset, validator.limit)
+    response = json.dumps({
+        **job.model_dump(mode="json"),
+        "errors": [error.model_dump(mode="json") for error in errors],
+    })
+    return Response(response=response, status=200, content_type="application/json")
+
+
 @users.route("/", methods=["PUT"])
-def update_user(users_manager: UsersManager) -> Response:
-    """Update an user."""
-    user = Client(**request.json)  # type: ignore
+def update_user(
+    users_manager: UsersManager, emails: EmailVerifier, idempotency: IdempotencyStore
+) -> Response:
+    """Update an user. Retries with the same Idempotency-Key get the first response."""
+    return run_idempotent(idempotency, lambda: change_user(users_manager, emails))
+
+
+def change_user(users_manager: UsersManager, emails: EmailVerifier) -> Response:
+    """Update the user sent in the request."""
+    user = Client.model_validate_json(request.get_data())
     validator = GetClientValidator(**request.args)  # type: ignore
-    validate_user(user)
+    validate_user(user, emails)
 
     current_data = users_manager.get_user(user.document)
     if (  # check if the requester knows at least 3 fields of the object
@@ -69,7 +224,7 @@ def update_user(users_manager: UsersManager) -> Response:
         and validator.email == current_data.email
         and validator.document_type == current_data.document_type
     ):
-        users_manager.update_user(user)
+        users_manager.update_user(user, current_data)
         response = json.dumps({"message": "User updated successfully"})
         return Response(response=response, status=200, content_type="application/json")
     return Response(response="Client not found", status=404, content_type="text/plain")
@@ -101,6 +256,14 @@ def handle_all_errors(error: Exception, logger: Logger) -> Response:
     Returns:
         Response: Response with the error.
     """
+    status = get_upstream_error_status(error)
+    if status:
+        logger.warning(f"Upstream error {error}")
+        response = Response(str(error), status=status, content_type="text/plain")
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return response
     logger.error(f"System error {error}")
     return Response(
         str(error), status=HTTPStatus.INTERNAL_SERVER_ERROR, content_type="text/plain"
@@ -1,7 +1,16 @@
 """Exposed clients."""
-from app.v1.clients.pos_system.base import SystemProvider
+from app.v1.clients.pos_system.base import SystemProvider, AsyncSystemProvider
+from app.v1.clients.pos_system.async_connector import AsyncConnector
 from app.v1.clients.pos_system.pirpos import PirposConnector
 from app.v1.clients.pos_system.dummy import DummyConnector
+from app.v1.clients.pos_system.transport import PooledTransport
 
 
-__all__ = ["SystemProvider", "PirposConnector", "DummyConnector"]
+__all__ = [
+    "SystemProvider",
+    "AsyncSystemProvider",
+    "AsyncConnector",
+    "PirposConnector",
+    "DummyConnector",
+    "PooledTransport",
+]
@@ -0,0 +1,90 @@
+"""Async adapter for the POS connectors."""
+
+from typing import Any, Callable, Optional, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from app.v1.models import Client, Invoice
+from app.v1.clients.pos_system.base import SystemProvider, AsyncSystemProvider
+
+
+Result = TypeVar("Result")
+
+
+class AsyncConnector(AsyncSystemProvider):
+    """Await any `SystemProvider` without blocking the event loop.
+
+    Calls run on a bounded thread pool owned by the current worker, so they
+    keep using the connector connection pool, token and request coalescing.
+    Many upstream waits can overlap while a single request is served.
+    """
+
+    def __init__(self, connector: SystemProvider, max_workers: int = 8):
+        """Initialize the adapter.
+
+        Args:
+            connector (SystemProvider): Connector to run.
+            max_workers (int): Max upstream calls running at the same time.
+        """
+        self.__connector = connector
+        self.__max_workers = max_workers
+        self.__lock = threading.Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__pid: Optional[int] = None
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        """Get the thread pool of the current process.
+
+        Threads don't survive a fork, so each uWSGI worker builds its own pool.
+        """
+        if self.__executor is None or self.__pid != os.getpid():
+            with self.__lock:
+                if self.__executor is None or self.__pid != os.getpid():
+                    self.__executor = ThreadPoolExecutor(
+                        max_workers=self.__max_workers, thread_name_prefix="pos-connector"
+                    )
+                    self.__pid = os.getpid()
+        return self.__executor
+
+    async def __run(self, function: Callable[..., Result], *args: Any) -> Result:
+        """Run a blocking call in the thread pool keeping the caller context."""
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.__get_executor(), functools.partial(context.run, function, *args)
+        )
+
+    async def get_client(self, document: int) -> Optional[Client]:
+        """Get client by document.
+
+        Args:
+            document (int): Document to search.
+
+        Returns:
+            Optional[Client]: Client found.
+        """
+        return await self.__run(self.__connector.get_client, document)
+
+    async def upload_client(self, client: Client) -> None:
+        """Upload client data to the POS system.
+
+        Args:
+            client (Client): Client to upload.
+        """
+        await self.__run(self.__connector.upload_client, client)
+
+    async def update_client(self, client: Client, current: Optional[Client] = None) -> None:
+        """Update client to POS system.
+
+        Args:
+            client (Client): Client to update.
+            current (Optional[Client]): Client returned by `get_client`.
+        """
+        await self.__run(self.__connector.update_client, client, current)
+
+    async def get_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
+        """Get a specific invoice."""
+        return await self.__run(self.__connector.get_invoice, prefix, number)
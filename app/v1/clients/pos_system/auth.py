@@ -0,0 +1,169 @@
+"""PirPos access token management."""
+
+from typing import Callable, Optional, Tuple
+from logging import Logger
+import base64
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+from requests.auth import AuthBase
+
+
+DEFAULT_TOKEN_FILE = os.path.join(tempfile.gettempdir(), "pirpos_token.json")
+
+
+def get_token_expiration(token: str) -> Optional[float]:
+    """Read the `exp` claim of a JWT without validating it.
+
+    Args:
+        token (str): Access token.
+
+    Returns:
+        Optional[float]: Expiration timestamp, None if the token is not a JWT.
+    """
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    payload = parts[1] + "=" * (-len(parts[1]) % 4)
+    try:
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+    except ValueError:
+        return None
+    expiration = claims.get("exp") if isinstance(claims, dict) else None
+    if isinstance(expiration, (int, float)):
+        return float(expiration)
+    return None
+
+
+class PirposTokenManager(AuthBase):
+    """Lazy PirPos access token shared by every worker.
+
+    The token is requested on first use, persisted to a local file so all the
+    uWSGI workers reuse a single login, refreshed before it expires and
+    renewed when PirPos answers 401. The transport resends the rejected
+    request through `handle_401`.
+    """
+
+    def __init__(
+        self,
+        login: Callable[[], str],
+        logger: Logger,
+        token_file: str = DEFAULT_TOKEN_FILE,
+        refresh_margin: float = 300,
+        default_ttl: float = 3600,
+    ):
+        """Initialize the token manager.
+
+        Args:
+            login (Callable[[], str]): Function that logs in and returns a token.
+            logger (Logger): Logger to use.
+            token_file (str): File shared by the workers to store the token.
+            refresh_margin (float): Seconds before expiration to renew the token.
+            default_ttl (float): Token lifetime used when it has no `exp` claim.
+        """
+        self.__login = login
+        self.__logger = logger
+        self.__token_file = token_file
+        self.__lock_file = f"{token_file}.lock"
+        self.__refresh_margin = refresh_margin
+        self.__default_ttl = default_ttl
+        self.__lock = threading.Lock()
+        self.__token: Optional[str] = None
+        self.__expires_at = 0.0
+
+    def __is_fresh(self, expires_at: float) -> bool:
+        """Check if a token expiring at `expires_at` can still be used."""
+        return time.time() < expires_at - self.__refresh_margin
+
+    def __read_file(self) -> Tuple[Optional[str], float]:
+        """Read the token stored by any worker."""
+        try:
+            with open(self.__token_file, encoding="utf-8") as token_file:
+                data = json.load(token_file)
+            return str(data["token"]), float(data["expires_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, 0.0
+
+    def __write_file(self, token: str, expires_at: float) -> None:
+        """Atomically store the token for the other workers."""
+        directory = os.path.dirname(self.__token_file) or "."
+        descriptor, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as tmp_file:
+                json.dump({"token": token, "expires_at": expires_at}, tmp_file)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.__token_file)
+        except OSError as error:
+            self.__logger.warning("Can't persist PirPos token: %s", error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __renew(self) -> None:
+        """Adopt the shared token or log in, holding the cross worker lock."""
+        with open(self.__lock_file, "a", encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                token, expires_at = self.__read_file()
+                if token is None or token == self.__token or not self.__is_fresh(expires_at):
+                    token = self.__login()
+                    expiration = get_token_expiration(token)
+                    expires_at = expiration if expiration else time.time() + self.__default_ttl
+                    self.__write_file(token, expires_at)
+                    self.__logger.info("PirPos login completed.")
+                self.__token = token
+                self.__expires_at = expires_at
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_token(self) -> str:
+        """Get a valid access token, logging in only when needed.
+
+        Raises:
+            CredentialsError: Raised when the login fails.
+
+        Returns:
+            str: Access token.
+        """
+        with self.__lock:
+            if self.__token is None or not self.__is_fresh(self.__expires_at):
+                self.__renew()
+            assert self.__token is not None
+            return self.__token
+
+    def invalidate(self, token: str) -> None:
+        """Discard a token rejected by PirPos.
+
+        Args:
+            token (str): Rejected token. Newer tokens are kept.
+        """
+        with self.__lock:
+            if self.__token == token:
+                self.__expires_at = 0.0
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        """Add the bearer token to an outgoing request."""
+        request.headers["Authorization"] = f"Bearer {self.get_token()}"
+        return request
+
+    def handle_401(self, response: requests.Response) -> bool:
+        """Discard the token rejected by PirPos.
+
+        The transport sends the request again once, preparing it from scratch,
+        so the login runs before it takes a bulkhead slot.
+
+        Args:
+            response (requests.Response): Response to a request sent with this auth.
+
+        Returns:
+            bool: Whether the request must be sent again with a new token.
+        """
+        if response.status_code != 401:
+            return False
+        rejected = response.request.headers.get("Authorization", "").removeprefix("Bearer ")
+        self.invalidate(rejected)
+        self.__logger.info("PirPos rejected the access token. Logging in again.")
+        return True
@@ -1,6 +1,6 @@
 """System provider Base Object."""
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Iterator, Optional
 from app.v1.models import Client, Invoice
 
 
@@ -11,14 +11,66 @@ class SystemProvider(ABC):
     def get_client(self, document: int) -> Optional[Client]:
         """Get client by document."""
 
+    def get_fresh_client(self, document: int) -> Optional[Client]:
+        """Get client by document from the POS system itself.
+
+        Connectors answering lookups from a local copy override it to skip the copy.
+        """
+        return self.get_client(document)
+
     @abstractmethod
     def upload_client(self, client: Client) -> None:
         """Upload client in the POS system."""
 
     @abstractmethod
-    def update_client(self, client: Client) -> None:
-        """Update client in the POS system."""
+    def update_client(self, client: Client, current: Optional[Client] = None) -> None:
+        """Update client in the POS system.
+
+        `current` is the client returned by `get_client` for the same document,
+        connectors can use it to avoid searching the client again.
+        """
 
     @abstractmethod
     def get_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
         """Get a specific invoice."""
+
+    def iter_clients(self, page_size: int = 100, prefetch: int = 2) -> Iterator[Client]:
+        """Walk every client of the POS system without loading them all in memory.
+
+        Connectors that can list their clients override it.
+
+        Args:
+            page_size (int): Clients requested per call.
+            prefetch (int): Calls made ahead of the consumer.
+
+        Yields:
+            Iterator[Client]: Clients in the order of the POS system.
+        """
+        return iter(())
+
+    def check_ready(self) -> bool:
+        """Check whether the connector is warmed up and can reach the POS system.
+
+        Connectors that need a warm up, like a login, override it.
+        """
+        return True
+
+
+class AsyncSystemProvider(ABC):
+    """Base class to define POS technology providers awaited from coroutines."""
+
+    @abstractmethod
+    async def get_client(self, document: int) -> Optional[Client]:
+        """Get client by document."""
+
+    @abstractmethod
+    async def upload_client(self, client: Client) -> None:
+        """Upload client in the POS system."""
+
+    @abstractmethod
+    async def update_client(self, client: Client, current: Optional[Client] = None) -> None:
+        """Update client in the POS system."""
+
+    @abstractmethod
+    async def get_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
+        """Get a specific invoice."""
@@ -30,11 +30,12 @@ class DummyConnector(SystemProvider):
         """
         return None
 
-    def update_client(self, client: Client) -> None:
+    def update_client(self, client: Client, current: Optional[Client] = None) -> None:
         """Update client to POS system.
 
         Args:
             client (Client): Client to update.
+            current (Optional[Client]): Client returned by `get_client`.
         """
         return None
 
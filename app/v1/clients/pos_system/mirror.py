@@ -0,0 +1,135 @@
+"""Background sync of the local clients mirror."""
+
+from typing import Callable, List, Optional, Tuple
+from logging import Logger
+import fcntl
+import os
+import threading
+import time
+from app.v1.clients.pos_system.utils import iter_pages
+from app.v1.models import Client
+from app.v1.storage import ClientsMirror
+
+
+FetchPage = Callable[[int, int], Tuple[List[Client], List[str]]]
+
+
+class MirrorSync:
+    """Refresh a `ClientsMirror` from a background thread of each worker.
+
+    Every worker runs the loop, but a file lock lets only one of them walk
+    the POS client list per interval. A walk ends on an empty page or one
+    shorter than an earlier page, then replaces the mirrored clients and
+    removes the ones that no longer exist.
+    """
+
+    def __init__(
+        self,
+        mirror: ClientsMirror,
+        fetch_page: FetchPage,
+        logger: Logger,
+        lock_file: str,
+        interval: float = 3600,
+        page_size: int = 100,
+        retry_after: float = 60,
+        max_pages: int = 100_000,
+    ):
+        """Initialize the sync.
+
+        Args:
+            mirror (ClientsMirror): Mirror to refresh.
+            fetch_page (FetchPage): Downloads a page `(page, limit)` of clients and their ids.
+            logger (Logger): Logger to use.
+            lock_file (str): File locked by the worker running the sync.
+            interval (float): Seconds between complete syncs.
+            page_size (int): Clients requested per page.
+            retry_after (float): Seconds to wait after a failed sync.
+            max_pages (int): Safety limit of pages per sync.
+        """
+        self.__mirror = mirror
+        self.__fetch_page = fetch_page
+        self.__logger = logger
+        self.__lock_file = lock_file
+        self.__interval = interval
+        self.__page_size = page_size
+        self.__retry_after = retry_after
+        self.__max_pages = max_pages
+        self.__lock = threading.Lock()
+        self.__pid: Optional[int] = None
+
+    def ensure_running(self) -> None:
+        """Start the background thread of the current worker if it is not running."""
+        if self.__pid == os.getpid():
+            return
+        with self.__lock:
+            if self.__pid == os.getpid():
+                return
+            self.__pid = os.getpid()
+            thread = threading.Thread(target=self.__run, name="clients-mirror-sync", daemon=True)
+            thread.start()
+
+    def __run(self) -> None:
+        """Sync whenever the mirror is due for a refresh."""
+        while True:
+            wait = self.__interval - (time.time() - self.__mirror.last_sync())
+            if wait > 0:
+                time.sleep(min(wait, self.__interval))
+                continue
+            try:
+                self.sync()
+            except Exception as error:  # pylint: disable=broad-except
+                self.__logger.warning("Clients mirror sync failed: %s", error)
+                time.sleep(self.__retry_after)
+
+    def sync(self) -> bool:
+        """Walk the POS client list unless another worker is already doing it.
+
+        Returns:
+            bool: Whether this worker ran the sync.
+        """
+        with open(self.__lock_file, "a", encoding="utf-8") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                time.sleep(self.__retry_after)
+                return False
+            try:
+                if time.time() - self.__mirror.last_sync() < self.__interval:
+                    return False
+                self.__walk()
+                return True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __walk(self) -> None:
+        """Download every page and replace the mirrored clients.
+
+        Clients missing from the walk are only removed when it read at least as
+        many clients as the mirror had, so a list cut short by PirPos doesn't
+        empty the mirror.
+
+        Raises:
+            FetchDataError: Raised when the list doesn't end within `max_pages`.
+        """
+        started_at = time.time()
+        mirrored = self.__mirror.size()
+        synced = 0
+        pages = iter_pages(self.__fetch_page, self.__page_size, prefetch=0, max_pages=self.__max_pages)
+        for clients, ids in pages:
+            self.__mirror.save(zip(clients, ids))
+            synced += len(clients)
+
+        removed = 0
+        if synced >= mirrored:
+            removed = self.__mirror.remove_older_than(started_at)
+        else:
+            self.__logger.warning(
+                "Clients mirror sync read %s clients of the %s mirrored, none removed", synced, mirrored
+            )
+        self.__mirror.mark_synced(time.time())
+        self.__logger.info(
+            "Clients mirror synced %s clients, removed %s in %.1fs",
+            synced,
+            removed,
+            time.time() - started_at,
+        )
@@ -1,19 +1,31 @@
 """PirPos client."""
 
-from typing import Optional, Dict
+from typing import Iterator, Optional, Dict, List, Tuple
 import os
 import json
+import sqlite3
 from logging import Logger
 import logging
-import requests
 from app.v1.models import Client, Invoice
 from app.v1.clients.pos_system.base import SystemProvider
+from app.v1.clients.pos_system.auth import PirposTokenManager, DEFAULT_TOKEN_FILE
+from app.v1.clients.pos_system.transport import PooledTransport
+from app.v1.clients.pos_system.mirror import MirrorSync
 from app.v1.clients.pos_system.utils import (
     define_payload_from_client,
+    PirposClient,
     get_clients_by_filter,
-    get_invoice_from_json
+    get_invoice_from_json,
+    iter_pages,
 )
-from app.v1.utils.errors import CredentialsError, SendDataError, FetchDataError
+from app.v1.storage import ClientsMirror
+from app.v1.utils.concurrency import SingleFlight
+from app.v1.utils.cache import TTLCache
+from app.v1.utils.errors import AlreadyExistsError, CredentialsError, SendDataError, FetchDataError
+from app.v1.utils.metrics import MetricsRegistry
+
+
+SEARCH_PAGES_BUCKETS = (1, 2, 3, 5, 10, 20, 50)
 
 
 class PirposConnector(SystemProvider):
@@ -24,13 +36,60 @@ class PirposConnector(SystemProvider):
         pirpos_username: str,
         pirpos_password: str,
         logger: Logger,
+        transport: Optional[PooledTransport] = None,
+        token_file: str = DEFAULT_TOKEN_FILE,
+        mirror: Optional[ClientsMirror] = None,
+        mirror_interval: float = 3600,
+        mirror_page_size: int = 100,
+        ready_ttl: float = 10,
+        search_page_size: int = 50,
+        search_max_pages: int = 20,
+        metrics: Optional[MetricsRegistry] = None,
     ):
-        """Parameters used to make a connection."""
+        """Parameters used to make a connection.
+
+        The login is deferred until the first request that needs it, or until
+        the first readiness check. When a mirror is given, client lookups are
+        answered from it and it is kept up to date from a background thread
+        started on first use. `ready_ttl` is the number of seconds the result of
+        a readiness probe is reused.
+
+        PirPos searches documents by substring, so a lookup walks the result
+        pages of `search_page_size` clients until it finds the exact document,
+        up to `search_max_pages`. `metrics` records the pages each lookup took.
+        """
         self.__logger = logger
+        self.__transport = transport if transport else PooledTransport(logger)
         self.__pirpos_username = pirpos_username
         self.__pirpos_password = pirpos_password
         self.__pirpos_domain = "https://api.pirpos.com"
-        self.__pirpos_access_token = self.__get_pirpos_access_token()
+        self.__auth = PirposTokenManager(
+            self.__get_pirpos_access_token, logger, token_file
+        )
+        self.__searches: SingleFlight[List[Tuple[Client, str]]] = SingleFlight()
+        self.__search_page_size = search_page_size
+        self.__search_max_pages = search_max_pages
+        self.__search_pages = metrics.histogram(
+            "pirpos_search_pages",
+            "PirPos result pages read per client lookup, by whether the client was found.",
+            SEARCH_PAGES_BUCKETS,
+        ) if metrics else None
+        self.__invoices: SingleFlight[Optional[Invoice]] = SingleFlight()
+        self.__readiness: TTLCache[bool] = TTLCache(maxsize=1, ttl=ready_ttl)
+        self.__probes: SingleFlight[bool] = SingleFlight()
+        self.__mirror = mirror
+        self.__mirror_sync = (
+            MirrorSync(
+                mirror,
+                self.__get_clients_page,
+                logger,
+                f"{mirror.path}.sync.lock",
+                interval=mirror_interval,
+                page_size=mirror_page_size,
+            )
+            if mirror
+            else None
+        )
         self.__logger.info("Pirpos connector initialized.")
 
     def __get_pirpos_access_token(self) -> str:
@@ -52,8 +111,8 @@ class PirposConnector(SystemProvider):
             "password": self.__pirpos_password,
         }
         headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            url, data=json.dumps(values), headers=headers, timeout=20
+        response = self.__transport.request(
+            "POST", url, "login", data=json.dumps(values), headers=headers
         )
 
         if not response.ok:
@@ -71,17 +130,108 @@ class PirposConnector(SystemProvider):
         return access_token
 
     def __get_headers(self) -> Dict[str, str]:
-        """Get headers with credentials.
+        """Get request headers. Credentials are added by the token manager.
 
         Returns:
-            Dict[str, str]: Headers with credentials
+            Dict[str, str]: Request headers
         """
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.__pirpos_access_token}",
-        }
+        headers = {"Content-Type": "application/json"}
         return headers
 
+    def __search_client(self, document: int) -> List[Tuple[Client, str]]:
+        """Search a document sharing the request with identical searches in flight.
+
+        Args:
+            document (int): Document to search.
+
+        Returns:
+            List[Tuple[Client, str]]: Clients with exactly that document and their
+                PirPos ids, empty when there is none.
+        """
+        return self.__searches.do(document, lambda: self.__walk_search(document))
+
+    def __walk_search(self, document: int) -> List[Tuple[Client, str]]:
+        """Read the result pages of a document search until the exact document shows up.
+
+        Raises:
+            FetchDataError: Raised when the results exceed `search_max_pages`.
+        """
+        headers = self.__get_headers()
+        pages = iter_pages(
+            lambda page, limit: get_clients_by_filter(
+                self.__transport, self.__pirpos_domain, str(document), headers, self.__auth,
+                page, limit, operation="search",
+            ),
+            self.__search_page_size,
+            prefetch=0,
+            max_pages=self.__search_max_pages,
+        )
+        read = 0
+        matches: List[Tuple[Client, str]] = []
+        try:
+            for clients, ids in pages:
+                read += 1
+                self.__save_mirrored(clients, ids)
+                matches = [
+                    (client, pirpos_id)
+                    for client, pirpos_id in zip(clients, ids)
+                    if client.document == document
+                ]
+                if matches:
+                    return matches
+        finally:
+            if self.__search_pages and read:
+                self.__search_pages.observe(read, found=str(bool(matches)).lower())
+        return matches
+
+    def __get_clients_page(
+        self, page: int, limit: int, operation: str = "sync"
+    ) -> Tuple[List[Client], List[str]]:
+        """Download a page of the complete client list."""
+        return get_clients_by_filter(
+            self.__transport, self.__pirpos_domain, "", self.__get_headers(), self.__auth, page, limit,
+            operation=operation,
+        )
+
+    def iter_clients(self, page_size: int = 100, prefetch: int = 2) -> Iterator[Client]:
+        """Walk every PirPos client, downloading the next pages while the current one is used.
+
+        Args:
+            page_size (int): Clients requested per page.
+            prefetch (int): Pages downloaded ahead of the consumer.
+
+        Raises:
+            FetchDataError: Raised when a page can't be downloaded.
+
+        Yields:
+            Iterator[Client]: Clients in the PirPos order.
+        """
+        pages = iter_pages(
+            lambda page, limit: self.__get_clients_page(page, limit, "export"), page_size, prefetch
+        )
+        for clients, _ in pages:
+            yield from clients
+
+    def __get_mirrored(self, document: int) -> Optional[Tuple[Client, str, float]]:
+        """Get a client, its PirPos id and when it was read from PirPos from the mirror."""
+        if not self.__mirror or not self.__mirror_sync:
+            return None
+        self.__mirror_sync.ensure_running()
+        try:
+            return self.__mirror.get(document)
+        except sqlite3.Error as error:
+            self.__logger.warning("Can't read the clients mirror: %s", error)
+            return None
+
+    def __save_mirrored(self, clients: List[Client], ids: List[str]) -> None:
+        """Keep clients read from or written to PirPos in the mirror."""
+        if not self.__mirror or not clients:
+            return
+        try:
+            self.__mirror.save(zip(clients, ids))
+        except sqlite3.Error as error:
+            self.__logger.warning("Can't write the clients mirror: %s", error)
+
     def get_client(self, document: int) -> Optional[Client]:
         """Get client by document.
 
@@ -94,25 +244,34 @@ class PirposConnector(SystemProvider):
         Returns:
             Optional[Client]: Client found.
         """
-        headers = self.__get_headers()
-        clients, _ = get_clients_by_filter(self.__pirpos_domain, str(document), headers)
+        mirrored = self.__get_mirrored(document)
+        if mirrored:
+            client, pirpos_id, fetched_at = mirrored
+            return PirposClient(**dict(client), pirpos_id=pirpos_id, fetched_at=fetched_at)
+        return self.get_fresh_client(document)
 
-        if len(clients) == 0:
-            return None
+    def get_fresh_client(self, document: int) -> Optional[Client]:
+        """Get client by document searching PirPos, without reading the mirror.
+
+        Args:
+            document (int): Document to search.
 
-        if len(clients) == 1:
-            return clients[0]
+        Raises:
+            FetchDataError: Raised when can't download PirPos clients.
 
-        if len(clients) > 1:
-            for client in clients:
-                if client.document == document:
-                    return client
+        Returns:
+            Optional[Client]: Client found.
+        """
+        matches = self.__search_client(document)
+        if len(matches) == 0:
+            return None
 
-        self.__logger.warning(
-            "More than one client found for id %s. Using the first element",
-            document,
-        )
-        return clients[0]
+        if len(matches) > 1:
+            self.__logger.warning(
+                "More than one client found for id %s. Using the first element",
+                document,
+            )
+        return matches[0][0]
 
     def upload_client(self, client: Client) -> None:
         """Upload client data to the POS system.
@@ -122,15 +281,15 @@ class PirposConnector(SystemProvider):
         """
         current_client = self.get_client(client.document)
         if current_client and current_client.document == client.document:
-            raise SendDataError("Client already exists in PirPos")
+            raise AlreadyExistsError("Client already exists in PirPos")
 
         headers = self.__get_headers()
         url = f"{self.__pirpos_domain}/clients"
         payload: str = define_payload_from_client(client)
 
         try:
-            response = requests.request(
-                "POST", url, headers=headers, data=payload, timeout=20
+            response = self.__transport.request(
+                "POST", url, "create", headers=headers, data=payload, auth=self.__auth
             )
         except Exception as error:
             raise SendDataError(
@@ -139,52 +298,76 @@ class PirposConnector(SystemProvider):
         if not response.ok:
             raise SendDataError(f"Can't create a customer in PirPos\n {response.text}")
 
-    def update_client(self, client: Client) -> None:
-        """Update client to POS system.
+    def __find_pirpos_id(self, document: int) -> str:
+        """Search the PirPos id of the only client with a document.
 
         Args:
-            client (Client): Client to update.
+            document (int): Client document.
+
+        Raises:
+            SendDataError: Raised when there is not exactly one client.
+
+        Returns:
+            str: PirPos id.
         """
-        headers = self.__get_headers()
-        clients, ids = get_clients_by_filter(self.__pirpos_domain, str(client.document), headers)
+        clients_with_same_document = self.__search_client(document)
 
-        if len(clients) == 0:
+        if len(clients_with_same_document) == 0:
             raise SendDataError(
-                f"Can't update a client. No client found for document: {client.document}"
+                f"Can't update a client. No client found for document: {document}"
             )
 
-        clients_with_same_document = [
-            (found_client, id)
-            for found_client, id in zip(clients, ids)
-            if found_client.document == client.document
-        ]
-
         if len(clients_with_same_document) > 1:
             raise SendDataError(
-                f"Can't update a client. More than one client found for document: {client.document}"
+                f"Can't update a client. More than one client found for document: {document}"
             )
+        return clients_with_same_document[0][1]
+
+    def update_client(self, client: Client, current: Optional[Client] = None) -> None:
+        """Update client to POS system.
+
+        Args:
+            client (Client): Client to update.
+            current (Optional[Client]): Client returned by `get_client`. Its
+                PirPos id is reused instead of searching the client again.
+        """
+        if (
+            isinstance(current, PirposClient)
+            and current.document == client.document
+            and current.pirpos_id
+        ):
+            pirpos_id = current.pirpos_id
+        else:
+            pirpos_id = self.__find_pirpos_id(client.document)
+
+        headers = self.__get_headers()
         url = f"{self.__pirpos_domain}/clients"
-        payload: str = define_payload_from_client(
-            client, clients_with_same_document[0][1]
-        )
+        payload: str = define_payload_from_client(client, pirpos_id)
 
         try:
-            response = requests.request(
-                "POST", url, headers=headers, data=payload, timeout=20
+            response = self.__transport.request(
+                "POST", url, "update", headers=headers, data=payload, auth=self.__auth
             )
         except Exception as error:
             raise SendDataError(f"Can't update customer in PirPos\n {error}") from error
         if not response.ok:
             raise SendDataError(f"Can't update customer in PirPos\n {response.text}")
+        self.__save_mirrored([client], [pirpos_id])
 
     def get_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
         """Get a specific invoice."""
+        return self.__invoices.do(
+            (prefix, number), lambda: self.__fetch_invoice(prefix, number)
+        )
+
+    def __fetch_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
+        """Download an invoice from PirPos."""
         headers = self.__get_headers()
         url = f"{self.__pirpos_domain}/invoices"
         params = {"number": f"{prefix}{number}"}
         try:
-            response = requests.request(
-                "GET", url, headers=headers, params=params, timeout=20
+            response = self.__transport.request(
+                "GET", url, "invoice", headers=headers, params=params, auth=self.__auth
             )
         except Exception as error:
             raise FetchDataError(
@@ -192,7 +375,49 @@ class PirposConnector(SystemProvider):
             ) from error
         if not response.ok:
             raise FetchDataError(f"Non 200 response getting an invoice from PirPos\n {response.text}")
-        return get_invoice_from_json(response.json(), prefix, number)
+        return get_invoice_from_json(response.content, prefix, number)
+
+    def check_ready(self) -> bool:
+        """Check whether PirPos answers with the worker credentials.
+
+        The probe logs in when needed and warms up the connection pool. Its
+        result is shared by concurrent checks and reused for a few seconds.
+
+        Returns:
+            bool: Whether the connector is ready.
+        """
+        found, ready = self.__readiness.get("ready")
+        if found:
+            return bool(ready)
+        ready = self.__probes.do("ready", self.__probe)
+        self.__readiness.set("ready", ready)
+        return ready
+
+    def __probe(self) -> bool:
+        """Request the smallest page of clients."""
+        try:
+            get_clients_by_filter(
+                self.__transport, self.__pirpos_domain, "", self.__get_headers(), self.__auth, 0, 1,
+                operation="ready",
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            self.__logger.warning("PirPos readiness probe failed: %s", error)
+            return False
+        if self.__mirror_sync:
+            self.__mirror_sync.ensure_running()
+        return True
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get connection pool and request coalescing statistics of the current worker.
+
+        Returns:
+            Dict[str, Dict[str, int]]: Statistics grouped by component.
+        """
+        return {
+            "transport": self.__transport.stats(),
+            "client_searches": self.__searches.stats(),
+            "invoice_lookups": self.__invoices.stats(),
+        }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+"""Protections around upstream calls."""
+
+from typing import Dict, Iterator, Optional
+from contextlib import contextmanager
+import fcntl
+import os
+import struct
+import threading
+import time
+from app.v1.utils.errors import RateLimitedError, UpstreamUnavailableError
+
+
+class CircuitBreaker:
+    """Stop calling an upstream that keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast. Once `reset_timeout` seconds pass, up to `half_open_calls`
+    probes are let through: a success closes the circuit, a failure opens it
+    again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30, half_open_calls: int = 1):
+        """Initialize the breaker.
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the circuit.
+            reset_timeout (float): Seconds the circuit stays open before probing.
+            half_open_calls (int): Probes allowed at the same time while half open.
+        """
+        self.__failure_threshold = failure_threshold
+        self.__reset_timeout = reset_timeout
+        self.__half_open_calls = half_open_calls
+        self.__lock = threading.Lock()
+        self.__state = self.CLOSED
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__probes = 0
+        self.__rejected = 0
+
+    @property
+    def state(self) -> str:
+        """Current state of the circuit."""
+        with self.__lock:
+            return self.__state
+
+    def before_call(self) -> None:
+        """Check a call can be sent.
+
+        Raises:
+            UpstreamUnavailableError: Raised when the circuit is open.
+        """
+        with self.__lock:
+            if self.__state == self.OPEN:
+                self.__reject_while_open()
+                self.__state = self.HALF_OPEN
+                self.__probes = 0
+            if self.__state == self.HALF_OPEN:
+                if self.__probes >= self.__half_open_calls:
+                    self.__rejected += 1
+                    raise UpstreamUnavailableError("PirPos circuit is half open, waiting for a probe")
+                self.__probes += 1
+
+    def reject_if_open(self) -> None:
+        """Fail fast while the circuit is open, without taking a probe.
+
+        Lets callers skip waits, like for a rate limit token, before a call
+        that would be rejected anyway.
+
+        Raises:
+            UpstreamUnavailableError: Raised when the circuit is open.
+        """
+        with self.__lock:
+            if self.__state == self.OPEN:
+                self.__reject_while_open()
+
+    def __reject_while_open(self) -> None:
+        """Reject a call until the open circuit may be probed.
+
+        Must be called holding the lock.
+        """
+        remaining = self.__reset_timeout - (time.monotonic() - self.__opened_at)
+        if remaining > 0:
+            self.__rejected += 1
+            raise UpstreamUnavailableError(
+                f"PirPos circuit is open after {self.__failures} failures, "
+                f"retrying in {remaining:.0f}s",
+                retry_after=remaining,
+            )
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        with self.__lock:
+            self.__state = self.CLOSED
+            self.__failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit when needed."""
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == self.HALF_OPEN or self.__failures >= self.__failure_threshold:
+                self.__state = self.OPEN
+                self.__opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        """Get breaker counters.
+
+        Returns:
+            Dict[str, int]: Whether the circuit is open, consecutive failures and rejected calls.
+        """
+        with self.__lock:
+            return {
+                "circuit_open": int(self.__state != self.CLOSED),
+                "consecutive_failures": self.__failures,
+                "circuit_rejections": self.__rejected,
+            }
+
+
+class Bulkhead:
+    """Cap the upstream calls running at the same time in a worker."""
+
+    def __init__(self, max_concurrent: int = 4, max_wait: float = 1):
+        """Initialize the bulkhead.
+
+        Args:
+            max_concurrent (int): Max calls running at the same time.
+            max_wait (float): Seconds a call waits for a free slot before failing.
+        """
+        self.__max_wait = max_wait
+        self.__slots = threading.BoundedSemaphore(max_concurrent)
+        self.__lock = threading.Lock()
+        self.__in_flight = 0
+        self.__rejected = 0
+
+    @contextmanager
+    def slot(self, max_wait: Optional[float] = None) -> Iterator[None]:
+        """Hold a slot while the call runs.
+
+        Args:
+            max_wait (Optional[float]): Shorter wait for this call, like the time
+                left before its deadline.
+
+        Raises:
+            UpstreamUnavailableError: Raised when no slot gets free in time.
+        """
+        timeout = self.__max_wait if max_wait is None else max(min(self.__max_wait, max_wait), 0)
+        if not self.__slots.acquire(timeout=timeout):
+            with self.__lock:
+                self.__rejected += 1
+            raise UpstreamUnavailableError("Too many PirPos calls in flight")
+        with self.__lock:
+            self.__in_flight += 1
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.__in_flight -= 1
+            self.__slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Get bulkhead counters.
+
+        Returns:
+            Dict[str, int]: Calls in flight and rejected calls.
+        """
+        with self.__lock:
+            return {"in_flight": self.__in_flight, "bulkhead_rejections": self.__rejected}
+
+
+class TokenBucket:
+    """Rate limit shared by every worker through a locked file.
+
+    The bucket holds up to `burst` tokens and refills `rate` tokens per second.
+    A caller reserves the next token even when it has to wait for it, so
+    waiting callers are served in order instead of racing for each new token.
+    """
+
+    STATE = struct.Struct("dd")
+
+    def __init__(self, path: str, rate: float, burst: float = 1):
+        """Initialize the bucket.
+
+        Args:
+            path (str): File holding the bucket state, shared by the workers.
+            rate (float): Tokens added per second.
+            burst (float): Max tokens kept, calls allowed at once after a quiet period.
+        """
+        self.__path = path
+        self.__rate = rate
+        self.__burst = max(burst, 1)
+        self.__lock = threading.Lock()
+        self.__fd: Optional[int] = None
+        self.__pid: Optional[int] = None
+        self.__waited = 0
+        self.__rejected = 0
+
+    def __get_fd(self) -> int:
+        """Get the file of the current process.
+
+        Locks belong to the open file, so a forked worker must open its own.
+        """
+        if self.__fd is None or self.__pid != os.getpid():
+            directory = os.path.dirname(self.__path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.__fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.__pid = os.getpid()
+        return self.__fd
+
+    def __reserve(self, max_wait: Optional[float]) -> float:
+        """Take a token, or reserve the next one when it arrives within `max_wait`.
+
+        Returns:
+            float: Seconds to wait for the reserved token, or -1 plus the seconds
+                until the next token when nothing was reserved.
+        """
+        with self.__lock:
+            fd = self.__get_fd()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(fd, self.STATE.size, 0)
+                tokens, updated_at = self.STATE.unpack(data) if len(data) == self.STATE.size else (self.__burst, now)
+                if updated_at > now:
+                    updated_at = now
+                tokens = min(self.__burst, tokens + (now - updated_at) * self.__rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / self.__rate
+                if max_wait is not None and wait > max_wait:
+                    return -1 - wait
+                os.pwrite(fd, self.STATE.pack(tokens - 1, now), 0)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def acquire(self, max_wait: Optional[float] = None) -> None:
+        """Wait for a token.
+
+        Args:
+            max_wait (Optional[float]): Max seconds to wait, None waits as needed.
+
+        Raises:
+            RateLimitedError: Raised when no token is available in time.
+                Nothing is reserved.
+        """
+        wait = self.__reserve(max_wait)
+        if wait < 0:
+            with self.__lock:
+                self.__rejected += 1
+            retry_after = -1 - wait
+            raise RateLimitedError(
+                f"PirPos rate limit reached, retry in {retry_after:.1f}s", retry_after=retry_after
+            )
+        if wait > 0:
+            with self.__lock:
+                self.__waited += 1
+            time.sleep(wait)
+
+    def stats(self) -> Dict[str, int]:
+        """Get rate limit counters of the current process.
+
+        Returns:
+            Dict[str, int]: Calls that waited for a token and calls rejected.
+        """
+        with self.__lock:
+            return {"rate_limit_waits": self.__waited, "rate_limit_rejections": self.__rejected}
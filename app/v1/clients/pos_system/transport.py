@@ -0,0 +1,250 @@
+"""HTTP transport shared by the POS connectors."""
+
+from typing import Any, Dict, Optional, Tuple
+from contextlib import nullcontext
+from logging import Logger
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from app.v1.clients.pos_system.resilience import CircuitBreaker, Bulkhead, TokenBucket
+from app.v1.utils.deadline import get_remaining, limit_timeout
+from app.v1.utils.metrics import MetricsRegistry
+from app.v1.utils.log import log_upstream_call
+
+
+SEND_ARGUMENTS = ("timeout", "allow_redirects", "proxies", "stream", "verify", "cert")
+
+
+class PooledTransport:
+    """Keep-alive HTTP transport backed by a per-worker connection pool.
+
+    uWSGI forks the workers after the app is loaded, so the session is
+    rebuilt the first time it is used inside a new process. Sockets opened
+    by the parent are never shared with the children.
+
+    An optional circuit breaker and bulkhead protect the worker when the
+    upstream is slow or failing. They only cover sending the request: the
+    credentials are added before, so a login never waits for the slot held
+    by the request that needs it. When the auth has a `handle_401` method
+    and accepts to renew a rejected token, the request is prepared and sent
+    again outside the slot of the rejected one, and both calls count in the
+    breaker.
+
+    Calls made while a request deadline is set only get the time left before
+    it, and are not sent at all once it has passed. Rate limited operations
+    wait for a token before taking a bulkhead slot, for as long as the
+    deadline allows.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        pool_connections: int = 4,
+        pool_maxsize: int = 8,
+        pool_block: bool = False,
+        timeout: float = 20,
+        stats_log_every: int = 500,
+        breaker: Optional[CircuitBreaker] = None,
+        bulkhead: Optional[Bulkhead] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        rate_limits: Optional[Dict[str, TokenBucket]] = None,
+    ):
+        """Initialize the transport.
+
+        Args:
+            logger (Logger): Logger to use.
+            pool_connections (int): Number of hosts kept in the pool.
+            pool_maxsize (int): Max keep-alive connections per host.
+            pool_block (bool): Wait for a free connection instead of opening
+                a throwaway one when a host reaches `pool_maxsize`.
+            timeout (float): Default timeout for each request in seconds. The
+                deadline of the current request shortens it.
+            stats_log_every (int): Log pool statistics every N requests.
+            breaker (Optional[CircuitBreaker]): Fails fast while the upstream keeps failing.
+            bulkhead (Optional[Bulkhead]): Caps the requests in flight.
+            metrics (Optional[MetricsRegistry]): Records latency and errors by operation.
+            rate_limits (Optional[Dict[str, TokenBucket]]): Rate limit of each
+                operation. Operations can share a bucket.
+        """
+        self.__logger = logger
+        self.__pool_connections = pool_connections
+        self.__pool_maxsize = pool_maxsize
+        self.__pool_block = pool_block
+        self.__timeout = timeout
+        self.__stats_log_every = stats_log_every
+        self.__breaker = breaker
+        self.__bulkhead = bulkhead
+        self.__rate_limits = rate_limits if rate_limits else {}
+        self.__lock = threading.Lock()
+        self.__session: Optional[requests.Session] = None
+        self.__adapter: Optional[HTTPAdapter] = None
+        self.__pid: Optional[int] = None
+        self.__sent = 0
+        self.__latency = metrics.histogram(
+            "pirpos_request_duration_seconds", "PirPos call latency by operation."
+        ) if metrics else None
+        self.__errors = metrics.counter(
+            "pirpos_request_errors_total", "PirPos calls that failed or were not sent, by operation."
+        ) if metrics else None
+
+    def __build_session(self) -> None:
+        """Create the session and mount the pooled adapter."""
+        adapter = HTTPAdapter(
+            pool_connections=self.__pool_connections,
+            pool_maxsize=self.__pool_maxsize,
+            pool_block=self.__pool_block,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.__adapter = adapter
+        self.__session = session
+        self.__pid = os.getpid()
+        self.__sent = 0
+
+    def __get_session(self) -> requests.Session:
+        """Get the session owned by the current process."""
+        if self.__session is None or self.__pid != os.getpid():
+            with self.__lock:
+                if self.__session is None or self.__pid != os.getpid():
+                    self.__build_session()
+        assert self.__session is not None
+        return self.__session
+
+    def request(self, method: str, url: str, operation: str = "other", **kwargs: Any) -> requests.Response:
+        """Send a request reusing the pooled connections.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Target url.
+            operation (str): Name of the call in the metrics, like "search".
+            **kwargs: Extra arguments accepted by `requests.Session.request`.
+
+        Raises:
+            UpstreamUnavailableError: Raised when the circuit is open, the
+                bulkhead is full or the rate limit is not reached in time.
+                The request is not sent.
+            DeadlineExceededError: Raised when the deadline of the current
+                request has passed. The request is not sent.
+
+        Returns:
+            requests.Response: Upstream response.
+        """
+        response = self.__request(method, url, operation, **kwargs)
+        handle_401 = getattr(kwargs.get("auth"), "handle_401", None)
+        if handle_401 and handle_401(response):
+            response.close()
+            retried = self.__request(method, url, operation, **kwargs)
+            retried.history.insert(0, response)
+            return retried
+        return response
+
+    def __request(self, method: str, url: str, operation: str, **kwargs: Any) -> requests.Response:
+        """Send a request recording its outcome in the metrics and the log."""
+        started_at = time.monotonic()
+        try:
+            response, elapsed = self.__send(method, url, operation, **kwargs)
+        except Exception as error:
+            if self.__errors:
+                self.__errors.inc(operation=operation, error=type(error).__name__)
+            log_upstream_call(operation, time.monotonic() - started_at, type(error).__name__)
+            raise
+        error = None if response.ok else f"http_{response.status_code}"
+        if self.__errors and error:
+            self.__errors.inc(operation=operation, error=error)
+        log_upstream_call(operation, elapsed, error)
+        if self.__latency:
+            self.__latency.observe(elapsed, operation=operation)
+        return response
+
+    def __send(self, method: str, url: str, operation: str, **kwargs: Any) -> Tuple[requests.Response, float]:
+        """Prepare and send a request inside the protections.
+
+        Returns:
+            Tuple[requests.Response, float]: Response and seconds spent sending
+                it and reading it, without the login or the waits.
+        """
+        timeout = kwargs.pop("timeout", self.__timeout)
+        limit_timeout(timeout)
+        send_kwargs = {key: kwargs.pop(key) for key in SEND_ARGUMENTS if key in kwargs}
+        session = self.__get_session()
+        prepared = session.prepare_request(requests.Request(method, url, **kwargs))
+        send_kwargs.update(
+            session.merge_environment_settings(
+                prepared.url,
+                send_kwargs.pop("proxies", {}),
+                send_kwargs.pop("stream", None),
+                send_kwargs.pop("verify", None),
+                send_kwargs.pop("cert", None),
+            )
+        )
+
+        bucket = self.__rate_limits.get(operation)
+        if bucket:
+            # a call rejected by the open circuit must not spend the shared budget
+            if self.__breaker:
+                self.__breaker.reject_if_open()
+            bucket.acquire(get_remaining())
+
+        with self.__bulkhead.slot(get_remaining()) if self.__bulkhead else nullcontext():
+            send_kwargs["timeout"] = limit_timeout(timeout)
+            if self.__breaker:
+                self.__breaker.before_call()
+            started_at = time.monotonic()
+            try:
+                response = session.send(prepared, **send_kwargs)
+            except Exception:
+                if self.__breaker:
+                    self.__breaker.record_failure()
+                raise
+            elapsed = time.monotonic() - started_at
+            if self.__breaker:
+                if response.status_code >= 500:
+                    self.__breaker.record_failure()
+                else:
+                    self.__breaker.record_success()
+
+        with self.__lock:
+            self.__sent += 1
+            log_stats = self.__sent % self.__stats_log_every == 0
+        if log_stats:
+            self.__logger.info("Transport pool stats %s", self.stats())
+        return response, elapsed
+
+    def stats(self) -> Dict[str, int]:
+        """Get connection pool statistics for the current process.
+
+        Returns:
+            Dict[str, int]: Requests sent, connections opened and reused,
+                plus the breaker and bulkhead counters when they are used.
+        """
+        stats: Dict[str, int] = {}
+        if self.__breaker:
+            stats.update(self.__breaker.stats())
+        if self.__bulkhead:
+            stats.update(self.__bulkhead.stats())
+        for bucket in {id(bucket): bucket for bucket in self.__rate_limits.values()}.values():
+            for name, value in bucket.stats().items():
+                stats[name] = stats.get(name, 0) + value
+        if self.__adapter is None or self.__pid != os.getpid():
+            stats.update({"hosts": 0, "requests": 0, "connections_opened": 0, "connections_reused": 0})
+            return stats
+
+        pools = self.__adapter.poolmanager.pools
+        sent = 0
+        opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            sent += pool.num_requests
+            opened += pool.num_connections
+        stats.update({
+            "hosts": len(pools),
+            "requests": sent,
+            "connections_opened": opened,
+            "connections_reused": max(sent - opened, 0),
+        })
+        return stats
@@ -1,22 +1,35 @@
 """POS systems utils."""
 
-from typing import List, Optional, Dict, Any, Tuple
+from typing import Callable, Deque, Iterator, List, Optional, Dict, Any, Tuple
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
 from enum import Enum
-import requests
-from pydantic import BaseModel, model_validator, Field
+import contextvars
+from pydantic import (
+    AliasPath,
+    BaseModel,
+    ConfigDict,
+    Field,
+    TypeAdapter,
+    ValidationError,
+    field_validator,
+    model_validator,
+)
+from requests.auth import AuthBase
 from app.v1.models import (
     Client,
     Responsibilities,
     DocumentType,
     CityDetail,
     Invoice,
-    Business,
     Employee,
     Payment,
     InvoiceProduct,
     Product,
     TaxInfo
 )
+from app.v1.clients.pos_system.transport import PooledTransport
 from app.v1.utils.errors import FetchDataError
 
 
@@ -123,50 +136,57 @@ class ClientResponseValidator(BaseModel):
         return values
 
 
-class ClientsResponseValidator(BaseModel):
-    """Validate clients response from PirPos."""
+class PirposClient(Client):
+    """Client found in PirPos.
 
-    data: List[ClientResponseValidator]
+    Validates the PirPos client JSON straight into a `Client` and keeps the
+    PirPos `_id`, so writes don't need to search the client again. The id is
+    excluded from the serialized client, like `fetched_at`, the Unix time a
+    client answered from the mirror was read from PirPos.
+    """
 
+    model_config = ConfigDict(populate_by_name=True)
 
-def define_client_from_pirpos_response(
-    raw_clients: List[ClientResponseValidator],
-) -> List[Client]:
-    """Create client object."""
-    clients: List[Client] = []
-    for raw_client in raw_clients:
-        responsibilites = (
-            raw_client.responsibilities
-            if raw_client.responsibilities
-            else Responsibilities.R_99_PN
-        )
-        email = raw_client.email if raw_client.email else ""
-        if raw_client.cityDetail:
-            raw_city_detail = raw_client.cityDetail
-            city_detail = CityDetail(
-                city_name=raw_city_detail.cityName,
-                city_state=raw_city_detail.stateName,
-                city_code=raw_city_detail.cityCode,
-                country_code=raw_city_detail.countryCode,
-                state_code=raw_city_detail.stateCode,
-            )
-        else:
-            city_detail = None
-
-        client = Client(
-            name=raw_client.name,
-            last_name=raw_client.lastName,
-            email=email,
-            document=raw_client.document,
-            check_digit=raw_client.checkDigit,
-            document_type=raw_client.idDocumentType,
-            phone=raw_client.phone,
-            address=raw_client.address,
-            responsibilities=responsibilites,
-            city_detail=city_detail,
-        )
-        clients.append(client)
-    return clients
+    pirpos_id: str = Field(exclude=True, validation_alias="_id", min_length=1)
+    fetched_at: Optional[float] = Field(default=None, exclude=True)
+    last_name: Optional[str] = Field(default=None, validation_alias="lastName")
+    email: Optional[str] = ""
+    check_digit: Optional[int] = Field(default=None, validation_alias="checkDigit")
+    document_type: DocumentType = Field(validation_alias="idDocumentType")
+    responsibilities: Responsibilities = Responsibilities.R_99_PN
+    city_detail: Optional[CityDetail] = Field(default=None, validation_alias="cityDetail")
+
+    @field_validator("email", mode="before")
+    @classmethod
+    def convert_email(cls, value: Optional[str]) -> str:
+        """Use an empty email when PirPos has none."""
+        return value if value else ""
+
+    @field_validator("responsibilities", mode="before")
+    @classmethod
+    def convert_responsibilities(cls, value: Any) -> Any:
+        """Use the default responsibility when PirPos has none."""
+        return value if value else Responsibilities.R_99_PN
+
+    @field_validator("city_detail", mode="before")
+    @classmethod
+    def convert_city_detail(cls, value: Any) -> Any:
+        """Rename the PirPos city fields."""
+        if isinstance(value, dict) and "cityName" in value:
+            return {
+                "city_name": value.get("cityName"),
+                "city_state": value.get("stateName"),
+                "city_code": value.get("cityCode"),
+                "country_code": value.get("countryCode"),
+                "state_code": value.get("stateCode"),
+            }
+        return value
+
+
+class ClientsResponseValidator(BaseModel):
+    """Validate clients response from PirPos."""
+
+    data: List[PirposClient]
 
 
 def define_payload_from_client(client: Client, pirpos_id: Optional[str] = None) -> str:
@@ -205,18 +225,31 @@ def define_payload_from_client(client: Client, pirpos_id: Optional[str] = None)
         phone=client.phone,
         address=client.address,
     )
-    json_data = payload_object.json(exclude_none=True, by_alias=True)
+    json_data = payload_object.model_dump_json(exclude_none=True, by_alias=True)
     return json_data
 
 
 def get_clients_by_filter(
-    domain: str, search_filter: str, headers: Dict[str, Any]
+    transport: PooledTransport,
+    domain: str,
+    search_filter: str,
+    headers: Dict[str, Any],
+    auth: AuthBase,
+    page: int = 0,
+    limit: int = 10,
+    operation: str = "search",
 ) -> Tuple[List[Client], List[str]]:
     """Get pirpos clients using some filter.
 
     Args:
-        filter(str): Filter to search.
-        headers(Dict[str, Any]): Headers with credentials.
+        transport(PooledTransport): Transport used to reach PirPos.
+        domain(str): PirPos domain.
+        filter(str): Filter to search. An empty filter lists every client.
+        headers(Dict[str, Any]): Request headers.
+        auth(AuthBase): Adds the PirPos credentials to the request.
+        page(int): Page to download, starting at 0.
+        limit(int): Clients per page.
+        operation(str): Name of the call in the metrics.
 
     Raises:
         FetchDataError: Raised when can't download PirPos clients.
@@ -226,115 +259,200 @@ def get_clients_by_filter(
     """
     url = (
         f"{domain}/clients?pagination=true"
-        f"&limit=10&page=0&clientData={search_filter}&"
+        f"&limit={limit}&page={page}&clientData={search_filter}&"
     )
 
     try:
-        response = requests.request("GET", url, headers=headers, timeout=20)
+        response = transport.request("GET", url, operation, headers=headers, auth=auth)
     except Exception as error:
         raise FetchDataError(f"Can't download PirPos clients\n {error}") from error
     if not response.ok:
         raise FetchDataError(f"Can't download PirPos clients\n {response.text}")
 
-    data = response.json()
-    raw_clients: List[ClientResponseValidator] = ClientsResponseValidator(**data).data
-
-    list_ids: List[str] = []
-    for raw_client in raw_clients:
-        if not raw_client.id:
-            raise FetchDataError(
-                f"Not found _id for client. document {raw_client.document}"
-            )
-        list_ids.append(raw_client.id)
+    try:
+        found = ClientsResponseValidator.model_validate_json(response.content).data
+    except ValidationError as error:
+        raise FetchDataError(f"Invalid PirPos clients response\n {error}") from error
 
-    clients: List[Client] = define_client_from_pirpos_response(raw_clients)
+    clients: List[Client] = list(found)
+    list_ids: List[str] = [client.pirpos_id for client in found]
     return clients, list_ids
 
 
-def define_invoice_products(raw_products: List[Dict[str, Any]]) -> List[InvoiceProduct]:
-    """Define invioce products from response."""
-    products: List[InvoiceProduct] = []
-    for raw_product in raw_products:
-        product_taxes: List[TaxInfo] = []
-        for raw_tax in raw_product.get("taxes", []):
-            product_taxes.append(TaxInfo(
-                tax_name=raw_tax["taxName"],
-                value=raw_tax["taxValue"]
-            ))
-
-        product = Product(
-            product_id=raw_product["code"],
-            name=raw_product["name"],
-            price=float(raw_product["totalBruto"]),
-            taxes=product_taxes
-        )
-        products.append(InvoiceProduct(
-            product=product,
-            price=product.price,
-            quantity=raw_product["quantity"],
-            tax=product_taxes
-        ))
-    return products
-
-
-def define_payments(raw_payments: List[Dict[str, Any]]) -> List[Payment]:
-    """Define payments from response."""
-    payments: List[Payment] = []
-    for raw_payment in raw_payments:
-        payments.append(
-            Payment(
-                payment_name=raw_payment["paymentMethod"],
-                payment_value=raw_payment["value"],
-            )
-        )
-    return payments
+ClientsPage = Tuple[List[Client], List[str]]
 
 
-def get_invoice_from_json(
-    raw_data: List[Dict[str, Any]], prefix: str, number: int
-) -> Optional[Invoice]:
-    """Transform the Json data to get an Invoice object."""
-    if not raw_data:
-        return None
-    first_invoice = raw_data[0]
-
-    business = Business(**first_invoice["business"])
-
-    employee_name = first_invoice["seller"]["name"]
-    seller = Employee(name=employee_name, employee_id=employee_name)
-
-    employee_name = first_invoice["cashier"]["name"]
-    cachier = Employee(name=employee_name, employee_id=employee_name)
-
-    raw_client_data = first_invoice["client"]
-    client = Client(
-        name=raw_client_data["name"],
-        last_name=raw_client_data.get("last_name"),
-        email=raw_client_data.get("email"),
-        document=raw_client_data["document"],
-        check_digit=raw_client_data.get("checkDigit"),
-        document_type=int(raw_client_data["idDocumentType"]),  # type: ignore
-        phone=raw_client_data.get("phone"),
-        address=raw_client_data.get("address"),
-        responsibilities=raw_client_data["responsibilities"],
-    )
+def iter_pages(
+    fetch_page: Callable[[int, int], ClientsPage],
+    page_size: int = 100,
+    prefetch: int = 2,
+    max_pages: int = 100_000,
+) -> Iterator[ClientsPage]:
+    """Walk the pages of the client list, downloading the next ones while the consumer works.
 
-    payments = define_payments(first_invoice["products"])
-    products = define_invoice_products(first_invoice["products"])
-
-    invoice = Invoice(
-        business=business,
-        cachier=cachier,
-        sell_point=first_invoice["table"]["name"],
-        seller=seller,
-        client=client,
-        created_on=first_invoice["createdOn"],
-        anulated_date=first_invoice.get("canceled", {}).get("date"),
-        invoice_prefix=prefix,
-        invoice_number=number,
-        payment_method=payments,
-        products=products,
-        total=first_invoice["total"],
-        status=first_invoice["status"],
-    )
+    At most `prefetch` pages are downloaded or waiting to be consumed, so
+    memory doesn't grow with the size of the list. PirPos may answer fewer
+    clients than `page_size`, so a short page is not taken as the end: the
+    walk ends at the first empty page or the first page shorter than an
+    earlier one. Pages requested past the end are dropped. With no prefetch,
+    each page is downloaded by the consumer thread when it asks for it, so a
+    consumer stopping early makes no extra calls.
+
+    Args:
+        fetch_page (Callable[[int, int], ClientsPage]): Downloads a page `(page, limit)`
+            of clients and their PirPos ids.
+        page_size (int): Clients requested per page.
+        prefetch (int): Pages downloaded ahead of the consumer.
+        max_pages (int): Safety limit of pages.
+
+    Raises:
+        FetchDataError: Raised when the list doesn't end within `max_pages`,
+            after yielding them.
+
+    Yields:
+        Iterator[ClientsPage]: Clients and PirPos ids of each page, in order.
+    """
+    largest = 0
+
+    def is_last(clients: List[Client]) -> bool:
+        nonlocal largest
+        if not clients or len(clients) < largest:
+            return True
+        largest = len(clients)
+        return False
+
+    if prefetch <= 0:
+        for page in range(max_pages):
+            clients, ids = fetch_page(page, page_size)
+            yield clients, ids
+            if is_last(clients):
+                return
+        raise FetchDataError(f"PirPos client list is longer than {max_pages} pages")
+
+    pages = iter(range(max_pages))
+    executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="clients-pages")
+    pending: Deque["Future[ClientsPage]"] = deque()
+
+    def submit_next() -> None:
+        page = next(pages, None)
+        if page is not None:
+            context = contextvars.copy_context()
+            pending.append(executor.submit(context.run, fetch_page, page, page_size))
+
+    try:
+        for _ in range(prefetch):
+            submit_next()
+        while pending:
+            clients, ids = pending.popleft().result()
+            if is_last(clients):
+                pending.clear()
+                yield clients, ids
+                return
+            submit_next()
+            yield clients, ids
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    raise FetchDataError(f"PirPos client list is longer than {max_pages} pages")
+
+
+class PirposTaxInfo(TaxInfo):
+    """Tax of an invoice product in PirPos."""
+
+    tax_name: str = Field(validation_alias="taxName")
+    value: float = Field(validation_alias="taxValue")
+
+
+class PirposProduct(Product):
+    """Product of a PirPos invoice line."""
+
+    product_id: str = Field(validation_alias="code")
+    price: float = Field(validation_alias="totalBruto")
+    taxes: List[PirposTaxInfo] = []
+
+
+class PirposInvoiceProduct(InvoiceProduct):
+    """Invoice line found in PirPos.
+
+    PirPos keeps the product data in the line itself, so the same object is
+    validated as the product.
+    """
+
+    product: PirposProduct
+    price: float = Field(validation_alias="totalBruto")
+    tax: Optional[List[PirposTaxInfo]] = Field(default=[], validation_alias="taxes")
+
+    @model_validator(mode="before")
+    @classmethod
+    def add_product(cls, values: Any) -> Any:
+        """Validate the line as its product too."""
+        if isinstance(values, dict) and "product" not in values:
+            return {**values, "product": values}
+        return values
+
+
+class PirposPayment(Payment):
+    """Payment of an invoice line found in PirPos."""
+
+    payment_name: str = Field(validation_alias="paymentMethod")
+    payment_value: float = Field(validation_alias="value")
+
+
+class PirposEmployee(Employee):
+    """Employee of a PirPos invoice, identified by its name."""
+
+    employee_id: str = Field(validation_alias="name")
+
+
+class PirposInvoiceClient(Client):
+    """Client of a PirPos invoice."""
+
+    last_name: Optional[str] = None
+    check_digit: Optional[int] = Field(default=None, validation_alias="checkDigit")
+    document_type: DocumentType = Field(validation_alias="idDocumentType")
+
+    @field_validator("document_type", mode="before")
+    @classmethod
+    def convert_document_type(cls, value: Any) -> Any:
+        """PirPos sends the document type of invoice clients as a string."""
+        return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+class PirposInvoice(Invoice):
+    """Invoice found in PirPos.
+
+    Validates the PirPos invoice JSON straight into an `Invoice`. The prefix
+    and the number are not part of the response, they are set by the caller.
+    """
+
+    cachier: PirposEmployee = Field(validation_alias="cashier")
+    sell_point: str = Field(validation_alias=AliasPath("table", "name"))
+    seller: PirposEmployee
+    client: PirposInvoiceClient
+    created_on: datetime = Field(validation_alias="createdOn")
+    anulated_date: Optional[datetime] = Field(default=None, validation_alias=AliasPath("canceled", "date"))
+    invoice_prefix: str = ""
+    invoice_number: int = 0
+    payment_method: List[PirposPayment] = Field(validation_alias="products")
+    products: List[PirposInvoiceProduct]
+
+
+# PirPos answers an invoice search with a list
+PIRPOS_INVOICES = TypeAdapter(List[PirposInvoice])
+
+
+def get_invoice_from_json(content: bytes, prefix: str, number: int) -> Optional[Invoice]:
+    """Validate a PirPos invoice search response into an Invoice.
+
+    Raises:
+        FetchDataError: Raised when the response is not a valid invoice list.
+    """
+    try:
+        found = PIRPOS_INVOICES.validate_json(content)
+    except ValidationError as error:
+        raise FetchDataError(f"Invalid PirPos invoice response\n {error}") from error
+    if not found:
+        return None
+    invoice = found[0]
+    invoice.invoice_prefix = prefix
+    invoice.invoice_number = number
     return invoice
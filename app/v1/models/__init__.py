@@ -10,6 +10,8 @@ from app.v1.models.invoice import (
     Payment,
     InvoiceStatus,
 )
+from app.v1.models.registration import Registration, RegistrationStatus
+from app.v1.models.import_job import ImportJob, ImportStatus, ImportFormat, ImportRowError
 
 
 __all__ = [
@@ -25,4 +27,10 @@ __all__ = [
     "InvoiceProduct",
     "Payment",
     "InvoiceStatus",
+    "Registration",
+    "RegistrationStatus",
+    "ImportJob",
+    "ImportStatus",
+    "ImportFormat",
+    "ImportRowError",
 ]
@@ -0,0 +1,44 @@
+"""Model for bulk client imports."""
+
+from typing import Optional
+from enum import Enum
+from pydantic import BaseModel
+
+
+class ImportStatus(str, Enum):
+    """Import status model."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class ImportFormat(str, Enum):
+    """Formats of an import file."""
+
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+class ImportJob(BaseModel):
+    """Progress of a bulk client import."""
+
+    job_id: str
+    status: ImportStatus
+    format: ImportFormat
+    rows: int = 0
+    created: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class ImportRowError(BaseModel):
+    """Row of an import file that was not created."""
+
+    row: int
+    document: Optional[int] = None
+    error: str
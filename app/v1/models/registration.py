@@ -0,0 +1,26 @@
+"""Model for queued registrations."""
+
+from typing import Optional
+from enum import Enum
+from pydantic import BaseModel
+
+
+class RegistrationStatus(str, Enum):
+    """Registration status model."""
+
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Registration(BaseModel):
+    """Progress of a client registration sent to the POS system in the background."""
+
+    ticket: str
+    document: int
+    status: RegistrationStatus
+    attempts: int
+    last_error: Optional[str] = None
+    created_at: float
+    updated_at: float
@@ -2,9 +2,62 @@
 
 import os
 import logging
+import tempfile
 from flask_injector import singleton, Binder
-from app.v1.clients import PirposConnector, DummyConnector, SystemProvider
-from app.v1.use_cases import UsersManager, InvoicesManager
+from app.v1.clients import (
+    PirposConnector,
+    DummyConnector,
+    SystemProvider,
+    PooledTransport,
+    AsyncConnector,
+)
+from app.v1.clients.pos_system.auth import DEFAULT_TOKEN_FILE
+from app.v1.clients.pos_system.resilience import CircuitBreaker, Bulkhead, TokenBucket
+from app.v1.api.users.utils import validate_fields
+from app.v1.use_cases import (
+    UsersManager,
+    InvoicesManager,
+    RegistrationWorker,
+    EmailVerifier,
+    ImportWorker,
+)
+from app.v1.use_cases.email_verifier import COMMON_DOMAINS
+from app.v1.models import Client
+from app.v1.storage import (
+    InvoiceStore,
+    ClientsMirror,
+    RegistrationJournal,
+    IdempotencyStore,
+    ImportJobStore,
+)
+from app.v1.utils.cache import TTLCache
+from app.v1.utils.concurrency import run_in_each_worker
+from app.v1.utils.deadline import DeadlinePolicy
+from app.v1.utils.metrics import MetricsRegistry
+from app.v1.utils.profiling import RequestProfiler
+from app.v1.utils.log import JsonFormatter, QueueLogHandler, RateLimitFilter
+
+
+# PirPos operations sharing each rate limit
+RATE_LIMITED_OPERATIONS = {
+    "search": ("search", "sync", "ready", "export"),
+    "write": ("create", "update"),
+    "invoice": ("invoice",),
+}
+
+# Endpoints that don't fit the default request budget. 0 disables the deadline.
+DEFAULT_ENDPOINT_DEADLINES = {
+    "ping.ready": 5.0,
+    "suscriber-ping.ready": 5.0,
+    "suscriber-users.check_batch": 60.0,
+    "suscriber-invoices.export_invoices": 0.0,
+    "suscriber-users.export_users": 0.0,
+}
+
+
+def profiling_enabled() -> bool:
+    """Check whether request profiling is enabled."""
+    return os.getenv("PROFILING_ENABLED", "false").lower() == "true"
 
 
 def dependencies(binder: Binder) -> None:
@@ -15,25 +68,209 @@ def dependencies(binder: Binder) -> None:
 
     logger = logging.getLogger(__name__)
     logger.setLevel(level)
+    for previous in list(logger.handlers):
+        logger.removeHandler(previous)
+        previous.close()
     handler = logging.StreamHandler()
     handler.setLevel(level)
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    queue_handler = QueueLogHandler([handler], maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    queue_handler.addFilter(
+        RateLimitFilter(
+            max_records=int(os.getenv("LOG_RATE_LIMIT_RECORDS", "1")),
+            interval=float(os.getenv("LOG_RATE_LIMIT_SECONDS", "60")),
+        )
+    )
+    logger.addHandler(queue_handler)
 
     binder.bind(logging.Logger, to=logger, scope=singleton)
 
+    # Metrics
+    metrics = MetricsRegistry(
+        os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "metrics")),
+        flush_interval=float(os.getenv("METRICS_FLUSH_SECONDS", "1")),
+    )
+    binder.bind(MetricsRegistry, to=metrics, scope=singleton)
+
+    # Profiling
+    if profiling_enabled():
+        profiler = RequestProfiler(
+            os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "profiles")),
+            sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+            slow_threshold=float(os.getenv("PROFILING_SLOW_SECONDS", "1")),
+            max_files=int(os.getenv("PROFILING_MAX_FILES", "200")),
+            header=os.getenv("PROFILING_HEADER", "X-Profile"),
+        )
+        binder.bind(RequestProfiler, to=profiler, scope=singleton)
+
+    # Request deadlines
+    endpoint_deadlines = dict(DEFAULT_ENDPOINT_DEADLINES)
+    endpoint_deadlines.update(
+        DeadlinePolicy.parse_endpoints(os.getenv("REQUEST_ENDPOINT_DEADLINES", ""))
+    )
+    deadline_policy = DeadlinePolicy(
+        default=float(os.getenv("REQUEST_DEADLINE_SECONDS", "25")),
+        endpoints=endpoint_deadlines,
+        header=os.getenv("REQUEST_DEADLINE_HEADER", "X-Request-Timeout"),
+    )
+    binder.bind(DeadlinePolicy, to=deadline_policy, scope=singleton)
+
     # Clients
+    # a single request never fans out to more calls than the bulkhead lets through
+    max_concurrent_calls = int(os.getenv("PIRPOS_MAX_CONCURRENT_CALLS", "4"))
     user_name = os.getenv("PIRPOS_USER_NAME", None)
     password = os.getenv("PIRPOS_PASSWORD", None)
     if not user_name or not password:
         logger.warning("Pirpos credentials not found")
         pos_client: SystemProvider = DummyConnector()
     else:
-        pos_client = PirposConnector(user_name, password, logger)
-    users_manager = UsersManager(pos_client)
-    invoices_manager = InvoicesManager(pos_client)
+        rate_limits = {}
+        rate_limit_dir = os.getenv(
+            "PIRPOS_RATE_LIMIT_DIR", os.path.join(tempfile.gettempdir(), "pirpos-rate-limits")
+        )
+        for name, operations in RATE_LIMITED_OPERATIONS.items():
+            rate = float(os.getenv(f"PIRPOS_RATE_LIMIT_{name.upper()}", "0"))
+            if rate > 0:
+                bucket = TokenBucket(
+                    os.path.join(rate_limit_dir, f"{name}.bucket"),
+                    rate=rate,
+                    burst=float(os.getenv(f"PIRPOS_RATE_BURST_{name.upper()}", str(rate))),
+                )
+                rate_limits.update({operation: bucket for operation in operations})
+        transport = PooledTransport(
+            logger,
+            pool_connections=int(os.getenv("PIRPOS_POOL_HOSTS", "4")),
+            pool_maxsize=int(os.getenv("PIRPOS_POOL_SIZE", "8")),
+            pool_block=os.getenv("PIRPOS_POOL_BLOCK", "false").lower() == "true",
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("PIRPOS_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("PIRPOS_BREAKER_RESET_SECONDS", "30")),
+            ),
+            bulkhead=Bulkhead(
+                max_concurrent=max_concurrent_calls,
+                max_wait=float(os.getenv("PIRPOS_BULKHEAD_WAIT_SECONDS", "1")),
+            ),
+            metrics=metrics,
+            rate_limits=rate_limits,
+        )
+        token_file = os.getenv("PIRPOS_TOKEN_FILE", DEFAULT_TOKEN_FILE)
+        mirror = None
+        if os.getenv("PIRPOS_MIRROR_ENABLED", "true").lower() == "true":
+            mirror = ClientsMirror(
+                os.getenv(
+                    "PIRPOS_MIRROR_PATH", os.path.join(tempfile.gettempdir(), "clients.sqlite3")
+                )
+            )
+        pirpos_client = PirposConnector(
+            user_name,
+            password,
+            logger,
+            transport,
+            token_file,
+            mirror=mirror,
+            mirror_interval=float(os.getenv("PIRPOS_MIRROR_INTERVAL", "3600")),
+            mirror_page_size=int(os.getenv("PIRPOS_MIRROR_PAGE_SIZE", "100")),
+            ready_ttl=float(os.getenv("PIRPOS_READY_CACHE_SECONDS", "10")),
+            search_page_size=int(os.getenv("PIRPOS_SEARCH_PAGE_SIZE", "50")),
+            search_max_pages=int(os.getenv("PIRPOS_SEARCH_MAX_PAGES", "20")),
+            metrics=metrics,
+        )
+        metrics.add_collector("pirpos", pirpos_client.stats)
+        pos_client = pirpos_client
+    async_client = AsyncConnector(
+        pos_client,
+        max_workers=min(
+            int(os.getenv("PIRPOS_ASYNC_WORKERS", str(max_concurrent_calls))), max_concurrent_calls
+        ),
+    )
+    users_cache: TTLCache[Client] = TTLCache(
+        maxsize=int(os.getenv("USERS_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("USERS_CACHE_TTL", "60")),
+        negative_ttl=float(os.getenv("USERS_CACHE_NEGATIVE_TTL", "5")),
+        grace=float(os.getenv("USERS_CACHE_STALE_SECONDS", "0")),
+    )
+    registrations = None
+    if os.getenv("USERS_ASYNC_REGISTRATION", "false").lower() == "true":
+        journal = RegistrationJournal(
+            os.getenv(
+                "REGISTRATIONS_DB_PATH",
+                os.path.join(tempfile.gettempdir(), "registrations.sqlite3"),
+            )
+        )
+        registrations = RegistrationWorker(
+            journal,
+            # through the users manager, so the cached lookups of the client are dropped
+            lambda client: users_manager.upload_user(client),
+            logger,
+            max_attempts=int(os.getenv("REGISTRATIONS_MAX_ATTEMPTS", "8")),
+            base_delay=float(os.getenv("REGISTRATIONS_RETRY_SECONDS", "5")),
+            max_delay=float(os.getenv("REGISTRATIONS_MAX_RETRY_SECONDS", "600")),
+        )
+    users_manager = UsersManager(
+        pos_client, users_cache, async_client, registrations, max_concurrency=max_concurrent_calls
+    )
+    if registrations:
+        # journaled registrations left by a previous worker are sent without waiting for a request
+        run_in_each_worker(registrations.ensure_running)
+    metrics.add_collector("users_cache", users_manager.cache_stats)
+    metrics.add_collector("users_refresh", users_manager.refresh_stats)
+    invoices_store = InvoiceStore(
+        os.getenv("INVOICES_DB_PATH", os.path.join(tempfile.gettempdir(), "invoices.sqlite3"))
+    )
+    invoices_manager = InvoicesManager(
+        pos_client,
+        invoices_store,
+        revalidate_after=float(os.getenv("INVOICES_REVALIDATE_SECONDS", "86400")),
+        async_connector=async_client,
+        grace=float(os.getenv("INVOICES_STALE_SECONDS", "0")),
+        max_concurrency=max_concurrent_calls,
+    )
+    metrics.add_collector("invoices_refresh", invoices_manager.refresh_stats)
+    extra_domains = os.getenv("EMAIL_ALLOWED_DOMAINS", "")
+    email_verifier = EmailVerifier(
+        mode=os.getenv("EMAIL_DELIVERABILITY_MODE", "async").lower(),
+        cache=TTLCache(
+            maxsize=int(os.getenv("EMAIL_DOMAINS_CACHE_SIZE", "4096")),
+            ttl=float(os.getenv("EMAIL_DOMAINS_CACHE_TTL", "86400")),
+            negative_ttl=float(os.getenv("EMAIL_DOMAINS_UNKNOWN_TTL", "300")),
+        ),
+        allowed_domains=COMMON_DOMAINS | {
+            domain.strip() for domain in extra_domains.split(",") if domain.strip()
+        },
+        timeout=float(os.getenv("EMAIL_DNS_TIMEOUT_SECONDS", "5")),
+        max_workers=int(os.getenv("EMAIL_DNS_WORKERS", "4")),
+        logger=logger,
+    )
+    metrics.add_collector("email_verifier", email_verifier.stats)
+    imports = ImportWorker(
+        ImportJobStore(
+            os.getenv("IMPORTS_DB_PATH", os.path.join(tempfile.gettempdir(), "imports.sqlite3")),
+            max_errors=int(os.getenv("IMPORTS_MAX_ERRORS", "1000")),
+        ),
+        users_manager,
+        email_verifier,
+        validate_fields,
+        os.getenv("IMPORTS_DIR", os.path.join(tempfile.gettempdir(), "imports")),
+        logger,
+        chunk_size=int(os.getenv("IMPORTS_CHUNK_SIZE", "100")),
+        max_concurrency=min(int(os.getenv("IMPORTS_CONCURRENCY", "4")), max_concurrent_calls),
+        max_bytes=int(float(os.getenv("IMPORTS_MAX_MEGABYTES", "100")) * 1024 * 1024),
+    )
+    # queued imports, and those left by a previous worker, don't wait for a request
+    run_in_each_worker(imports.ensure_running)
+    idempotency = IdempotencyStore(
+        os.getenv("IDEMPOTENCY_DB_PATH", os.path.join(tempfile.gettempdir(), "idempotency.sqlite3")),
+        ttl=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+    )
+    binder.bind(IdempotencyStore, to=idempotency, scope=singleton)
+    binder.bind(SystemProvider, to=pos_client, scope=singleton)
     binder.bind(UsersManager, to=users_manager, scope=singleton)
+    binder.bind(EmailVerifier, to=email_verifier, scope=singleton)
+    binder.bind(ImportWorker, to=imports, scope=singleton)
     binder.bind(InvoicesManager, to=invoices_manager, scope=singleton)
 
     logger.info("Dependencies manager finished")
@@ -0,0 +1,17 @@
+"""Local persistent stores."""
+from app.v1.storage.database import SQLiteDatabase
+from app.v1.storage.invoices import InvoiceStore
+from app.v1.storage.clients import ClientsMirror
+from app.v1.storage.registrations import RegistrationJournal
+from app.v1.storage.idempotency import IdempotencyStore
+from app.v1.storage.imports import ImportJobStore
+
+
+__all__ = [
+    "SQLiteDatabase",
+    "InvoiceStore",
+    "ClientsMirror",
+    "RegistrationJournal",
+    "IdempotencyStore",
+    "ImportJobStore",
+]
@@ -0,0 +1,117 @@
+"""Local mirror of the POS system clients."""
+
+from typing import Iterable, Optional, Tuple
+import time
+from app.v1.models import Client
+from app.v1.storage.database import SQLiteDatabase
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    document INTEGER PRIMARY KEY,
+    pos_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clients_sync (
+    name TEXT PRIMARY KEY,
+    finished_at REAL NOT NULL
+);
+"""
+
+
+class ClientsMirror:
+    """Clients of the POS system indexed by document, with their POS ids."""
+
+    def __init__(self, path: str):
+        """Initialize the mirror.
+
+        Args:
+            path (str): SQLite file shared by the workers.
+        """
+        self.__path = path
+        self.__database = SQLiteDatabase(path, SCHEMA)
+
+    @property
+    def path(self) -> str:
+        """SQLite file of the mirror."""
+        return self.__path
+
+    def get(self, document: int) -> Optional[Tuple[Client, str, float]]:
+        """Get a mirrored client.
+
+        Args:
+            document (int): Client document.
+
+        Returns:
+            Optional[Tuple[Client, str, float]]: Client, its id in the POS system
+                and when it was read from the POS system.
+        """
+        row = self.__database.connection().execute(
+            "SELECT data, pos_id, synced_at FROM clients WHERE document = ?", (document,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Client.model_validate_json(row[0]), str(row[1]), float(row[2])
+
+    def save(self, clients: Iterable[Tuple[Client, str]]) -> None:
+        """Insert or replace clients.
+
+        Args:
+            clients (Iterable[Tuple[Client, str]]): Clients and their POS ids.
+        """
+        now = time.time()
+        with self.__database.transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO clients (document, pos_id, data, synced_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (client.document, pos_id, client.model_dump_json(), now)
+                    for client, pos_id in clients
+                ],
+            )
+
+    def remove_older_than(self, timestamp: float) -> int:
+        """Remove clients not seen since `timestamp`.
+
+        Args:
+            timestamp (float): Start of the last complete sync.
+
+        Returns:
+            int: Removed clients.
+        """
+        cursor = self.__database.connection().execute(
+            "DELETE FROM clients WHERE synced_at < ?", (timestamp,)
+        )
+        return cursor.rowcount
+
+    def last_sync(self) -> float:
+        """Get when the last complete sync finished.
+
+        Returns:
+            float: Timestamp, 0 when it was never synced.
+        """
+        row = self.__database.connection().execute(
+            "SELECT finished_at FROM clients_sync WHERE name = 'full'"
+        ).fetchone()
+        return float(row[0]) if row else 0.0
+
+    def mark_synced(self, timestamp: float) -> None:
+        """Record a complete sync.
+
+        Args:
+            timestamp (float): When the sync finished.
+        """
+        self.__database.connection().execute(
+            "INSERT OR REPLACE INTO clients_sync (name, finished_at) VALUES ('full', ?)",
+            (timestamp,),
+        )
+
+    def size(self) -> int:
+        """Get the number of mirrored clients.
+
+        Returns:
+            int: Mirrored clients.
+        """
+        row = self.__database.connection().execute("SELECT COUNT(*) FROM clients").fetchone()
+        return int(row[0])
@@ -0,0 +1,95 @@
+"""SQLite access shared by the local stores."""
+
+from typing import Iterable, Iterator, Optional
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+
+
+class SQLiteDatabase:
+    """SQLite database file shared by every worker and thread.
+
+    Each thread of each process gets its own connection. The database runs in
+    WAL mode so readers never wait for a writer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        schema: str,
+        busy_timeout: float = 5,
+        synchronous: str = "NORMAL",
+        columns: Iterable[str] = (),
+    ):
+        """Initialize the database.
+
+        Args:
+            path (str): Database file.
+            schema (str): Statements creating the tables if they don't exist.
+            busy_timeout (float): Seconds to wait for a lock held by another writer.
+            synchronous (str): SQLite synchronous mode. NORMAL can lose the last
+                commits on a power loss, FULL can't.
+            columns (Iterable[str]): `ALTER TABLE ... ADD COLUMN` statements for
+                columns added after the schema was first created. Columns that
+                already exist are skipped.
+        """
+        self.__path = path
+        self.__synchronous = synchronous
+        self.__schema = schema
+        self.__columns = list(columns)
+        self.__busy_timeout = busy_timeout
+        self.__local = threading.local()
+        self.__initialized = False
+        self.__lock = threading.Lock()
+
+    def __connect(self) -> sqlite3.Connection:
+        """Open a new connection."""
+        directory = os.path.dirname(self.__path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self.__path, timeout=self.__busy_timeout, isolation_level=None
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={self.__synchronous}")
+        with self.__lock:
+            if not self.__initialized:
+                connection.executescript(self.__schema)
+                for statement in self.__columns:
+                    try:
+                        connection.execute(statement)
+                    except sqlite3.OperationalError as error:
+                        if "duplicate column" not in str(error):
+                            raise
+                self.__initialized = True
+        return connection
+
+    def connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread and process.
+
+        Returns:
+            sqlite3.Connection: Connection in autocommit mode.
+        """
+        connection: Optional[sqlite3.Connection] = getattr(self.__local, "connection", None)
+        if connection is None or getattr(self.__local, "pid", None) != os.getpid():
+            connection = self.__connect()
+            self.__local.connection = connection
+            self.__local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run statements in a write transaction.
+
+        Yields:
+            Iterator[sqlite3.Connection]: Connection inside the transaction.
+        """
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
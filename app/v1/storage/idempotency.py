@@ -0,0 +1,123 @@
+"""Responses stored by idempotency key."""
+
+from typing import Dict, Optional, Tuple
+import json
+import time
+from pydantic import BaseModel
+from app.v1.storage.database import SQLiteDatabase
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    idempotency_key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    lease_until REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expiration ON idempotency_keys (expires_at);
+"""
+
+STARTED = "started"
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+CONFLICT = "conflict"
+
+
+class StoredResponse(BaseModel):
+    """Response returned again for a repeated key."""
+
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class IdempotencyStore:
+    """Outcome of the requests sent with an idempotency key, shared by the workers.
+
+    The first request with a key holds it with a lease while it runs. If its
+    worker dies, the lease expires and a retry can run the request again.
+    """
+
+    def __init__(self, path: str, ttl: float = 86400, lease: float = 60, sweep_interval: float = 300):
+        """Initialize the store.
+
+        Args:
+            path (str): SQLite file shared by the workers.
+            ttl (float): Seconds a response is kept.
+            lease (float): Seconds a running request holds its key.
+            sweep_interval (float): Seconds between removals of the expired keys.
+        """
+        self.__database = SQLiteDatabase(path, SCHEMA)
+        self.__ttl = ttl
+        self.__lease = lease
+        self.__sweep_interval = sweep_interval
+        self.__swept_at = 0.0
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[str, Optional[StoredResponse]]:
+        """Claim a key or get the outcome of the request that claimed it.
+
+        Args:
+            key (str): Idempotency key sent by the client.
+            fingerprint (str): Hash of the request, a key can't be reused for
+                a different request.
+
+        Returns:
+            Tuple[str, Optional[StoredResponse]]: STARTED when the caller must run
+                the request, IN_FLIGHT when another request with the key is
+                running, COMPLETED with the stored response, or CONFLICT when the
+                key was used for a different request.
+        """
+        now = time.time()
+        if now - self.__swept_at > self.__sweep_interval:
+            self.__swept_at = now
+            self.__database.connection().execute(
+                "DELETE FROM idempotency_keys WHERE expires_at < ?", (now,)
+            )
+        with self.__database.transaction() as connection:
+            row = connection.execute(
+                "SELECT fingerprint, status, headers, body, lease_until, expires_at "
+                "FROM idempotency_keys WHERE idempotency_key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and row[5] >= now:
+                stored_fingerprint, status, headers, body, lease_until, _ = row
+                if stored_fingerprint != fingerprint:
+                    return CONFLICT, None
+                if status is not None:
+                    return COMPLETED, StoredResponse(
+                        status=status, headers=json.loads(headers), body=body
+                    )
+                if lease_until > now:
+                    return IN_FLIGHT, None
+            connection.execute(
+                "INSERT OR REPLACE INTO idempotency_keys "
+                "(idempotency_key, fingerprint, lease_until, expires_at) VALUES (?, ?, ?, ?)",
+                (key, fingerprint, now + self.__lease, now + self.__ttl),
+            )
+        return STARTED, None
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        """Store the response of a claimed key.
+
+        Args:
+            key (str): Idempotency key.
+            response (StoredResponse): Response to return for repeated requests.
+        """
+        self.__database.connection().execute(
+            "UPDATE idempotency_keys SET status = ?, headers = ?, body = ?, lease_until = 0 "
+            "WHERE idempotency_key = ?",
+            (response.status, json.dumps(response.headers), response.body, key),
+        )
+
+    def release(self, key: str) -> None:
+        """Free a claimed key without a response, so the request can be retried.
+
+        Args:
+            key (str): Idempotency key.
+        """
+        self.__database.connection().execute(
+            "DELETE FROM idempotency_keys WHERE idempotency_key = ? AND status IS NULL", (key,)
+        )
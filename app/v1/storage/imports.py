@@ -0,0 +1,266 @@
+"""Progress of the bulk client imports."""
+
+from typing import Iterable, List, Optional, Set, Tuple
+import time
+import uuid
+from app.v1.models import ImportFormat, ImportJob, ImportRowError, ImportStatus
+from app.v1.storage.database import SQLiteDatabase
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_jobs (
+    job_id TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    created INTEGER NOT NULL DEFAULT 0,
+    duplicates INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    claim_token TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS import_jobs_status ON import_jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS import_errors (
+    job_id TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    document INTEGER,
+    error TEXT NOT NULL,
+    PRIMARY KEY (job_id, row)
+);
+CREATE TABLE IF NOT EXISTS import_documents (
+    job_id TEXT NOT NULL,
+    document INTEGER NOT NULL,
+    PRIMARY KEY (job_id, document)
+);
+"""
+
+# columns added after the first release of the schema
+COLUMNS = ("ALTER TABLE import_jobs ADD COLUMN claim_token TEXT",)
+
+JOB_COLUMNS = "job_id, status, format, rows, created, duplicates, failed, error, created_at, updated_at"
+
+
+class ImportJobStore:
+    """Import jobs shared by the workers.
+
+    A job is claimed with a lease that is renewed after each chunk of rows.
+    If the worker running it dies, another worker claims it again and goes
+    on from the last chunk saved. Each claim gets a new token, and progress
+    is only saved by the worker holding the latest one, so a worker whose
+    lease expired can't count its chunk twice. The documents already seen by
+    a job are kept here, so duplicates inside a file are found without
+    keeping the file in memory.
+    """
+
+    def __init__(self, path: str, max_errors: int = 1000):
+        """Initialize the store.
+
+        Args:
+            path (str): SQLite file shared by the workers.
+            max_errors (int): Row errors kept per job, the others are only counted.
+        """
+        self.__database = SQLiteDatabase(path, SCHEMA, columns=COLUMNS)
+        self.__max_errors = max_errors
+
+    def create(self, job_id: str, file_format: ImportFormat, path: str) -> None:
+        """Queue an import.
+
+        Args:
+            job_id (str): Job id.
+            file_format (ImportFormat): Format of the file.
+            path (str): Spooled file.
+        """
+        now = time.time()
+        self.__database.connection().execute(
+            "INSERT INTO import_jobs (job_id, format, path, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, file_format.value, path, ImportStatus.QUEUED.value, now, now),
+        )
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        """Get the progress of an import.
+
+        Args:
+            job_id (str): Job id.
+
+        Returns:
+            Optional[ImportJob]: Job, None when it is unknown.
+        """
+        row = self.__database.connection().execute(
+            f"SELECT {JOB_COLUMNS} FROM import_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return ImportJob(**dict(zip(JOB_COLUMNS.split(", "), row)))
+
+    def get_errors(self, job_id: str, offset: int = 0, limit: int = 100) -> List[ImportRowError]:
+        """Get the rows of an import that were not created.
+
+        Args:
+            job_id (str): Job id.
+            offset (int): Errors skipped.
+            limit (int): Max errors returned.
+
+        Returns:
+            List[ImportRowError]: Errors in row order.
+        """
+        rows = self.__database.connection().execute(
+            "SELECT row, document, error FROM import_errors WHERE job_id = ? "
+            "ORDER BY row LIMIT ? OFFSET ?",
+            (job_id, limit, offset),
+        ).fetchall()
+        return [ImportRowError(row=row, document=document, error=error) for row, document, error in rows]
+
+    def claim(self, lease: float) -> Optional[Tuple[str, ImportFormat, str, int, str]]:
+        """Take the oldest queued import, or one whose worker died.
+
+        Args:
+            lease (float): Seconds the job is reserved for the caller.
+
+        Returns:
+            Optional[Tuple[str, ImportFormat, str, int, str]]: Job id, format,
+                file, rows already processed and claim token, None when nothing
+                is waiting.
+        """
+        now = time.time()
+        with self.__database.transaction() as connection:
+            row = connection.execute(
+                "SELECT job_id, format, path, rows FROM import_jobs "
+                "WHERE status = ? OR (status = ? AND lease_until <= ?) "
+                "ORDER BY created_at LIMIT 1",
+                (ImportStatus.QUEUED.value, ImportStatus.RUNNING.value, now),
+            ).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            connection.execute(
+                "UPDATE import_jobs SET status = ?, lease_until = ?, claim_token = ?, updated_at = ? "
+                "WHERE job_id = ?",
+                (ImportStatus.RUNNING.value, now + lease, token, now, row[0]),
+            )
+        return str(row[0]), ImportFormat(row[1]), str(row[2]), int(row[3]), token
+
+    def get_seen(self, job_id: str, documents: Iterable[int]) -> Set[int]:
+        """Get the documents already processed by an import.
+
+        Args:
+            job_id (str): Job id.
+            documents (Iterable[int]): Documents to check.
+
+        Returns:
+            Set[int]: Documents found in earlier chunks.
+        """
+        documents = list(documents)
+        if not documents:
+            return set()
+        rows = self.__database.connection().execute(
+            f"SELECT document FROM import_documents WHERE job_id = ? "  # nosec
+            f"AND document IN ({', '.join('?' * len(documents))})",
+            (job_id, *documents),
+        ).fetchall()
+        return {int(row[0]) for row in rows}
+
+    def save_progress(
+        self,
+        job_id: str,
+        token: str,
+        rows: int,
+        created: int,
+        duplicates: int,
+        errors: List[ImportRowError],
+        documents: Iterable[int],
+        lease: float,
+    ) -> bool:
+        """Save a processed chunk and renew the lease of the job.
+
+        Args:
+            job_id (str): Job id.
+            token (str): Token returned by `claim`.
+            rows (int): Rows of the chunk.
+            created (int): Clients created.
+            duplicates (int): Rows skipped because the client already existed.
+            errors (List[ImportRowError]): Rows that failed.
+            documents (Iterable[int]): Documents seen in the chunk.
+            lease (float): Seconds the job stays reserved.
+
+        Returns:
+            bool: Whether the chunk was saved, False when another worker claimed
+                the job since `token` was given.
+        """
+        now = time.time()
+        with self.__database.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE import_jobs SET rows = rows + ?, created = created + ?, "
+                "duplicates = duplicates + ?, failed = failed + ?, lease_until = ?, updated_at = ? "
+                "WHERE job_id = ? AND status = ? AND claim_token = ?",
+                (
+                    rows, created, duplicates, len(errors), now + lease, now,
+                    job_id, ImportStatus.RUNNING.value, token,
+                ),
+            )
+            if cursor.rowcount == 0:
+                return False
+            connection.executemany(
+                "INSERT OR IGNORE INTO import_documents (job_id, document) VALUES (?, ?)",
+                [(job_id, document) for document in documents],
+            )
+            stored = connection.execute(
+                "SELECT COUNT(*) FROM import_errors WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            connection.executemany(
+                "INSERT OR REPLACE INTO import_errors (job_id, row, document, error) VALUES (?, ?, ?, ?)",
+                [
+                    (job_id, error.row, error.document, error.error)
+                    for error in errors[:max(self.__max_errors - stored, 0)]
+                ],
+            )
+        return True
+
+    def finish(self, job_id: str, token: str, error: Optional[str] = None) -> bool:
+        """Close an import.
+
+        Args:
+            job_id (str): Job id.
+            token (str): Token returned by `claim`.
+            error (Optional[str]): Reason the whole file failed, None when it was processed.
+
+        Returns:
+            bool: Whether the job was closed, False when another worker claimed
+                it since `token` was given.
+        """
+        status = ImportStatus.FAILED if error else ImportStatus.DONE
+        with self.__database.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE import_jobs SET status = ?, error = ?, lease_until = 0, updated_at = ? "
+                "WHERE job_id = ? AND status = ? AND claim_token = ?",
+                (status.value, error, time.time(), job_id, ImportStatus.RUNNING.value, token),
+            )
+            if cursor.rowcount == 0:
+                return False
+            connection.execute("DELETE FROM import_documents WHERE job_id = ?", (job_id,))
+        return True
+
+    def remove_finished_before(self, timestamp: float) -> int:
+        """Remove the finished imports last updated before `timestamp`.
+
+        Args:
+            timestamp (float): Unix time.
+
+        Returns:
+            int: Imports removed.
+        """
+        with self.__database.transaction() as connection:
+            connection.execute(
+                "DELETE FROM import_errors WHERE job_id IN (SELECT job_id FROM import_jobs "
+                "WHERE status IN (?, ?) AND updated_at < ?)",
+                (ImportStatus.DONE.value, ImportStatus.FAILED.value, timestamp),
+            )
+            cursor = connection.execute(
+                "DELETE FROM import_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (ImportStatus.DONE.value, ImportStatus.FAILED.value, timestamp),
+            )
+            return cursor.rowcount
@@ -0,0 +1,66 @@
+"""Persistent invoice store."""
+
+from typing import Optional, Tuple
+import time
+from app.v1.models import Invoice
+from app.v1.storage.database import SQLiteDatabase
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_prefix TEXT NOT NULL,
+    invoice_number INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (invoice_prefix, invoice_number)
+);
+"""
+
+
+class InvoiceStore:
+    """Local copy of the invoices fetched from the POS system."""
+
+    def __init__(self, path: str):
+        """Initialize the store.
+
+        Args:
+            path (str): SQLite file shared by the workers.
+        """
+        self.__database = SQLiteDatabase(path, SCHEMA)
+
+    def get(self, prefix: str, number: int) -> Optional[Tuple[Invoice, float]]:
+        """Get a stored invoice.
+
+        Args:
+            prefix (str): Invoice prefix.
+            number (int): Invoice number.
+
+        Returns:
+            Optional[Tuple[Invoice, float]]: Invoice and the time it was fetched.
+        """
+        row = self.__database.connection().execute(
+            "SELECT data, fetched_at FROM invoices WHERE invoice_prefix = ? AND invoice_number = ?",
+            (prefix, number),
+        ).fetchone()
+        if row is None:
+            return None
+        return Invoice.model_validate_json(row[0]), float(row[1])
+
+    def save(self, invoice: Invoice) -> None:
+        """Store an invoice, replacing the previous version.
+
+        Args:
+            invoice (Invoice): Invoice to store.
+        """
+        self.__database.connection().execute(
+            "INSERT OR REPLACE INTO invoices "
+            "(invoice_prefix, invoice_number, status, data, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                invoice.invoice_prefix,
+                invoice.invoice_number,
+                invoice.status.value,
+                invoice.model_dump_json(),
+                time.time(),
+            ),
+        )
@@ -0,0 +1,226 @@
+"""Durable journal of the registrations waiting to be sent."""
+
+from typing import Optional, Tuple
+import time
+import uuid
+from app.v1.models import Client, Registration, RegistrationStatus
+from app.v1.storage.database import SQLiteDatabase
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    ticket TEXT PRIMARY KEY,
+    document INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    claim_token TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registrations_due ON registrations (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS registrations_document ON registrations (document, status);
+"""
+
+# columns added after the first release of the schema
+COLUMNS = ("ALTER TABLE registrations ADD COLUMN claim_token TEXT",)
+
+ACTIVE = (RegistrationStatus.PENDING.value, RegistrationStatus.PROCESSING.value)
+
+
+class RegistrationJournal:
+    """Registrations accepted by the API and not yet confirmed by the POS system.
+
+    A registration is claimed with a lease. If the worker holding it dies,
+    the lease expires and another worker claims it again. Each claim gets a
+    new token, and only the worker holding the latest one can close the
+    registration.
+    """
+
+    def __init__(self, path: str):
+        """Initialize the journal.
+
+        Args:
+            path (str): SQLite file shared by the workers.
+        """
+        self.__database = SQLiteDatabase(path, SCHEMA, synchronous="FULL", columns=COLUMNS)
+
+    def append(self, client: Client) -> str:
+        """Add a registration, reusing the one in progress for the same document.
+
+        Args:
+            client (Client): Validated client to register.
+
+        Returns:
+            str: Ticket of the registration.
+        """
+        now = time.time()
+        with self.__database.transaction() as connection:
+            row = connection.execute(
+                "SELECT ticket FROM registrations WHERE document = ? AND status IN (?, ?)",
+                (client.document, *ACTIVE),
+            ).fetchone()
+            if row:
+                return str(row[0])
+            ticket = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO registrations "
+                "(ticket, document, data, status, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    ticket,
+                    client.document,
+                    client.model_dump_json(),
+                    RegistrationStatus.PENDING.value,
+                    now,
+                    now,
+                    now,
+                ),
+            )
+            return ticket
+
+    def get(self, ticket: str) -> Optional[Registration]:
+        """Get the progress of a registration.
+
+        Args:
+            ticket (str): Ticket returned by `append`.
+
+        Returns:
+            Optional[Registration]: Registration, None when the ticket is unknown.
+        """
+        row = self.__database.connection().execute(
+            "SELECT ticket, document, status, attempts, last_error, created_at, updated_at "
+            "FROM registrations WHERE ticket = ?",
+            (ticket,),
+        ).fetchone()
+        if row is None:
+            return None
+        return Registration(
+            ticket=row[0],
+            document=row[1],
+            status=row[2],
+            attempts=row[3],
+            last_error=row[4],
+            created_at=row[5],
+            updated_at=row[6],
+        )
+
+    def claim(self, lease: float) -> Optional[Tuple[str, Client, int, str]]:
+        """Take the oldest due registration.
+
+        Args:
+            lease (float): Seconds the registration is reserved for the caller.
+
+        Returns:
+            Optional[Tuple[str, Client, int, str]]: Ticket, client, attempts
+                already made and claim token, None when nothing is due.
+        """
+        now = time.time()
+        with self.__database.transaction() as connection:
+            row = connection.execute(
+                "SELECT ticket, data, attempts FROM registrations "
+                "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until <= ?) "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (RegistrationStatus.PENDING.value, now, RegistrationStatus.PROCESSING.value, now),
+            ).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            connection.execute(
+                "UPDATE registrations SET status = ?, lease_until = ?, claim_token = ?, updated_at = ? "
+                "WHERE ticket = ?",
+                (RegistrationStatus.PROCESSING.value, now + lease, token, now, row[0]),
+            )
+        return str(row[0]), Client.model_validate_json(row[1]), int(row[2]), token
+
+    def complete(self, ticket: str, token: str) -> bool:
+        """Mark a registration as sent.
+
+        Args:
+            ticket (str): Registration ticket.
+            token (str): Token returned by `claim`.
+
+        Returns:
+            bool: Whether it was marked, False when another worker claimed it
+                since `token` was given.
+        """
+        return self.__finish(ticket, token, RegistrationStatus.DONE, None)
+
+    def fail(self, ticket: str, token: str, error: str) -> bool:
+        """Give up on a registration.
+
+        Args:
+            ticket (str): Registration ticket.
+            token (str): Token returned by `claim`.
+            error (str): Reason shown in the status.
+
+        Returns:
+            bool: Whether it was marked, False when another worker claimed it
+                since `token` was given.
+        """
+        return self.__finish(ticket, token, RegistrationStatus.FAILED, error)
+
+    def __finish(
+        self, ticket: str, token: str, status: RegistrationStatus, error: Optional[str]
+    ) -> bool:
+        """Close a registration after an attempt."""
+        cursor = self.__database.connection().execute(
+            "UPDATE registrations SET status = ?, attempts = attempts + 1, last_error = ?, "
+            "lease_until = 0, updated_at = ? WHERE ticket = ? AND status = ? AND claim_token = ?",
+            (status.value, error, time.time(), ticket, RegistrationStatus.PROCESSING.value, token),
+        )
+        return cursor.rowcount > 0
+
+    def retry(self, ticket: str, token: str, error: str, delay: float) -> bool:
+        """Send a registration again later.
+
+        Args:
+            ticket (str): Registration ticket.
+            token (str): Token returned by `claim`.
+            error (str): Error of the failed attempt.
+            delay (float): Seconds before the next attempt.
+
+        Returns:
+            bool: Whether it was rescheduled, False when another worker claimed
+                it since `token` was given.
+        """
+        now = time.time()
+        cursor = self.__database.connection().execute(
+            "UPDATE registrations SET status = ?, attempts = attempts + 1, last_error = ?, "
+            "next_attempt_at = ?, lease_until = 0, updated_at = ? "
+            "WHERE ticket = ? AND status = ? AND claim_token = ?",
+            (
+                RegistrationStatus.PENDING.value, error, now + delay, now,
+                ticket, RegistrationStatus.PROCESSING.value, token,
+            ),
+        )
+        return cursor.rowcount > 0
+
+    def remove_finished_before(self, timestamp: float) -> int:
+        """Remove the done and failed registrations last updated before `timestamp`.
+
+        Args:
+            timestamp (float): Unix time.
+
+        Returns:
+            int: Registrations removed.
+        """
+        cursor = self.__database.connection().execute(
+            "DELETE FROM registrations WHERE status IN (?, ?) AND updated_at < ?",
+            (RegistrationStatus.DONE.value, RegistrationStatus.FAILED.value, timestamp),
+        )
+        return cursor.rowcount
+
+    def pending(self) -> int:
+        """Count the registrations not yet sent.
+
+        Returns:
+            int: Pending and in progress registrations.
+        """
+        row = self.__database.connection().execute(
+            "SELECT COUNT(*) FROM registrations WHERE status IN (?, ?)", ACTIVE
+        ).fetchone()
+        return int(row[0])
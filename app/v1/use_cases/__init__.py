@@ -1,6 +1,9 @@
 """Exposed use cases."""
 from app.v1.use_cases.users_manager import UsersManager
 from app.v1.use_cases.invoices_manager import InvoicesManager
+from app.v1.use_cases.registrations import RegistrationWorker
+from app.v1.use_cases.email_verifier import EmailVerifier
+from app.v1.use_cases.imports import ImportWorker
 
 
-__all__ = ["UsersManager", "InvoicesManager"]
+__all__ = ["UsersManager", "InvoicesManager", "RegistrationWorker", "EmailVerifier", "ImportWorker"]
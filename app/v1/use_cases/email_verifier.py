@@ -0,0 +1,289 @@
+"""Email checks with cached domain deliverability."""
+
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from logging import Logger
+import contextvars
+import functools
+import os
+import threading
+import dns.resolver
+from email_validator import EmailNotValidError, EmailUndeliverableError, validate_email
+from email_validator.deliverability import caching_resolver, validate_email_deliverability
+from app.v1.utils.cache import TTLCache
+from app.v1.utils.concurrency import SingleFlight
+
+
+MODE_SYNC = "sync"
+MODE_ASYNC = "async"
+MODE_OFF = "off"
+MODES = (MODE_SYNC, MODE_ASYNC, MODE_OFF)
+
+# Domains accepted without DNS lookups
+COMMON_DOMAINS = frozenset({
+    "aol.com",
+    "gmail.com",
+    "gmx.com",
+    "googlemail.com",
+    "hotmail.com",
+    "hotmail.es",
+    "icloud.com",
+    "live.com",
+    "mac.com",
+    "mail.com",
+    "me.com",
+    "msn.com",
+    "outlook.com",
+    "outlook.es",
+    "proton.me",
+    "protonmail.com",
+    "yahoo.com",
+    "yahoo.com.co",
+    "yahoo.es",
+    "zoho.com",
+})
+
+
+class EmailVerifier:
+    """Check the syntax and the deliverability of email addresses.
+
+    The syntax is always checked inline. Deliverability depends only on the
+    domain, so the DNS result of each domain is cached and common domains are
+    never looked up. In `sync` mode an unknown domain is looked up before
+    answering. In `async` mode it is accepted and looked up in the background,
+    so later requests with the domain use the result. `off` only checks the
+    syntax.
+
+    Lookups that time out are cached as unknown for the cache `negative_ttl`
+    and the address is accepted.
+    """
+
+    def __init__(
+        self,
+        mode: str = MODE_ASYNC,
+        cache: Optional[TTLCache[str]] = None,
+        allowed_domains: Iterable[str] = COMMON_DOMAINS,
+        timeout: float = 5,
+        max_workers: int = 4,
+        max_pending: int = 1000,
+        logger: Optional[Logger] = None,
+        resolve: Optional[Callable[[str], Dict[str, Any]]] = None,
+    ):
+        """Initialize the verifier.
+
+        Args:
+            mode (str): `sync`, `async` or `off`.
+            cache (Optional[TTLCache[str]]): Deliverability by domain, an empty
+                string when the domain accepts email or the reason it doesn't.
+            allowed_domains (Iterable[str]): Domains accepted without lookups.
+            timeout (float): Seconds of a DNS lookup.
+            max_workers (int): DNS lookups running at the same time.
+            max_pending (int): Background lookups waiting before new ones are skipped.
+            logger (Optional[Logger]): Logs the undeliverable domains found in
+                the background.
+            resolve (Optional[Callable[[str], Dict[str, Any]]]): Looks up a domain,
+                raising EmailUndeliverableError. Defaults to a DNS lookup.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Invalid email deliverability mode: {mode}")
+        self.__mode = mode
+        self.__cache: TTLCache[str] = (
+            cache if cache else TTLCache(maxsize=4096, ttl=86400, negative_ttl=300)
+        )
+        self.__allowed_domains = frozenset(domain.lower() for domain in allowed_domains)
+        self.__timeout = timeout
+        self.__max_workers = max_workers
+        self.__max_pending = max_pending
+        self.__logger = logger
+        self.__resolve = resolve if resolve else self.__resolve_dns
+        self.__lookups: SingleFlight[Optional[str]] = SingleFlight()
+        self.__lock = threading.Lock()
+        self.__pending: Set[str] = set()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__resolver: Optional[dns.resolver.Resolver] = None
+        self.__pid: Optional[int] = None
+        self.__counts = {"allowed": 0, "lookups": 0, "undeliverable": 0, "skipped": 0}
+
+    @property
+    def mode(self) -> str:
+        """Deliverability mode."""
+        return self.__mode
+
+    def __get_executor(self) -> ThreadPoolExecutor:
+        """Get the thread pool of the current process.
+
+        Must be called holding the lock.
+        """
+        if self.__executor is None or self.__pid != os.getpid():
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.__max_workers, thread_name_prefix="email-lookups"
+            )
+            self.__resolver = None
+            self.__pending = set()
+            self.__pid = os.getpid()
+        return self.__executor
+
+    def __resolve_dns(self, domain: str) -> Dict[str, Any]:
+        """Look up the mail servers of a domain."""
+        with self.__lock:
+            if self.__resolver is None:
+                self.__resolver = caching_resolver(timeout=self.__timeout)  # type: ignore
+            resolver = self.__resolver
+        return dict(validate_email_deliverability(domain, domain, dns_resolver=resolver))
+
+    def __count(self, name: str) -> None:
+        """Increase a counter."""
+        with self.__lock:
+            self.__counts[name] += 1
+
+    def __lookup(self, domain: str) -> Optional[str]:
+        """Look up a domain and cache the result.
+
+        Returns:
+            Optional[str]: Empty when the domain accepts email, the reason when
+                it doesn't, None when it is unknown.
+        """
+        self.__count("lookups")
+        try:
+            info = self.__resolve(domain)
+            result: Optional[str] = None if info.get("unknown-deliverability") else ""
+        except EmailUndeliverableError as error:
+            self.__count("undeliverable")
+            result = str(error)
+        self.__cache.set(domain, result)
+        return result
+
+    def __lookup_in_background(self, domain: str) -> None:
+        """Look up a domain in the background and log it when it doesn't accept email."""
+        try:
+            reason = self.__lookups.do(domain, lambda: self.__lookup(domain))
+            if reason and self.__logger:
+                self.__logger.warning(f"Accepted email domain does not accept email: {reason}")
+        except Exception as error:  # pylint: disable=broad-except
+            if self.__logger:
+                self.__logger.error(f"Email domain lookup error: {error}")
+        finally:
+            with self.__lock:
+                self.__pending.discard(domain)
+
+    def __schedule(self, domain: str) -> None:
+        """Queue a background lookup unless one is waiting for the domain."""
+        with self.__lock:
+            executor = self.__get_executor()
+            if domain in self.__pending:
+                return
+            if len(self.__pending) >= self.__max_pending:
+                self.__counts["skipped"] += 1
+                return
+            self.__pending.add(domain)
+        # not bound to the request context, so its deadline doesn't apply
+        executor.submit(self.__lookup_in_background, domain)
+
+    def __get_known(self, domain: str) -> Optional[str]:
+        """Get the known deliverability of a domain.
+
+        Returns:
+            Optional[str]: Empty when the domain accepts email or is unknown, the
+                reason when it doesn't, None when it must be looked up.
+        """
+        if self.__mode == MODE_OFF:
+            return ""
+        if domain in self.__allowed_domains:
+            self.__count("allowed")
+            return ""
+        found, reason = self.__cache.get(domain)
+        if not found:
+            return None
+        return "" if reason is None else reason
+
+    def check(self, email: str) -> str:
+        """Check an email address.
+
+        Args:
+            email (str): Address to check.
+
+        Raises:
+            EmailNotValidError: Raised when the address is malformed or its
+                domain is known not to accept email.
+
+        Returns:
+            str: Normalized address.
+        """
+        info = validate_email(email, check_deliverability=False)
+        domain = info.ascii_domain
+        reason = self.__get_known(domain)
+        if reason is None:
+            if self.__mode == MODE_ASYNC:
+                self.__schedule(domain)
+                return info.normalized
+            reason = self.__lookups.do(domain, lambda: self.__lookup(domain))
+        if reason:
+            raise EmailUndeliverableError(reason)
+        return info.normalized
+
+    def check_many(self, emails: Iterable[str]) -> Dict[str, Optional[EmailNotValidError]]:
+        """Check several addresses, looking up each unknown domain once.
+
+        Unknown domains are looked up concurrently before returning, whatever
+        the mode except `off`. Meant for bulk imports run outside requests.
+
+        Args:
+            emails (Iterable[str]): Addresses to check.
+
+        Returns:
+            Dict[str, Optional[EmailNotValidError]]: Error of each address, None
+                when it is valid.
+        """
+        errors: Dict[str, Optional[EmailNotValidError]] = {}
+        domains: Dict[str, str] = {}
+        for email in emails:
+            if email in errors:
+                continue
+            try:
+                domains[email] = validate_email(email, check_deliverability=False).ascii_domain
+                errors[email] = None
+            except EmailNotValidError as error:
+                errors[email] = error
+
+        reasons: Dict[str, Optional[str]] = {}
+        unknown = []
+        for domain in set(domains.values()):
+            reason = self.__get_known(domain)
+            if reason is None:
+                unknown.append(domain)
+            else:
+                reasons[domain] = reason
+        if unknown:
+            with self.__lock:
+                executor = self.__get_executor()
+            futures = {
+                domain: executor.submit(
+                    contextvars.copy_context().run,
+                    self.__lookups.do,
+                    domain,
+                    functools.partial(self.__lookup, domain),
+                )
+                for domain in unknown
+            }
+            for domain, future in futures.items():
+                reasons[domain] = future.result()
+
+        for email, domain in domains.items():
+            reason = reasons[domain]
+            if reason:
+                errors[email] = EmailUndeliverableError(reason)
+        return errors
+
+    def stats(self) -> Dict[str, int]:
+        """Get lookup counters of the current worker.
+
+        Returns:
+            Dict[str, int]: Allowed domains, DNS lookups, undeliverable domains,
+                skipped background lookups, waiting background lookups and the
+                cache counters.
+        """
+        with self.__lock:
+            stats = dict(self.__counts)
+            stats["pending"] = len(self.__pending) if self.__pid == os.getpid() else 0
+        stats.update({f"cache_{name}": value for name, value in self.__cache.stats().items()})
+        return stats
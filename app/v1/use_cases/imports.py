@@ -0,0 +1,343 @@
+"""Bulk client imports run in the background."""
+
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from logging import Logger
+import asyncio
+import csv
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from pydantic import ValidationError
+from app.v1.models import Client, ImportFormat, ImportJob, ImportRowError
+from app.v1.storage import ImportJobStore
+from app.v1.use_cases.email_verifier import EmailVerifier
+from app.v1.use_cases.users_manager import UsersManager
+from app.v1.utils.deadline import deadline_scope
+from app.v1.utils.errors import AlreadyExistsError, FileTooLargeError
+
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+# share of the lease a chunk may take, the rest is left to save its progress
+CHUNK_LEASE_SHARE = 0.8
+
+# Row number and client, or the reason the row couldn't be read
+ParsedRow = Tuple[int, Union[Client, str]]
+
+
+def describe_error(error: Exception) -> str:
+    """Get a one line description of a row error."""
+    if isinstance(error, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in detail['loc'])}: {detail['msg']}"
+            for detail in error.errors()
+        )
+    return str(error) or type(error).__name__
+
+
+def read_csv(file: IO[str]) -> Iterator[ParsedRow]:
+    """Read clients from a CSV file with a header row.
+
+    Empty cells are missing values. Nested fields like the city are not supported.
+    """
+    for number, row in enumerate(csv.DictReader(file), start=1):
+        data: Dict[str, Any] = {
+            key: value for key, value in row.items() if key and value not in (None, "")
+        }
+        if str(data.get("document_type", "")).isdigit():
+            data["document_type"] = int(data["document_type"])
+        try:
+            yield number, Client.model_validate(data)
+        except ValidationError as error:
+            yield number, describe_error(error)
+
+
+def read_ndjson(file: IO[str]) -> Iterator[ParsedRow]:
+    """Read clients from a file with a JSON object per line, skipping blank lines."""
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, Client.model_validate(json.loads(line))
+        except (ValidationError, ValueError) as error:
+            yield number, describe_error(error)
+
+
+READERS = {ImportFormat.CSV: read_csv, ImportFormat.NDJSON: read_ndjson}
+
+
+class ImportWorker:
+    """Import client files into the POS system from a background thread.
+
+    Uploads are spooled to disk and read a chunk of rows at a time, so the
+    memory used doesn't depend on the file size. For each chunk, the emails
+    are checked together, documents already seen in the file or existing in
+    the POS system are skipped, and the new clients are uploaded with
+    bounded concurrency. Each chunk must finish within its lease, so its
+    upstream calls run under a deadline. A worker that finds its job
+    claimed by another one, after its lease expired anyway, stops without
+    saving anything. Every worker process runs one thread taking jobs from
+    the shared store, started with the worker by `ensure_running`.
+    """
+
+    def __init__(
+        self,
+        store: ImportJobStore,
+        users_manager: UsersManager,
+        emails: EmailVerifier,
+        validate: Callable[[Client], None],
+        directory: str,
+        logger: Logger,
+        chunk_size: int = 100,
+        max_concurrency: int = 4,
+        max_bytes: int = 100 * 1024 * 1024,
+        lease: float = 300,
+        poll_interval: float = 1,
+        retention: float = 7 * 86400,
+        autostart: bool = True,
+    ):
+        """Initialize the worker.
+
+        Args:
+            store (ImportJobStore): Progress of the jobs.
+            users_manager (UsersManager): Searches and uploads the clients.
+            emails (EmailVerifier): Checks the emails of a chunk.
+            validate (Callable[[Client], None]): Checks the other fields of a
+                client, raising ValueError.
+            directory (str): Directory of the spooled files, shared by the workers.
+            logger (Logger): Logger to use.
+            chunk_size (int): Rows processed and saved together.
+            max_concurrency (int): Max searches or uploads running at the same time.
+            max_bytes (int): Max size of an uploaded file.
+            lease (float): Seconds a job is reserved after each chunk. Calls
+                still running at 80% of it fail, so the chunk ends in time.
+            poll_interval (float): Seconds between checks for new jobs.
+            retention (float): Seconds finished jobs are kept.
+            autostart (bool): Start the background thread when a job is
+                submitted or followed, in case it was not started with the worker.
+        """
+        self.__store = store
+        self.__users_manager = users_manager
+        self.__emails = emails
+        self.__validate = validate
+        self.__directory = directory
+        self.__logger = logger
+        self.__chunk_size = chunk_size
+        self.__max_concurrency = max_concurrency
+        self.__max_bytes = max_bytes
+        self.__lease = lease
+        self.__poll_interval = poll_interval
+        self.__retention = retention
+        self.__autostart = autostart
+        self.__lock = threading.Lock()
+        self.__pid: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, stream: IO[bytes], file_format: ImportFormat) -> str:
+        """Spool an uploaded file to disk and queue its import.
+
+        Args:
+            stream (IO[bytes]): Uploaded file.
+            file_format (ImportFormat): Format of the file.
+
+        Raises:
+            FileTooLargeError: Raised when the file exceeds `max_bytes`.
+
+        Returns:
+            str: Job id to follow the import.
+        """
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.__directory, f"{job_id}.{file_format.value}")
+        partial_path = f"{path}.part"
+        size = 0
+        try:
+            with open(partial_path, "wb") as file:
+                while True:
+                    chunk = stream.read(COPY_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.__max_bytes:
+                        raise FileTooLargeError(f"Import files can't exceed {self.__max_bytes} bytes")
+                    file.write(chunk)
+            os.replace(partial_path, path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        self.__store.create(job_id, file_format, path)
+        if self.__autostart:
+            self.ensure_running()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        """Get the progress of an import.
+
+        Args:
+            job_id (str): Job id returned by `submit`.
+
+        Returns:
+            Optional[ImportJob]: Job, None when it is unknown.
+        """
+        if self.__autostart:
+            self.ensure_running()
+        return self.__store.get(job_id)
+
+    def get_errors(self, job_id: str, offset: int = 0, limit: int = 100) -> List[ImportRowError]:
+        """Get the rows of an import that were not created.
+
+        Args:
+            job_id (str): Job id returned by `submit`.
+            offset (int): Errors skipped.
+            limit (int): Max errors returned.
+
+        Returns:
+            List[ImportRowError]: Errors in row order.
+        """
+        return self.__store.get_errors(job_id, offset, limit)
+
+    def ensure_running(self) -> None:
+        """Start the background thread of the current worker if it is not running."""
+        if self.__pid == os.getpid():
+            return
+        with self.__lock:
+            if self.__pid == os.getpid():
+                return
+            self.__pid = os.getpid()
+            thread = threading.Thread(target=self.__run, name="imports", daemon=True)
+            thread.start()
+
+    def __run(self) -> None:
+        """Run the queued jobs, waiting while there are none."""
+        cleaned_at = 0.0
+        while True:
+            try:
+                if time.time() - cleaned_at > 3600:
+                    self.__store.remove_finished_before(time.time() - self.__retention)
+                    cleaned_at = time.time()
+                if not self.run_once():
+                    time.sleep(self.__poll_interval)
+            except Exception as error:  # pylint: disable=broad-except
+                self.__logger.error(f"Import worker error: {error}")
+                time.sleep(self.__poll_interval)
+
+    def run_once(self) -> bool:
+        """Run the oldest queued job to the end.
+
+        Returns:
+            bool: Whether a job was waiting.
+        """
+        claimed = self.__store.claim(self.__lease)
+        if claimed is None:
+            return False
+        job_id, file_format, path, processed, token = claimed
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as file:
+                rows = itertools.islice(READERS[file_format](file), processed, None)
+                while True:
+                    chunk = list(itertools.islice(rows, self.__chunk_size))
+                    if not chunk:
+                        break
+                    with deadline_scope(self.__lease * CHUNK_LEASE_SHARE):
+                        saved = self.__process(job_id, token, chunk)
+                    if not saved:
+                        self.__logger.warning(f"Import {job_id} was claimed by another worker")
+                        return True
+        except Exception as error:  # pylint: disable=broad-except
+            self.__logger.error(f"Import {job_id} failed: {error}")
+            finished = self.__store.finish(job_id, token, describe_error(error))
+        else:
+            finished = self.__store.finish(job_id, token)
+        if not finished:
+            self.__logger.warning(f"Import {job_id} was claimed by another worker")
+            return True
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def __process(self, job_id: str, token: str, chunk: List[ParsedRow]) -> bool:
+        """Validate, deduplicate and upload a chunk of rows and save its progress.
+
+        Returns:
+            bool: Whether the progress was saved, False when the job was claimed
+                by another worker.
+        """
+        errors: List[ImportRowError] = []
+        duplicates = 0
+        candidates: Dict[int, Tuple[int, Client]] = {}
+        for number, parsed in chunk:
+            if isinstance(parsed, str):
+                errors.append(ImportRowError(row=number, error=parsed))
+                continue
+            try:
+                self.__validate(parsed)
+            except ValueError as error:
+                errors.append(ImportRowError(row=number, document=parsed.document, error=str(error)))
+                continue
+            if parsed.document in candidates:
+                duplicates += 1
+            else:
+                candidates[parsed.document] = (number, parsed)
+
+        for document in self.__store.get_seen(job_id, candidates):
+            del candidates[document]
+            duplicates += 1
+
+        email_errors = self.__emails.check_many(str(client.email) for _, client in candidates.values())
+        for document, (number, client) in list(candidates.items()):
+            email_error = email_errors[str(client.email)]
+            if email_error is not None:
+                errors.append(ImportRowError(row=number, document=document, error=str(email_error)))
+                del candidates[document]
+
+        results = asyncio.run(self.__upload([client for _, client in candidates.values()]))
+        created = 0
+        seen = []
+        for document, (number, _) in candidates.items():
+            result = results[document]
+            if isinstance(result, Exception):
+                errors.append(ImportRowError(row=number, document=document, error=describe_error(result)))
+                continue
+            seen.append(document)
+            if result:
+                created += 1
+            else:
+                duplicates += 1
+        return self.__store.save_progress(
+            job_id, token, len(chunk), created, duplicates, errors, seen, self.__lease
+        )
+
+    async def __upload(self, clients: List[Client]) -> Dict[int, Union[bool, Exception]]:
+        """Upload the clients that don't exist yet.
+
+        Returns:
+            Dict[int, Union[bool, Exception]]: Whether each client was created, or
+                the error of its search or upload, by document.
+        """
+        semaphore = asyncio.Semaphore(self.__max_concurrency)
+        existing = await self.__users_manager.get_users_async(
+            [client.document for client in clients], self.__max_concurrency
+        )
+
+        async def upload(client: Client) -> Union[bool, Exception]:
+            found = existing[client.document]
+            if isinstance(found, Exception):
+                return found
+            if found is not None and found.document == client.document:
+                return False
+            async with semaphore:
+                try:
+                    await self.__users_manager.upload_user_async(client)
+                except AlreadyExistsError:
+                    return False
+                except Exception as error:  # pylint: disable=broad-except
+                    return error
+            return True
+
+        results = await asyncio.gather(*(upload(client) for client in clients))
+        return {client.document: result for client, result in zip(clients, results)}
@@ -1,20 +1,81 @@
 """Invoices Manager module."""
-from typing import Optional
-from app.v1.clients import SystemProvider
-from app.v1.models import Invoice
+from typing import Dict, Iterator, Optional, Tuple
+import asyncio
+import time
+from app.v1.clients import SystemProvider, AsyncSystemProvider, AsyncConnector
+from app.v1.models import Invoice, InvoiceStatus
+from app.v1.storage import InvoiceStore
+from app.v1.utils.cache import HIT, MISS, STALE, record_cache_read
+from app.v1.utils.concurrency import BackgroundRefresh
+from app.v1.utils.log import log_cache_outcome
 
 
 class InvoicesManager():
     """Class to manage Invoices."""
 
-    def __init__(self, connector: SystemProvider):
+    def __init__(
+        self,
+        connector: SystemProvider,
+        store: Optional[InvoiceStore] = None,
+        revalidate_after: float = 86400,
+        async_connector: Optional[AsyncSystemProvider] = None,
+        grace: float = 0,
+        refresh: Optional[BackgroundRefresh] = None,
+        max_concurrency: Optional[int] = None,
+    ):
         """Initialize the users manager.
 
         Args:
             connector (SystemProvider): Connector to the system.
-            logger (Logger): Logger to use.
+            store (Optional[InvoiceStore]): Local copy of the fetched invoices.
+            revalidate_after (float): Seconds before a paid invoice is fetched again.
+                Canceled invoices are final and never fetched again.
+            async_connector (Optional[AsyncSystemProvider]): Connector used by the
+                async methods. Defaults to `connector` run in a thread pool.
+            grace (float): Seconds after `revalidate_after` a stored invoice is
+                still returned while it is fetched again in the background.
+            refresh (Optional[BackgroundRefresh]): Runs the background fetches.
+            max_concurrency (Optional[int]): Max upstream calls a single range
+                makes at the same time, like the connector bulkhead size. Larger
+                windows are reduced to it.
         """
         self.__connector = connector
+        self.__store = store
+        self.__revalidate_after = revalidate_after
+        self.__grace = grace
+        self.__refresh = refresh if refresh else BackgroundRefresh()
+        self.__max_concurrency = max_concurrency
+        self.__async_connector = (
+            async_connector if async_connector else AsyncConnector(connector)
+        )
+
+    def __get_stored(self, prefix: str, number: int) -> Optional[Invoice]:
+        """Get the stored invoice when it doesn't need to be fetched again."""
+        if not self.__store:
+            return None
+        stored = self.__store.get(prefix, number)
+        if stored:
+            invoice, fetched_at = stored
+            age = max(time.time() - fetched_at, 0)
+            if invoice.status == InvoiceStatus.CANCELED or age < self.__revalidate_after:
+                log_cache_outcome("invoices", True)
+                record_cache_read(HIT, age)
+                return invoice
+            if age < self.__revalidate_after + self.__grace:
+                self.__refresh.schedule(
+                    (prefix, number),
+                    lambda: self.__save(self.__connector.get_invoice(prefix, number)),
+                )
+                log_cache_outcome("invoices", True)
+                record_cache_read(STALE, age)
+                return invoice
+        log_cache_outcome("invoices", False)
+        return None
+
+    def __save(self, invoice: Optional[Invoice]) -> None:
+        """Keep a fetched invoice in the store."""
+        if invoice and self.__store:
+            self.__store.save(invoice)
 
     def get_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
         """Get an invoice.
@@ -26,5 +87,90 @@ class InvoicesManager():
         Returns:
             Optional[Invoice]: required invoice.
         """
+        invoice = self.__get_stored(prefix, number)
+        if invoice:
+            return invoice
         invoice = self.__connector.get_invoice(prefix, number)
+        self.__save(invoice)
+        record_cache_read(MISS)
+        return invoice
+
+    async def get_invoice_async(self, prefix: str, number: int) -> Optional[Invoice]:
+        """Get an invoice without blocking the event loop.
+
+        Args:
+            prefix (str): prefix used in this invoice.
+            number (int): invoice number.
+
+        Returns:
+            Optional[Invoice]: required invoice.
+        """
+        invoice = self.__get_stored(prefix, number)
+        if invoice:
+            return invoice
+        invoice = await self.__async_connector.get_invoice(prefix, number)
+        self.__save(invoice)
+        record_cache_read(MISS)
         return invoice
+
+    def iter_invoices(
+        self, prefix: str, first: int, last: int, window: int = 8
+    ) -> Iterator[Tuple[int, Optional[Invoice], Optional[Exception]]]:
+        """Get a range of invoices, yielding each one as soon as it is fetched.
+
+        At most `window` invoices are fetched or waiting to be consumed at the
+        same time, so memory doesn't grow with the size of the range. The
+        invoices are fetched by the async connector, so the upstream calls of
+        every range share its thread pool instead of opening one per request.
+
+        Args:
+            prefix (str): prefix used in the invoices.
+            first (int): first invoice number.
+            last (int): last invoice number, included.
+            window (int): invoices fetched ahead of the consumer.
+
+        Yields:
+            Iterator[Tuple[int, Optional[Invoice], Optional[Exception]]]: invoice
+                number, invoice (None when missing) and the error raised fetching it.
+        """
+        if self.__max_concurrency is not None:
+            window = min(window, self.__max_concurrency)
+        numbers = iter(range(first, last + 1))
+        # the loop only runs while the consumer waits for the next invoice
+        loop = asyncio.new_event_loop()
+        pending: Dict["asyncio.Task[Optional[Invoice]]", int] = {}
+
+        def submit_next() -> None:
+            number = next(numbers, None)
+            if number is not None:
+                pending[loop.create_task(self.get_invoice_async(prefix, number))] = number
+
+        try:
+            for _ in range(window):
+                submit_next()
+            while pending:
+                done, _ = loop.run_until_complete(
+                    asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                )
+                for task in done:
+                    number = pending.pop(task)
+                    submit_next()
+                    error = task.exception()
+                    if error is not None:
+                        yield number, None, error  # type: ignore
+                    else:
+                        yield number, task.result(), None
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+
+    def refresh_stats(self) -> Dict[str, int]:
+        """Get background refresh counters.
+
+        Returns:
+            Dict[str, int]: Refreshes scheduled, skipped, failed and waiting.
+        """
+        return self.__refresh.stats()
@@ -0,0 +1,163 @@
+"""Background registration of queued clients."""
+
+from typing import Callable, Optional
+from logging import Logger
+import os
+import random
+import threading
+import time
+from app.v1.models import Client, Registration
+from app.v1.storage import RegistrationJournal
+from app.v1.utils.deadline import deadline_scope
+from app.v1.utils.errors import AlreadyExistsError
+
+
+# share of the lease an upload may take, the rest is left to record its result
+UPLOAD_LEASE_SHARE = 0.8
+
+
+class RegistrationWorker:
+    """Send the journaled registrations to the POS system from a background thread.
+
+    Every worker process runs one thread draining the shared journal, started
+    with the worker by `ensure_running`. Failed uploads are retried with
+    exponential backoff until `max_attempts`. Each upload runs under a
+    deadline shorter than its lease, and only the worker holding the latest
+    claim records its result.
+    """
+
+    def __init__(
+        self,
+        journal: RegistrationJournal,
+        upload: Callable[[Client], None],
+        logger: Logger,
+        max_attempts: int = 8,
+        base_delay: float = 5,
+        max_delay: float = 600,
+        lease: float = 60,
+        poll_interval: float = 1,
+        retention: float = 7 * 86400,
+        autostart: bool = True,
+    ):
+        """Initialize the worker.
+
+        Args:
+            journal (RegistrationJournal): Journal to drain.
+            upload (Callable[[Client], None]): Sends a client to the POS system.
+            logger (Logger): Logger to use.
+            max_attempts (int): Attempts before a registration fails.
+            base_delay (float): Seconds before the first retry, doubled on each attempt.
+            max_delay (float): Max seconds between attempts.
+            lease (float): Seconds a registration is reserved for the worker
+                sending it. Uploads still running at 80% of it fail.
+            poll_interval (float): Seconds between checks of an empty journal.
+            retention (float): Seconds finished registrations are kept.
+            autostart (bool): Start the background thread when a registration
+                is submitted or followed, in case it was not started with the worker.
+        """
+        self.__journal = journal
+        self.__upload = upload
+        self.__logger = logger
+        self.__max_attempts = max_attempts
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__lease = lease
+        self.__poll_interval = poll_interval
+        self.__retention = retention
+        self.__autostart = autostart
+        self.__lock = threading.Lock()
+        self.__pid: Optional[int] = None
+
+    def submit(self, client: Client) -> str:
+        """Journal a registration.
+
+        Args:
+            client (Client): Validated client.
+
+        Returns:
+            str: Ticket to follow the registration.
+        """
+        ticket = self.__journal.append(client)
+        if self.__autostart:
+            self.ensure_running()
+        return ticket
+
+    def get(self, ticket: str) -> Optional[Registration]:
+        """Get the progress of a registration.
+
+        Args:
+            ticket (str): Ticket returned by `submit`.
+
+        Returns:
+            Optional[Registration]: Registration, None when the ticket is unknown.
+        """
+        if self.__autostart:
+            self.ensure_running()
+        return self.__journal.get(ticket)
+
+    def ensure_running(self) -> None:
+        """Start the background thread of the current worker if it is not running."""
+        if self.__pid == os.getpid():
+            return
+        with self.__lock:
+            if self.__pid == os.getpid():
+                return
+            self.__pid = os.getpid()
+            thread = threading.Thread(target=self.__run, name="registrations", daemon=True)
+            thread.start()
+
+    def __run(self) -> None:
+        """Drain the journal, waiting while it is empty."""
+        cleaned_at = 0.0
+        while True:
+            try:
+                if time.time() - cleaned_at > 3600:
+                    self.__journal.remove_finished_before(time.time() - self.__retention)
+                    cleaned_at = time.time()
+                if not self.drain_once():
+                    time.sleep(self.__poll_interval)
+            except Exception as error:  # pylint: disable=broad-except
+                self.__logger.error("Registration worker error: %s", error)
+                time.sleep(self.__poll_interval)
+
+    def drain_once(self) -> bool:
+        """Send the oldest due registration.
+
+        Returns:
+            bool: Whether a registration was due.
+        """
+        claimed = self.__journal.claim(self.__lease)
+        if claimed is None:
+            return False
+        ticket, client, attempts, token = claimed
+        try:
+            with deadline_scope(self.__lease * UPLOAD_LEASE_SHARE):
+                self.__upload(client)
+        except AlreadyExistsError as error:
+            if attempts:
+                # an earlier attempt most likely created it before failing, like a timeout
+                recorded = self.__journal.complete(ticket, token)
+            else:
+                recorded = self.__journal.fail(ticket, token, str(error))
+        except Exception as error:  # pylint: disable=broad-except
+            if attempts + 1 >= self.__max_attempts:
+                self.__logger.error("Registration %s failed: %s", ticket, error)
+                recorded = self.__journal.fail(ticket, token, str(error))
+            else:
+                delay = min(self.__base_delay * 2 ** attempts, self.__max_delay)
+                recorded = self.__journal.retry(
+                    ticket, token, str(error), delay * random.uniform(0.5, 1)  # nosec
+                )
+        else:
+            recorded = self.__journal.complete(ticket, token)
+        if not recorded:
+            self.__logger.warning("Registration %s was claimed by another worker", ticket)
+        return True
+
+    def pending(self) -> int:
+        """Count the registrations not yet sent.
+
+        Returns:
+            int: Pending registrations.
+        """
+        return self.__journal.pending()
@@ -1,20 +1,109 @@
 """Users Manager module."""
-from typing import Optional
-from app.v1.clients import SystemProvider
-from app.v1.models import Client
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import asyncio
+import time
+from app.v1.clients import SystemProvider, AsyncSystemProvider, AsyncConnector
+from app.v1.models import Client, Registration
+from app.v1.use_cases.registrations import RegistrationWorker
+from app.v1.utils.cache import HIT, MISS, STALE, TTLCache, record_cache_read
+from app.v1.utils.concurrency import BackgroundRefresh
+from app.v1.utils.errors import AlreadyExistsError
+from app.v1.utils.log import log_cache_outcome
 
 
 class UsersManager():
     """Class to manage users."""
 
-    def __init__(self, connector: SystemProvider):
+    def __init__(
+        self,
+        connector: SystemProvider,
+        cache: Optional[TTLCache[Client]] = None,
+        async_connector: Optional[AsyncSystemProvider] = None,
+        registrations: Optional[RegistrationWorker] = None,
+        refresh: Optional[BackgroundRefresh] = None,
+        max_concurrency: Optional[int] = None,
+    ):
         """Initialize the users manager.
 
         Args:
             connector (SystemProvider): Connector to the system.
-            logger (Logger): Logger to use.
+            cache (Optional[TTLCache[Client]]): Cache of lookups by document.
+            async_connector (Optional[AsyncSystemProvider]): Connector used by the
+                async methods. Defaults to `connector` run in a thread pool.
+            registrations (Optional[RegistrationWorker]): Sends new users in the
+                background. New users are sent right away when it is not given.
+            refresh (Optional[BackgroundRefresh]): Refreshes the users served
+                stale while the cache is in its grace period.
+            max_concurrency (Optional[int]): Max upstream calls a single caller
+                makes at the same time, like the connector bulkhead size. Larger
+                fan-outs are reduced to it.
         """
         self.__connector = connector
+        self.__cache: TTLCache[Client] = cache if cache else TTLCache(maxsize=0)
+        self.__async_connector = (
+            async_connector if async_connector else AsyncConnector(connector)
+        )
+        self.__registrations = registrations
+        self.__refresh = refresh if refresh else BackgroundRefresh()
+        self.__max_concurrency = max_concurrency
+
+    def __limit(self, concurrency: int) -> int:
+        """Reduce the concurrency asked by a caller to the max allowed."""
+        if self.__max_concurrency is None:
+            return concurrency
+        return min(concurrency, self.__max_concurrency)
+
+    def __check_not_cached(self, document: int) -> None:
+        """Reject a new user already known to exist without asking the connector.
+
+        Only found users are trusted, a cached "not found" is always checked again.
+        """
+        found, user = self.__cache.get(document)
+        if found and user is not None and user.document == document:
+            raise AlreadyExistsError("Client already exists")
+
+    @staticmethod
+    def __get_age(user: Optional[Client], cached_age: float = 0) -> float:
+        """Get the seconds since a user was read from the system.
+
+        Users answered from a connector's local copy carry when they were read.
+        """
+        fetched_at = getattr(user, "fetched_at", None)
+        if fetched_at is None:
+            return cached_age
+        return max(cached_age, time.time() - fetched_at)
+
+    def __get_cached(self, document: int) -> Tuple[bool, Optional[Client]]:
+        """Get a cached user, refreshing it in the background when it is stale."""
+        found, user, age = self.__cache.get_with_age(document)
+        if found:
+            log_cache_outcome("users", True)
+            record_cache_read(HIT, self.__get_age(user, age))
+            return True, user
+        stale = self.__cache.get_stale(document)
+        if stale:
+            user, age = stale
+            self.__refresh.schedule(document, lambda: self.__refresh_user(document))
+            log_cache_outcome("users", True)
+            record_cache_read(STALE, self.__get_age(user, age))
+            return True, user
+        log_cache_outcome("users", False)
+        return False, None
+
+    def __fetch(self, document: int) -> Optional[Client]:
+        """Get a user from the connector and cache it."""
+        user = self.__connector.get_client(document)
+        self.__cache.set(document, user)
+        return user
+
+    def __refresh_user(self, document: int) -> Optional[Client]:
+        """Get a stale user from the system itself and cache it.
+
+        A connector's local copy may be as old as the stale user, so it is skipped.
+        """
+        user = self.__connector.get_fresh_client(document)
+        self.__cache.set(document, user)
+        return user
 
     def get_user(self, document: int) -> Optional[Client]:
         """Get user by document.
@@ -25,7 +114,11 @@ class UsersManager():
         Returns:
             dict: User data.
         """
-        user = self.__connector.get_client(document)
+        found, user = self.__get_cached(document)
+        if found:
+            return user
+        user = self.__fetch(document)
+        record_cache_read(MISS, self.__get_age(user))
         return user
 
     def upload_user(self, user: Client) -> None:
@@ -33,13 +126,162 @@ class UsersManager():
 
         Args:
             user (dict): User data.
+
+        Raises:
+            SendDataError: Raised when the user already exists.
         """
-        self.__connector.upload_client(user)
+        self.__check_not_cached(user.document)
+        try:
+            self.__connector.upload_client(user)
+        finally:
+            self.__cache.invalidate(user.document)
+
+    @property
+    def queues_registrations(self) -> bool:
+        """Whether new users are sent in the background."""
+        return self.__registrations is not None
 
-    def update_user(self, user: Client) -> None:
+    def enqueue_user(self, user: Client) -> str:
+        """Journal a new user to upload it in the background.
+
+        Args:
+            user (Client): User data.
+
+        Raises:
+            SendDataError: Raised when the user is known to exist.
+
+        Returns:
+            str: Ticket to follow the registration.
+        """
+        if self.__registrations is None:
+            raise RuntimeError("Background registrations are not enabled")
+        self.__check_not_cached(user.document)
+        return self.__registrations.submit(user)
+
+    def get_registration(self, ticket: str) -> Optional[Registration]:
+        """Get the progress of a background registration.
+
+        Args:
+            ticket (str): Ticket returned by `enqueue_user`.
+
+        Returns:
+            Optional[Registration]: Registration, None when the ticket is unknown.
+        """
+        if self.__registrations is None:
+            return None
+        return self.__registrations.get(ticket)
+
+    def update_user(self, user: Client, current: Optional[Client] = None) -> None:
         """Update user in the system.
 
         Args:
             user (dict): User data.
+            current (Optional[Client]): User returned by `get_user`, lets the
+                connector skip searching it again.
+        """
+        try:
+            self.__connector.update_client(user, current)
+        finally:
+            self.__cache.invalidate(user.document)
+
+    def iter_users(self, page_size: int = 100, prefetch: int = 2) -> Iterator[Client]:
+        """Walk every user of the system, a page at a time.
+
+        Args:
+            page_size (int): Users requested per call.
+            prefetch (int): Calls made ahead of the consumer.
+
+        Yields:
+            Iterator[Client]: Users in the order of the system.
+        """
+        return self.__connector.iter_clients(page_size, self.__limit(prefetch))
+
+    async def get_user_async(self, document: int) -> Optional[Client]:
+        """Get user by document without blocking the event loop.
+
+        Args:
+            document (int): Document to search.
+
+        Returns:
+            Optional[Client]: User data.
+        """
+        found, user = self.__get_cached(document)
+        if found:
+            return user
+        user = await self.__async_connector.get_client(document)
+        self.__cache.set(document, user)
+        record_cache_read(MISS, self.__get_age(user))
+        return user
+
+    async def get_users_async(
+        self, documents: List[int], max_concurrency: int = 8
+    ) -> Dict[int, Union[Client, None, Exception]]:
+        """Get several users at the same time.
+
+        Args:
+            documents (List[int]): Documents to search. Duplicates are searched once.
+            max_concurrency (int): Max lookups running at the same time.
+
+        Returns:
+            Dict[int, Union[Client, None, Exception]]: User, None when it doesn't
+                exist or the error raised while searching it, by document.
+        """
+        semaphore = asyncio.Semaphore(self.__limit(max_concurrency))
+        unique_documents = list(dict.fromkeys(documents))
+
+        async def lookup(document: int) -> Optional[Client]:
+            async with semaphore:
+                return await self.get_user_async(document)
+
+        results = await asyncio.gather(
+            *(lookup(document) for document in unique_documents), return_exceptions=True
+        )
+        users: Dict[int, Union[Client, None, Exception]] = {}
+        for document, result in zip(unique_documents, results):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+            users[document] = result
+        return users
+
+    async def upload_user_async(self, user: Client) -> None:
+        """Upload user in the system without blocking the event loop.
+
+        Args:
+            user (Client): User data.
+
+        Raises:
+            SendDataError: Raised when the user already exists.
+        """
+        self.__check_not_cached(user.document)
+        try:
+            await self.__async_connector.upload_client(user)
+        finally:
+            self.__cache.invalidate(user.document)
+
+    async def update_user_async(self, user: Client, current: Optional[Client] = None) -> None:
+        """Update user in the system without blocking the event loop.
+
+        Args:
+            user (Client): User data.
+            current (Optional[Client]): User returned by `get_user_async`.
+        """
+        try:
+            await self.__async_connector.update_client(user, current)
+        finally:
+            self.__cache.invalidate(user.document)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Get lookup cache counters.
+
+        Returns:
+            Dict[str, int]: Hits, misses, evictions and current size.
+        """
+        return self.__cache.stats()
+
+    def refresh_stats(self) -> Dict[str, int]:
+        """Get background refresh counters.
+
+        Returns:
+            Dict[str, int]: Refreshes scheduled, skipped, failed and waiting.
         """
-        self.__connector.update_client(user)
+        return self.__refresh.stats()
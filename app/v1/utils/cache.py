@@ -0,0 +1,199 @@
+"""In-process caches and the freshness of the cached data served by a request."""
+
+from typing import Any, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+from collections import OrderedDict
+from contextvars import ContextVar, Token
+import threading
+import time
+
+
+Value = TypeVar("Value")
+
+HIT = "hit"
+STALE = "stale"
+MISS = "miss"
+# the worst freshness read by a request is the one reported
+_SEVERITY = {HIT: 0, MISS: 1, STALE: 2}
+
+_reads: ContextVar[Optional[Dict[str, Any]]] = ContextVar("cache_reads", default=None)
+
+
+def start_cache_reads() -> Token[Optional[Dict[str, Any]]]:
+    """Start tracking the cached data served by a request.
+
+    Returns:
+        Token[Optional[Dict[str, Any]]]: Token to stop tracking.
+    """
+    return _reads.set({})
+
+
+def reset_cache_reads(token: Token[Optional[Dict[str, Any]]]) -> None:
+    """Stop tracking the cached data of a request.
+
+    Args:
+        token (Token[Optional[Dict[str, Any]]]): Token returned by `start_cache_reads`.
+    """
+    _reads.reset(token)
+
+
+def record_cache_read(freshness: str, age: float = 0) -> None:
+    """Note a value served by the current request.
+
+    Args:
+        freshness (str): HIT for a fresh cached value, STALE for a value served
+            while it is refreshed, MISS for a value fetched from the upstream.
+        age (float): Seconds since the value was fetched from the upstream.
+    """
+    reads = _reads.get()
+    if reads is None:
+        return
+    if _SEVERITY[freshness] >= _SEVERITY[reads.get("freshness", HIT)]:
+        reads["freshness"] = freshness
+    reads["age"] = max(reads.get("age", 0.0), age)
+
+
+def get_cache_reads() -> Optional[Tuple[str, float]]:
+    """Get the freshness of the data served by the current request.
+
+    Returns:
+        Optional[Tuple[str, float]]: Worst freshness and age of the oldest
+            value, None when the request read no cached data.
+    """
+    reads = _reads.get()
+    if not reads:
+        return None
+    return reads["freshness"], reads["age"]
+
+
+class TTLCache(Generic[Value]):
+    """Thread safe cache with time to live and LRU eviction.
+
+    `None` values are cached as negative results and expire after
+    `negative_ttl` seconds, so a missing key is not searched again on every
+    request but appears quickly once it is created.
+
+    Expired values are kept `grace` more seconds, `get_stale` returns them
+    while they are refreshed. Negative results are never served stale.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60,
+        negative_ttl: Optional[float] = None,
+        grace: float = 0,
+    ):
+        """Initialize the cache.
+
+        Args:
+            maxsize (int): Max number of entries before evicting the least recently used.
+            ttl (float): Seconds a value is kept.
+            negative_ttl (Optional[float]): Seconds a `None` value is kept. Defaults to `ttl`.
+            grace (float): Seconds an expired value can still be served stale.
+        """
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.__grace = grace
+        self.__lock = threading.Lock()
+        self.__entries: "OrderedDict[Hashable, Tuple[float, float, Optional[Value]]]" = OrderedDict()
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[Value]]:
+        """Get a cached value.
+
+        Args:
+            key (Hashable): Cache key.
+
+        Returns:
+            Tuple[bool, Optional[Value]]: Whether the key was found and its value.
+        """
+        found, value, _ = self.get_with_age(key)
+        return found, value
+
+    def get_with_age(self, key: Hashable) -> Tuple[bool, Optional[Value], float]:
+        """Get a cached value and the seconds since it was stored.
+
+        Args:
+            key (Hashable): Cache key.
+
+        Returns:
+            Tuple[bool, Optional[Value], float]: Whether the key was found, its
+                value and its age.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            now = time.monotonic()
+            if entry is None or entry[1] <= now:
+                if entry is not None and (entry[2] is None or entry[1] + self.__grace <= now):
+                    del self.__entries[key]
+                self.__misses += 1
+                return False, None, 0.0
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return True, entry[2], now - entry[0]
+
+    def get_stale(self, key: Hashable) -> Optional[Tuple[Value, float]]:
+        """Get an expired value still within the grace period.
+
+        Args:
+            key (Hashable): Cache key.
+
+        Returns:
+            Optional[Tuple[Value, float]]: Value and seconds since it was stored,
+                None when there is no stale value.
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            now = time.monotonic()
+            if entry is None or entry[2] is None or entry[1] + self.__grace <= now:
+                return None
+            return entry[2], now - entry[0]
+
+    def set(self, key: Hashable, value: Optional[Value]) -> None:
+        """Store a value, `None` is stored as a negative result.
+
+        Args:
+            key (Hashable): Cache key.
+            value (Optional[Value]): Value to store.
+        """
+        ttl = self.__negative_ttl if value is None else self.__ttl
+        if ttl <= 0 or self.__maxsize <= 0:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            self.__entries[key] = (now, now + ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+                self.__evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Remove a key from the cache.
+
+        Args:
+            key (Hashable): Cache key.
+        """
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self.__lock:
+            self.__entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache counters.
+
+        Returns:
+            Dict[str, int]: Hits, misses, evictions and current size.
+        """
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "size": len(self.__entries),
+            }
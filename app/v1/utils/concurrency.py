@@ -0,0 +1,185 @@
+"""Concurrency helpers."""
+
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Set, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from app.v1.utils.deadline import get_remaining
+from app.v1.utils.errors import DeadlineExceededError
+
+
+Value = TypeVar("Value")
+
+
+class _Call(Generic[Value]):
+    """Call in flight shared by every caller with the same key."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Optional[Value] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[Value]):
+    """Run at most one call per key at a time.
+
+    Callers arriving while a call with the same key is in flight wait for it
+    and receive its result or its error. A caller stops waiting when the
+    deadline of its own request passes.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the group."""
+        self.__lock = threading.Lock()
+        self.__calls: Dict[Hashable, _Call[Value]] = {}
+        self.__executed = 0
+        self.__coalesced = 0
+
+    def do(self, key: Hashable, function: Callable[[], Value]) -> Value:
+        """Run `function` or join the call in flight for `key`.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            function (Callable[[], Value]): Call to run.
+
+        Raises:
+            DeadlineExceededError: Raised when the deadline passes while waiting
+                for the call in flight.
+
+        Returns:
+            Value: Result of the shared call.
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if call is None:
+                call = _Call()
+                self.__calls[key] = call
+                self.__executed += 1
+            else:
+                self.__coalesced += 1
+
+        if not leader:
+            remaining = get_remaining()
+            if not call.done.wait(None if remaining is None else max(remaining, 0)):
+                raise DeadlineExceededError("Request deadline exceeded waiting for a call in flight")
+            if call.error is not None:
+                raise call.error
+            return call.result  # type: ignore
+
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Get call counters.
+
+        Returns:
+            Dict[str, int]: Calls executed and calls that joined one in flight.
+        """
+        with self.__lock:
+            return {"executed": self.__executed, "coalesced": self.__coalesced}
+
+
+class BackgroundRefresh:
+    """Run refreshes of stale values in a background thread pool, once per key at a time.
+
+    Refreshes don't run in the context of the request that scheduled them,
+    so its deadline doesn't cut them short. Threads don't survive a fork, so
+    each uWSGI worker builds its own pool.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 1000):
+        """Initialize the pool.
+
+        Args:
+            max_workers (int): Refreshes running at the same time.
+            max_pending (int): Refreshes waiting before new ones are skipped.
+        """
+        self.__max_workers = max_workers
+        self.__max_pending = max_pending
+        self.__lock = threading.Lock()
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__pid: Optional[int] = None
+        self.__pending: Set[Hashable] = set()
+        self.__counts = {"scheduled": 0, "skipped": 0, "failed": 0}
+
+    def schedule(self, key: Hashable, function: Callable[[], Any]) -> bool:
+        """Run `function` in the background unless a refresh of `key` is waiting.
+
+        Args:
+            key (Hashable): Identifies the refreshed value.
+            function (Callable[[], Any]): Fetches and stores the value.
+
+        Returns:
+            bool: Whether the refresh was scheduled.
+        """
+        with self.__lock:
+            if self.__executor is None or self.__pid != os.getpid():
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.__max_workers, thread_name_prefix="refresh"
+                )
+                self.__pending = set()
+                self.__pid = os.getpid()
+            if key in self.__pending:
+                return False
+            if len(self.__pending) >= self.__max_pending:
+                self.__counts["skipped"] += 1
+                return False
+            self.__pending.add(key)
+            self.__counts["scheduled"] += 1
+            executor = self.__executor
+        executor.submit(self.__run, key, function)
+        return True
+
+    def __run(self, key: Hashable, function: Callable[[], Any]) -> None:
+        """Run a refresh, counting its failure."""
+        try:
+            function()
+        except Exception:  # pylint: disable=broad-except
+            with self.__lock:
+                self.__counts["failed"] += 1
+        finally:
+            with self.__lock:
+                self.__pending.discard(key)
+
+    def stats(self) -> Dict[str, int]:
+        """Get refresh counters of the current worker.
+
+        Returns:
+            Dict[str, int]: Refreshes scheduled, skipped, failed and waiting.
+        """
+        with self.__lock:
+            stats = dict(self.__counts)
+            stats["pending"] = len(self.__pending) if self.__pid == os.getpid() else 0
+            return stats
+
+
+def run_in_each_worker(function: Callable[[], None]) -> None:
+    """Run `function` in every worker process as soon as it starts.
+
+    uWSGI loads the app in the master and forks the workers, and threads
+    don't survive a fork, so under uWSGI the function runs after each fork.
+    When the app is loaded by the worker itself, like with lazy-apps or
+    outside uWSGI, it runs right away.
+
+    Args:
+        function (Callable[[], None]): Starts the background work of a worker.
+    """
+    try:
+        import uwsgi  # type: ignore # pylint: disable=import-outside-toplevel,import-error
+        import uwsgidecorators  # type: ignore # pylint: disable=import-outside-toplevel,import-error
+    except ImportError:
+        function()
+        return
+    if uwsgi.worker_id():
+        function()
+    else:
+        uwsgidecorators.postfork(function)
@@ -0,0 +1,141 @@
+"""Time budget of the current request."""
+
+from typing import Dict, Iterator, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+import time
+from app.v1.utils.errors import DeadlineExceededError
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def set_deadline(seconds: Optional[float]) -> Token[Optional[float]]:
+    """Give the current context `seconds` to finish. None removes the deadline.
+
+    Args:
+        seconds (Optional[float]): Time budget.
+
+    Returns:
+        Token[Optional[float]]: Token to restore the previous deadline.
+    """
+    return _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+def reset_deadline(token: Token[Optional[float]]) -> None:
+    """Restore the deadline replaced by `set_deadline`.
+
+    Args:
+        token (Token[Optional[float]]): Token returned by `set_deadline`.
+    """
+    _deadline.reset(token)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]) -> Iterator[None]:
+    """Run a block with a time budget.
+
+    Args:
+        seconds (Optional[float]): Time budget, None for no deadline.
+    """
+    token = set_deadline(seconds)
+    try:
+        yield
+    finally:
+        reset_deadline(token)
+
+
+def get_remaining() -> Optional[float]:
+    """Get the seconds left before the deadline.
+
+    Returns:
+        Optional[float]: Seconds left, None when there is no deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def limit_timeout(timeout: float) -> float:
+    """Shorten a timeout to the time left before the deadline.
+
+    Args:
+        timeout (float): Timeout of a single call.
+
+    Raises:
+        DeadlineExceededError: Raised when the deadline has already passed.
+
+    Returns:
+        float: Timeout that ends no later than the deadline.
+    """
+    remaining = get_remaining()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceededError("Request deadline exceeded, the call was not sent")
+    return min(timeout, remaining)
+
+
+class DeadlinePolicy:
+    """Time budget given to each endpoint."""
+
+    def __init__(
+        self,
+        default: float = 30,
+        endpoints: Optional[Dict[str, float]] = None,
+        header: str = "X-Request-Timeout",
+    ):
+        """Initialize the policy.
+
+        Args:
+            default (float): Seconds given to endpoints without their own budget.
+            endpoints (Optional[Dict[str, float]]): Seconds by endpoint name. 0
+                disables the deadline of an endpoint.
+            header (str): Header a caller can use to ask for a shorter budget.
+        """
+        self.__default = default
+        self.__endpoints = endpoints if endpoints else {}
+        self.__header = header
+
+    @property
+    def header(self) -> str:
+        """Header used to ask for a shorter budget."""
+        return self.__header
+
+    def get_budget(self, endpoint: Optional[str], requested: Optional[str]) -> Optional[float]:
+        """Get the budget of a request.
+
+        Args:
+            endpoint (Optional[str]): Flask endpoint name.
+            requested (Optional[str]): Seconds asked by the caller in the header.
+                It can only shorten the endpoint budget.
+
+        Returns:
+            Optional[float]: Seconds, None when the request has no deadline.
+        """
+        budget = self.__endpoints.get(endpoint or "", self.__default)
+        try:
+            asked = float(requested) if requested else None
+        except ValueError:
+            asked = None
+        if asked is not None and asked > 0:
+            budget = min(budget, asked) if budget > 0 else asked
+        return budget if budget > 0 else None
+
+    @staticmethod
+    def parse_endpoints(raw: str) -> Dict[str, float]:
+        """Parse budgets written as `endpoint=seconds,endpoint=seconds`.
+
+        Args:
+            raw (str): Budgets to parse.
+
+        Returns:
+            Dict[str, float]: Seconds by endpoint name.
+        """
+        endpoints: Dict[str, float] = {}
+        for item in raw.split(","):
+            if "=" in item:
+                endpoint, seconds = item.split("=", 1)
+                endpoints[endpoint.strip()] = float(seconds)
+        return endpoints
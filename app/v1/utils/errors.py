@@ -1,5 +1,8 @@
 """Application errors."""
 
+from typing import Optional
+from http import HTTPStatus
+
 
 class CredentialsError(Exception):
     """Raised when the app can't authenticate with the server."""
@@ -11,3 +14,72 @@ class FetchDataError(Exception):
 
 class SendDataError(Exception):
     """Raised when the app can't send data to the server."""
+
+
+class AlreadyExistsError(SendDataError):
+    """Raised when a new client is already registered in the server."""
+
+
+class FileTooLargeError(Exception):
+    """Raised when an uploaded file exceeds the size allowed."""
+
+
+class UpstreamUnavailableError(Exception):
+    """Raised when a call to the server is rejected without sending it."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        """Initialize the error.
+
+        Args:
+            message (str): Error message.
+            retry_after (Optional[float]): Seconds before a new call can succeed, when known.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(UpstreamUnavailableError):
+    """Raised when a call would exceed the rate allowed by the server."""
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the time budget of a request runs out."""
+
+
+def get_upstream_error_status(error: BaseException) -> Optional[HTTPStatus]:
+    """Get the status of an error caused by the protections around upstream calls.
+
+    Connectors wrap the errors of their calls, so the whole chain of causes is checked.
+
+    Args:
+        error (BaseException): Error to check.
+
+    Returns:
+        Optional[HTTPStatus]: 504 for exhausted deadlines, 503 for rejected calls
+            and None for any other error.
+    """
+    cause: Optional[BaseException] = error
+    while cause is not None:
+        if isinstance(cause, DeadlineExceededError):
+            return HTTPStatus.GATEWAY_TIMEOUT
+        if isinstance(cause, UpstreamUnavailableError):
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        cause = cause.__cause__
+    return None
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Get the seconds a client should wait before retrying a rejected call.
+
+    Args:
+        error (BaseException): Error to check, with its causes.
+
+    Returns:
+        Optional[float]: Seconds, None when unknown.
+    """
+    cause: Optional[BaseException] = error
+    while cause is not None:
+        if isinstance(cause, UpstreamUnavailableError):
+            return cause.retry_after
+        cause = cause.__cause__
+    return None
@@ -0,0 +1,241 @@
+"""Logging pipeline and request log context."""
+
+from typing import Any, Dict, List, Optional, Tuple
+from contextvars import ContextVar, Token
+from logging.handlers import QueueListener
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_context", default=None)
+
+# LogRecord attributes that are not extra fields
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "context", "asctime"}
+
+
+def start_log_context(**fields: Any) -> Token[Optional[Dict[str, Any]]]:
+    """Start the log context of a request.
+
+    Args:
+        **fields: Fields added to every record logged by the request, like its id.
+
+    Returns:
+        Token[Optional[Dict[str, Any]]]: Token to restore the previous context.
+    """
+    return _context.set(dict(fields))
+
+
+def reset_log_context(token: Token[Optional[Dict[str, Any]]]) -> None:
+    """Restore the log context replaced by `start_log_context`.
+
+    Args:
+        token (Token[Optional[Dict[str, Any]]]): Token returned by `start_log_context`.
+    """
+    _context.reset(token)
+
+
+def get_log_context() -> Dict[str, Any]:
+    """Get a copy of the log context of the current request.
+
+    Returns:
+        Dict[str, Any]: Context fields, empty outside a request.
+    """
+    context = _context.get()
+    return copy.deepcopy(context) if context else {}
+
+
+def log_upstream_call(operation: str, seconds: float, error: Optional[str] = None) -> None:
+    """Add an upstream call to the totals of the current request.
+
+    Args:
+        operation (str): Name of the call, like "search".
+        seconds (float): Duration of the call.
+        error (Optional[str]): Error of the call, None when it succeeded.
+    """
+    context = _context.get()
+    if context is None:
+        return
+    totals = context.setdefault("upstream", {}).setdefault(
+        operation, {"calls": 0, "seconds": 0.0, "errors": 0}
+    )
+    totals["calls"] += 1
+    totals["seconds"] = round(totals["seconds"] + seconds, 6)
+    if error:
+        totals["errors"] += 1
+
+
+def log_cache_outcome(cache: str, hit: bool) -> None:
+    """Count a cache lookup of the current request.
+
+    Args:
+        cache (str): Name of the cache, like "users".
+        hit (bool): Whether the value was found.
+    """
+    context = _context.get()
+    if context is None:
+        return
+    outcomes = context.setdefault("cache", {}).setdefault(cache, {"hit": 0, "miss": 0})
+    outcomes["hit" if hit else "miss"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines with their request context and extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a record.
+
+        Args:
+            record (logging.LogRecord): Record to format.
+
+        Returns:
+            str: JSON line.
+        """
+        line: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        line.update(getattr(record, "context", {}))
+        line.update(
+            (key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS
+        )
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            line["exception"] = record.exc_text
+        return json.dumps(line, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `max_records` records per key and interval.
+
+    Only records logged with a `rate_limit` extra field are limited, the
+    field names the key. The first record of each interval tells how many
+    were dropped in the previous one.
+    """
+
+    def __init__(self, max_records: int = 1, interval: float = 60):
+        """Initialize the filter.
+
+        Args:
+            max_records (int): Records let through per key and interval.
+            interval (float): Seconds of each interval.
+        """
+        super().__init__()
+        self.__max_records = max_records
+        self.__interval = interval
+        self.__lock = threading.Lock()
+        self.__windows: Dict[str, Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Check whether a record is let through.
+
+        Args:
+            record (logging.LogRecord): Record to check.
+
+        Returns:
+            bool: False when the record is dropped.
+        """
+        key = getattr(record, "rate_limit", None)
+        if key is None:
+            return True
+        now = time.monotonic()
+        with self.__lock:
+            started_at, passed, dropped = self.__windows.get(key, (now, 0, 0))
+            if now - started_at >= self.__interval:
+                if dropped:
+                    record.suppressed = dropped
+                started_at, passed, dropped = now, 0, 0
+            if passed >= self.__max_records:
+                self.__windows[key] = (started_at, passed, dropped + 1)
+                return False
+            self.__windows[key] = (started_at, passed + 1, dropped)
+            return True
+
+
+class QueueLogHandler(logging.Handler):
+    """Hand records to a background thread that writes them.
+
+    The request thread only copies the record and its request context into
+    a queue. A listener thread per worker formats the records and writes them
+    with `handlers`. uWSGI forks after the app is loaded, so the queue and
+    the listener are created the first time a process logs. When the queue
+    is full, records are dropped instead of blocking the request.
+    """
+
+    def __init__(self, handlers: List[logging.Handler], maxsize: int = 10_000):
+        """Initialize the handler.
+
+        Args:
+            handlers (List[logging.Handler]): Handlers that write the records.
+            maxsize (int): Max records waiting to be written.
+        """
+        super().__init__()
+        self.__handlers = handlers
+        self.__maxsize = maxsize
+        self.__start_lock = threading.Lock()
+        self.__queue: Optional["queue.Queue[logging.LogRecord]"] = None
+        self.__listener: Optional[QueueListener] = None
+        self.__pid: Optional[int] = None
+        self.__running = False
+        self.dropped = 0
+
+    def __get_queue(self) -> "queue.Queue[logging.LogRecord]":
+        """Get the queue of the current process, starting its listener."""
+        if self.__pid != os.getpid():
+            with self.__start_lock:
+                if self.__pid != os.getpid():
+                    records: "queue.Queue[logging.LogRecord]" = queue.Queue(self.__maxsize)
+                    listener = QueueListener(records, *self.__handlers, respect_handler_level=True)
+                    listener.start()
+                    self.__running = True
+                    self.__queue = records
+                    self.__listener = listener
+                    self.__pid = os.getpid()
+                    self.dropped = 0
+        assert self.__queue is not None
+        return self.__queue
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Queue a record with the context of the current request.
+
+        Args:
+            record (logging.LogRecord): Record to write.
+        """
+        try:
+            prepared = copy.copy(record)
+            prepared.msg = record.getMessage()
+            prepared.args = None
+            prepared.context = get_log_context()
+            self.__get_queue().put_nowait(prepared)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def __is_running(self) -> bool:
+        """Check whether the listener of the current process is running."""
+        return self.__listener is not None and self.__running and self.__pid == os.getpid()
+
+    def flush(self) -> None:
+        """Wait until the queued records of the current process are written."""
+        with self.__start_lock:
+            if self.__is_running():
+                assert self.__listener is not None
+                self.__listener.stop()
+                self.__listener.start()
+
+    def close(self) -> None:
+        """Write the queued records and stop the listener."""
+        with self.__start_lock:
+            if self.__is_running():
+                assert self.__listener is not None
+                self.__listener.stop()
+                self.__running = False
+        super().close()
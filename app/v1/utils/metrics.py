@@ -0,0 +1,288 @@
+"""Metrics shared by every worker of the instance."""
+
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+Labels = Tuple[Tuple[str, str], ...]
+Collector = Callable[[], Mapping[str, Any]]
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Format labels as `{name="value",...}`."""
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for name, value in items
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _flatten(values: Mapping[str, Any], prefix: str) -> Dict[str, float]:
+    """Flatten nested numeric statistics into metric names."""
+    flat: Dict[str, float] = {}
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, Mapping):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def _is_alive(pid: int) -> bool:
+    """Check whether a process still exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Counter:
+    """Value that only goes up."""
+
+    def __init__(self, registry: "MetricsRegistry", name: str):
+        self.__registry = registry
+        self.__name = name
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        """Increase the counter.
+
+        Args:
+            value (float): Amount to add.
+            **labels: Label values of the series.
+        """
+        self.__registry.add_sample(self.__name, labels, value)
+
+
+class Histogram:
+    """Distribution of observed values."""
+
+    def __init__(self, registry: "MetricsRegistry", name: str):
+        self.__registry = registry
+        self.__name = name
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record a value.
+
+        Args:
+            value (float): Observed value, like a duration in seconds.
+            **labels: Label values of the series.
+        """
+        self.__registry.add_sample(self.__name, labels, value)
+
+
+class MetricsRegistry:
+    """Counters and histograms aggregated across the uWSGI workers.
+
+    Each process keeps its values in memory and a background thread writes
+    them to its own file in `directory`. A scrape adds up the files of every
+    process, so it reflects the whole instance whichever worker answers it.
+    Files of finished workers are kept so counters don't go back, which means
+    the directory must be emptied when the instance starts.
+
+    Collectors report the statistics a process already keeps, like cache or
+    pool counters. They are exposed as gauges summed over the live workers.
+    """
+
+    def __init__(
+        self,
+        directory: str = os.path.join(tempfile.gettempdir(), "metrics"),
+        flush_interval: float = 1,
+        namespace: str = "pos_connector",
+    ):
+        """Initialize the registry.
+
+        Args:
+            directory (str): Directory shared by the workers.
+            flush_interval (float): Seconds between writes of the process values.
+            namespace (str): Prefix of every metric name.
+        """
+        self.__directory = directory
+        self.__flush_interval = flush_interval
+        self.__namespace = namespace
+        self.__lock = threading.Lock()
+        self.__definitions: Dict[str, Dict[str, Any]] = {}
+        self.__collectors: List[Tuple[str, Collector]] = []
+        self.__values: Dict[str, Dict[Labels, List[float]]] = {}
+        self.__pid: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def __define(self, name: str, kind: str, description: str, buckets: Sequence[float] = ()) -> str:
+        """Register a metric, keeping the first definition of a name."""
+        full_name = f"{self.__namespace}_{name}"
+        with self.__lock:
+            self.__definitions.setdefault(
+                full_name, {"kind": kind, "help": description, "buckets": sorted(buckets)}
+            )
+        return full_name
+
+    def counter(self, name: str, description: str) -> Counter:
+        """Get a counter.
+
+        Args:
+            name (str): Metric name without the namespace.
+            description (str): Help text.
+
+        Returns:
+            Counter: Counter writing to this registry.
+        """
+        return Counter(self, self.__define(name, "counter", description))
+
+    def histogram(
+        self, name: str, description: str, buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Get a histogram.
+
+        Args:
+            name (str): Metric name without the namespace.
+            description (str): Help text.
+            buckets (Sequence[float]): Upper bounds of the buckets.
+
+        Returns:
+            Histogram: Histogram writing to this registry.
+        """
+        return Histogram(self, self.__define(name, "histogram", description, buckets))
+
+    def add_collector(self, prefix: str, collector: Collector) -> None:
+        """Expose the statistics returned by `collector` as gauges.
+
+        Args:
+            prefix (str): Prefix of the gauge names, without the namespace.
+            collector (Collector): Returns the current statistics of the process.
+                Nested dictionaries are flattened into the names.
+        """
+        with self.__lock:
+            self.__collectors.append((f"{self.__namespace}_{prefix}", collector))
+
+    def __ensure_process(self) -> None:
+        """Drop values inherited from the parent and start the flush thread.
+
+        Must be called holding the lock.
+        """
+        if self.__pid == os.getpid():
+            return
+        self.__pid = os.getpid()
+        self.__values = {}
+        thread = threading.Thread(target=self.__run, name="metrics-flush", daemon=True)
+        thread.start()
+
+    def add_sample(self, name: str, labels: Mapping[str, str], value: float) -> None:
+        """Add a value to a counter or a histogram.
+
+        Args:
+            name (str): Full metric name.
+            labels (Mapping[str, str]): Label values of the series.
+            value (float): Value to add or observe.
+        """
+        definition = self.__definitions[name]
+        key: Labels = tuple(sorted((label, str(label_value)) for label, label_value in labels.items()))
+        with self.__lock:
+            self.__ensure_process()
+            series = self.__values.setdefault(name, {})
+            if definition["kind"] == "counter":
+                totals = series.setdefault(key, [0.0])
+                totals[0] += value
+                return
+            buckets = definition["buckets"]
+            totals = series.setdefault(key, [0.0] * (len(buckets) + 2))
+            for position, bound in enumerate(buckets):
+                if value <= bound:
+                    totals[position] += 1
+            totals[-2] += value
+            totals[-1] += 1
+
+    def __collect(self) -> Dict[str, float]:
+        """Read the statistics of the collectors."""
+        gauges: Dict[str, float] = {}
+        for prefix, collector in list(self.__collectors):
+            try:
+                gauges.update(_flatten(collector(), prefix))
+            except Exception:  # pylint: disable=broad-except
+                continue
+        return gauges
+
+    def __run(self) -> None:
+        """Write the process values periodically."""
+        pid = os.getpid()
+        while self.__pid == pid:
+            time.sleep(self.__flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                continue
+
+    def flush(self) -> None:
+        """Write the values of the current process to its file."""
+        with self.__lock:
+            self.__ensure_process()
+            values = {
+                name: [[list(map(list, key)), totals[:]] for key, totals in series.items()]
+                for name, series in self.__values.items()
+            }
+        snapshot = {"pid": os.getpid(), "values": values, "gauges": self.__collect()}
+        path = os.path.join(self.__directory, f"{os.getpid()}.json")
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, path)
+
+    def __read_all(self) -> Tuple[Dict[str, Dict[Labels, List[float]]], Dict[str, float]]:
+        """Add up the files of every process."""
+        values: Dict[str, Dict[Labels, List[float]]] = {}
+        gauges: Dict[str, float] = {}
+        for file_name in os.listdir(self.__directory):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.__directory, file_name), encoding="utf-8") as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            for name, series in snapshot["values"].items():
+                merged = values.setdefault(name, {})
+                for raw_key, totals in series:
+                    key: Labels = tuple((label, value) for label, value in raw_key)
+                    current = merged.get(key)
+                    merged[key] = totals if current is None else [a + b for a, b in zip(current, totals)]
+            if _is_alive(snapshot["pid"]):
+                for name, value in snapshot["gauges"].items():
+                    gauges[name] = gauges.get(name, 0.0) + value
+        return values, gauges
+
+    def render(self) -> str:
+        """Render the metrics of the whole instance in the Prometheus text format.
+
+        Returns:
+            str: Metrics exposition.
+        """
+        self.flush()
+        values, gauges = self.__read_all()
+        lines: List[str] = []
+        for name, definition in sorted(self.__definitions.items()):
+            lines.append(f"# HELP {name} {definition['help']}")
+            lines.append(f"# TYPE {name} {definition['kind']}")
+            for key, totals in sorted(values.get(name, {}).items()):
+                if definition["kind"] == "counter":
+                    lines.append(f"{name}{_format_labels(key)} {totals[0]:g}")
+                    continue
+                for bound, count in zip(definition["buckets"], totals):
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {count:g}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {totals[-1]:g}")
+                lines.append(f"{name}_sum{_format_labels(key)} {totals[-2]:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {totals[-1]:g}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,171 @@
+"""Profiling of single requests."""
+
+from typing import Any, Dict, List, Optional
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import tempfile
+import threading
+import time
+
+
+PROFILE_SUFFIX = ".prof"
+PROFILE_NAME = re.compile(r"^(\d+)-(\d+)-([\w.-]+)-(\d+)ms\.prof$")
+
+
+class RequestProfiler:
+    """Profile requests chosen by a header or a sampling rate.
+
+    Only one request per worker is profiled at a time, so a burst of marked
+    requests can't slow down the whole worker. A profile is kept when the
+    request was marked with the header or took longer than `slow_threshold`.
+    Files are pstats dumps named after the time, the worker, the endpoint and
+    the duration, and only the newest `max_files` are kept.
+
+    Work moved to other threads, like concurrent lookups, is not profiled.
+    """
+
+    def __init__(
+        self,
+        directory: str = os.path.join(tempfile.gettempdir(), "profiles"),
+        sample_rate: float = 0,
+        slow_threshold: float = 1,
+        max_files: int = 200,
+        header: str = "X-Profile",
+    ):
+        """Initialize the profiler.
+
+        Args:
+            directory (str): Directory of the profiles, shared by the workers.
+            sample_rate (float): Share of the requests profiled, from 0 to 1.
+            slow_threshold (float): Seconds after which a sampled request is kept.
+            max_files (int): Profiles kept in the directory.
+            header (str): Header that asks to profile a request.
+        """
+        self.__directory = directory
+        self.__sample_rate = sample_rate
+        self.__slow_threshold = slow_threshold
+        self.__max_files = max_files
+        self.__header = header
+        self.__lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def header(self) -> str:
+        """Header that asks to profile a request."""
+        return self.__header
+
+    def start(self, forced: bool = False) -> Optional[cProfile.Profile]:
+        """Start profiling the current request if it is chosen.
+
+        Args:
+            forced (bool): The request asked to be profiled.
+
+        Returns:
+            Optional[cProfile.Profile]: Running profile, None when the request
+                is not profiled.
+        """
+        if not forced and (self.__sample_rate <= 0 or random.random() >= self.__sample_rate):
+            return None
+        if not self.__lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(
+        self, profile: cProfile.Profile, endpoint: str, duration: float, forced: bool = False
+    ) -> Optional[str]:
+        """Stop a profile and keep it when the request was slow or marked.
+
+        Args:
+            profile (cProfile.Profile): Profile returned by `start`.
+            endpoint (str): Endpoint of the request.
+            duration (float): Seconds the request took.
+            forced (bool): The request asked to be profiled.
+
+        Returns:
+            Optional[str]: Name of the stored profile.
+        """
+        profile.disable()
+        self.__lock.release()
+        if not forced and duration < self.__slow_threshold:
+            return None
+
+        safe_endpoint = re.sub(r"[^\w.-]", "_", endpoint)
+        name = f"{int(time.time() * 1000)}-{os.getpid()}-{safe_endpoint}-{int(duration * 1000)}ms{PROFILE_SUFFIX}"
+        profile.dump_stats(os.path.join(self.__directory, name))
+        self.__rotate()
+        return name
+
+    def __names(self) -> List[str]:
+        """Get the stored profiles, newest first."""
+        names = [name for name in os.listdir(self.__directory) if PROFILE_NAME.match(name)]
+        return sorted(names, reverse=True)
+
+    def __rotate(self) -> None:
+        """Remove the oldest profiles."""
+        for name in self.__names()[self.__max_files:]:
+            try:
+                os.remove(os.path.join(self.__directory, name))
+            except FileNotFoundError:
+                continue
+
+    def list_profiles(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Get the newest profiles.
+
+        Args:
+            limit (int): Max profiles returned.
+
+        Returns:
+            List[Dict[str, Any]]: Name, creation time, worker, endpoint and
+                duration of each profile, newest first.
+        """
+        profiles = []
+        for name in self.__names()[:limit]:
+            match = PROFILE_NAME.match(name)
+            assert match is not None
+            created_at, pid, endpoint, duration = match.groups()
+            profiles.append({
+                "name": name,
+                "created_at": int(created_at) / 1000,
+                "pid": int(pid),
+                "endpoint": endpoint,
+                "duration_ms": int(duration),
+            })
+        return profiles
+
+    def get_path(self, name: str) -> Optional[str]:
+        """Get the path of a stored profile.
+
+        Args:
+            name (str): Profile name.
+
+        Returns:
+            Optional[str]: Path, None when the profile doesn't exist.
+        """
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.__directory, name)
+        return path if os.path.isfile(path) else None
+
+    def summarize(self, name: str, limit: int = 40) -> Optional[str]:
+        """Get the functions with the highest cumulative time of a profile.
+
+        Args:
+            name (str): Profile name.
+            limit (int): Functions listed.
+
+        Returns:
+            Optional[str]: pstats report, None when the profile doesn't exist.
+        """
+        path = self.get_path(name)
+        if path is None:
+            return None
+        output = io.StringIO()
+        stats = pstats.Stats(path, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return output.getvalue()
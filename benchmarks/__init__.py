@@ -0,0 +1 @@
+"""Micro-benchmarks. Run them with `python -m benchmarks.<name>`."""
@@ -0,0 +1,222 @@
+"""CPU time spent parsing PirPos responses and inbound bodies.
+
+Compares the current single-parse pipeline with the previous one, which
+decoded the JSON into dicts, validated it into PirPos shaped models and then
+validated every client a second time. Invoices were built field by field
+from the decoded dicts.
+
+    python -m benchmarks.parsing
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import json
+import time
+from pydantic import BaseModel
+from app.v1.models import (
+    Business,
+    CityDetail,
+    Client,
+    Employee,
+    Invoice,
+    InvoiceProduct,
+    Payment,
+    Product,
+    Responsibilities,
+    TaxInfo,
+)
+from app.v1.clients.pos_system.utils import (
+    ClientResponseValidator,
+    ClientsResponseValidator,
+    get_invoice_from_json,
+)
+
+
+CLIENTS_PER_PAGE = 10
+ROUNDS = 2000
+
+
+def build_clients_body() -> bytes:
+    """Build a PirPos clients search response."""
+    clients = [
+        {
+            "_id": f"64f0c0ffee{index:04d}",
+            "name": f"client {index}",
+            "lastName": "herrera",
+            "document": 1_000_000 + index,
+            "idDocumentType": 13,
+            "checkDigit": None,
+            "email": f"client{index}@mail.com",
+            "phone": "3000000000",
+            "address": "calle 1 # 2 - 3",
+            "responsibilities": "R-99-PN",
+            "cityDetail": {
+                "cityCode": "11001",
+                "countryCode": "CO",
+                "stateCode": "11",
+                "stateName": "Bogota",
+                "cityName": "Bogota",
+            },
+        }
+        for index in range(CLIENTS_PER_PAGE)
+    ]
+    return json.dumps({"data": clients}).encode()
+
+
+def build_invoice_body() -> bytes:
+    """Build a PirPos invoice response."""
+    product = {
+        "code": "P1",
+        "name": "Café",
+        "totalBruto": "12000",
+        "quantity": 2,
+        "paymentMethod": "Efectivo",
+        "value": 24000,
+        "taxes": [{"taxName": "IVA", "taxValue": 19}],
+    }
+    invoice = {
+        "business": {"name": "business", "nit": "900000000"},
+        "seller": {"name": "seller"},
+        "cashier": {"name": "cashier"},
+        "client": {
+            "name": "client",
+            "document": 1_000_000,
+            "idDocumentType": "13",
+            "responsibilities": "R-99-PN",
+        },
+        "products": [product] * 5,
+        "table": {"name": "table 1"},
+        "createdOn": "2025-01-01T10:00:00",
+        "total": 120000,
+        "status": "Pagada",
+    }
+    return json.dumps([invoice]).encode()
+
+
+class LegacyClientsResponse(BaseModel):
+    """Clients response validated into PirPos shaped models."""
+
+    data: List[ClientResponseValidator]
+
+
+def legacy_parse_clients(body: bytes) -> List[Client]:
+    """Previous pipeline: dicts, validator models and validated clients."""
+    raw_clients = LegacyClientsResponse(**json.loads(body)).data
+    clients: List[Client] = []
+    for raw_client in raw_clients:
+        city = raw_client.cityDetail
+        clients.append(
+            Client(
+                name=raw_client.name,
+                last_name=raw_client.lastName,
+                email=raw_client.email or "",
+                document=raw_client.document,
+                check_digit=raw_client.checkDigit,
+                document_type=raw_client.idDocumentType,
+                phone=raw_client.phone,
+                address=raw_client.address,
+                responsibilities=raw_client.responsibilities or Responsibilities.R_99_PN,
+                city_detail=CityDetail(
+                    city_name=city.cityName,
+                    city_state=city.stateName,
+                    city_code=city.cityCode,
+                    country_code=city.countryCode,
+                    state_code=city.stateCode,
+                ) if city else None,
+            )
+        )
+    return clients
+
+
+def legacy_parse_invoice(body: bytes) -> Optional[Invoice]:
+    """Previous pipeline: dicts copied field by field into the invoice models."""
+    raw_data = json.loads(body)
+    if not raw_data:
+        return None
+    raw_invoice = raw_data[0]
+    raw_client = raw_invoice["client"]
+    products: List[InvoiceProduct] = []
+    for raw_product in raw_invoice["products"]:
+        taxes = [
+            TaxInfo(tax_name=raw_tax["taxName"], value=raw_tax["taxValue"])
+            for raw_tax in raw_product.get("taxes", [])
+        ]
+        product = Product(
+            product_id=raw_product["code"],
+            name=raw_product["name"],
+            price=float(raw_product["totalBruto"]),
+            taxes=taxes,
+        )
+        products.append(
+            InvoiceProduct(product=product, price=product.price, quantity=raw_product["quantity"], tax=taxes)
+        )
+    return Invoice(
+        business=Business(**raw_invoice["business"]),
+        cachier=Employee(name=raw_invoice["cashier"]["name"], employee_id=raw_invoice["cashier"]["name"]),
+        sell_point=raw_invoice["table"]["name"],
+        seller=Employee(name=raw_invoice["seller"]["name"], employee_id=raw_invoice["seller"]["name"]),
+        client=Client(
+            name=raw_client["name"],
+            last_name=raw_client.get("last_name"),
+            email=raw_client.get("email"),
+            document=raw_client["document"],
+            check_digit=raw_client.get("checkDigit"),
+            document_type=int(raw_client["idDocumentType"]),  # type: ignore
+            phone=raw_client.get("phone"),
+            address=raw_client.get("address"),
+            responsibilities=raw_client["responsibilities"],
+        ),
+        created_on=raw_invoice["createdOn"],
+        anulated_date=raw_invoice.get("canceled", {}).get("date"),
+        invoice_prefix="FVE",
+        invoice_number=1,
+        payment_method=[
+            Payment(payment_name=raw_product["paymentMethod"], payment_value=raw_product["value"])
+            for raw_product in raw_invoice["products"]
+        ],
+        products=products,
+        total=raw_invoice["total"],
+        status=raw_invoice["status"],
+    )
+
+
+def parse_clients(body: bytes) -> List[Client]:
+    """Current pipeline: bytes validated once into the final clients."""
+    return list(ClientsResponseValidator.model_validate_json(body).data)
+
+
+def measure(function: Callable[[bytes], Any], body: bytes, items: int) -> float:
+    """CPU microseconds per item."""
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        function(body)
+    return (time.process_time() - start) / (ROUNDS * items) * 1_000_000
+
+
+def main() -> None:
+    """Print CPU time per client and per invoice before and after."""
+    clients_body = build_clients_body()
+    invoice_body = build_invoice_body()
+    inbound_body = Client(name="client", document=1, document_type=13).model_dump_json().encode()  # type: ignore
+
+    results: Dict[str, List[float]] = {
+        "client search (per client)": [
+            measure(legacy_parse_clients, clients_body, CLIENTS_PER_PAGE),
+            measure(parse_clients, clients_body, CLIENTS_PER_PAGE),
+        ],
+        "invoice (per invoice)": [
+            measure(legacy_parse_invoice, invoice_body, 1),
+            measure(lambda body: get_invoice_from_json(body, "FVE", 1), invoice_body, 1),
+        ],
+        "inbound client body": [
+            measure(lambda body: Client(**json.loads(body)), inbound_body, 1),
+            measure(Client.model_validate_json, inbound_body, 1),
+        ],
+    }
+
+    print(f"{'pipeline':<30}{'before (us)':>14}{'after (us)':>14}")
+    for name, (before, after) in results.items():
+        print(f"{name:<30}{before:>14.2f}{after:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
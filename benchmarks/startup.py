@@ -0,0 +1,80 @@
+"""Time a worker needs to import the app and run create_app().
+
+Each round runs in a fresh interpreter, like a restarted uWSGI master, with
+fake PirPos credentials so the real connector is built. Nothing is sent to
+PirPos: the login waits for the first request or readiness check.
+
+    python -m benchmarks.startup
+"""
+
+from typing import List, Tuple
+import json
+import os
+import statistics
+import subprocess  # nosec
+import sys
+import tempfile
+
+
+ROUNDS = 10
+
+SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps([imported - started, created - imported]))
+"""
+
+
+def run_once(directory: str) -> Tuple[float, float]:
+    """Import and create the app in a new interpreter.
+
+    Returns:
+        Tuple[float, float]: Seconds importing and seconds in create_app().
+    """
+    environment = dict(
+        os.environ,
+        PIRPOS_USER_NAME="benchmark@mail.com",
+        PIRPOS_PASSWORD="benchmark",
+        PIRPOS_TOKEN_FILE=os.path.join(directory, "token.json"),
+        PIRPOS_RATE_LIMIT_DIR=os.path.join(directory, "pirpos-rate-limits"),
+        PIRPOS_MIRROR_PATH=os.path.join(directory, "clients.sqlite3"),
+        REGISTRATIONS_DB_PATH=os.path.join(directory, "registrations.sqlite3"),
+        INVOICES_DB_PATH=os.path.join(directory, "invoices.sqlite3"),
+        IMPORTS_DB_PATH=os.path.join(directory, "imports.sqlite3"),
+        IMPORTS_DIR=os.path.join(directory, "imports"),
+        IDEMPOTENCY_DB_PATH=os.path.join(directory, "idempotency.sqlite3"),
+        METRICS_DIR=os.path.join(directory, "metrics"),
+        PROFILING_DIR=os.path.join(directory, "profiles"),
+    )
+    output = subprocess.run(  # nosec
+        [sys.executable, "-c", SCRIPT],
+        env=environment,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    imported, created = json.loads(output.splitlines()[-1])
+    return imported, created
+
+
+def main() -> None:
+    """Print the median and worst startup times."""
+    imports: List[float] = []
+    creations: List[float] = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(ROUNDS):
+            imported, created = run_once(directory)
+            imports.append(imported * 1000)
+            creations.append(created * 1000)
+
+    print(f"{'step':<20}{'median (ms)':>14}{'max (ms)':>14}")
+    for name, values in (("import app", imports), ("create_app()", creations)):
+        print(f"{name:<20}{statistics.median(values):>14.1f}{max(values):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
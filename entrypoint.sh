@@ -4,6 +4,8 @@ set -e
 
 if [ "$APP_MODE" = "uwsgi" ]; then
     echo "Running with uWSGI..."
+    # workers keep their metrics here, values of a previous run must not be added up
+    rm -rf "${METRICS_DIR:-/tmp/metrics}"
     exec uwsgi --ini uwsgi.ini  # Use the ini file
 else
     echo "Running with debugpy..."
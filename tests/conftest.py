@@ -1,4 +1,5 @@
 """Here are define pytest fixtures, hooks and plugins."""
+from pathlib import Path
 import pytest
 # from typing import Any, Dict
 # from unittest.mock import patch, Mock
@@ -6,8 +7,32 @@ from flask import Flask
 from app import create_app
 
 
+# files and directories the app keeps its state in, by environment variable
+STATE_PATHS = {
+    "METRICS_DIR": "metrics",
+    "PROFILING_DIR": "profiles",
+    "PIRPOS_TOKEN_FILE": "pirpos_token.json",
+    "PIRPOS_RATE_LIMIT_DIR": "pirpos-rate-limits",
+    "PIRPOS_MIRROR_PATH": "clients.sqlite3",
+    "REGISTRATIONS_DB_PATH": "registrations.sqlite3",
+    "INVOICES_DB_PATH": "invoices.sqlite3",
+    "IMPORTS_DB_PATH": "imports.sqlite3",
+    "IMPORTS_DIR": "imports",
+    "IDEMPOTENCY_DB_PATH": "idempotency.sqlite3",
+}
+
+
+@pytest.fixture(autouse=True)
+def local_state(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Keep the state of the apps built by a test in its own directory."""
+    directory = tmp_path / "state"
+    for variable, name in STATE_PATHS.items():
+        monkeypatch.setenv(variable, str(directory / name))
+    return directory
+
+
 @pytest.fixture
-def app() -> Flask:
+def app(local_state: Path) -> Flask:
     """App fixture."""
     flask_app = create_app()
     yield flask_app
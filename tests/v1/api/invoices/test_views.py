@@ -0,0 +1,24 @@
+"""Tests for invoices views."""
+import json
+from http import HTTPStatus
+from flask import url_for
+from flask.testing import FlaskClient
+
+
+def test_export_reports_missing_invoices_inline(client: FlaskClient) -> None:
+    """Every number of the range gets its own line."""
+    response = client.get(
+        url_for("suscriber-invoices.export_invoices", prefix="FVE", **{"from": 5, "to": 7})
+    )
+    assert response.status_code == HTTPStatus.OK
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert sorted(line["invoice_number"] for line in lines) == [5, 6, 7]
+    assert {line["status"] for line in lines} == {"not_found"}
+
+
+def test_export_rejects_reversed_range(client: FlaskClient) -> None:
+    """The range must be ordered."""
+    response = client.get(
+        url_for("suscriber-invoices.export_invoices", prefix="FVE", **{"from": 7, "to": 5})
+    )
+    assert response.status_code == HTTPStatus.BAD_REQUEST
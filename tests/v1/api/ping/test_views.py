@@ -8,3 +8,17 @@ def test_ping(client: FlaskClient) -> None:
     """Test for ping endpoint."""
     response = client.get(url_for("ping.main"))
     assert response.status_code == HTTPStatus.OK
+
+
+def test_metrics(client: FlaskClient) -> None:
+    """Request latency is exposed by endpoint."""
+    client.get(url_for("ping.main"))
+    response = client.get(url_for("ping.metrics"))
+    assert response.status_code == HTTPStatus.OK
+    assert 'pos_connector_http_request_duration_seconds_count{endpoint="ping.main"' in response.text
+
+
+def test_ready(client: FlaskClient) -> None:
+    """The dummy connector needs no warm up."""
+    response = client.get(url_for("ping.ready"))
+    assert response.status_code == HTTPStatus.OK
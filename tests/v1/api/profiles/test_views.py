@@ -0,0 +1,32 @@
+"""Tests for the request profiles views."""
+from http import HTTPStatus
+from pathlib import Path
+import pytest
+from flask import Flask, url_for
+from flask.testing import FlaskClient
+from app import create_app
+
+
+@pytest.fixture
+def app(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Flask:
+    """App with request profiling enabled."""
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("PROFILING_ENABLED", "true")
+    monkeypatch.setenv("PROFILING_DIR", str(tmp_path / "profiles"))
+    return create_app()
+
+
+def test_marked_requests_are_profiled(client: FlaskClient) -> None:
+    """A request sent with the profiling header is stored and listed."""
+    assert "X-Profile-Name" not in client.get(url_for("ping.main")).headers
+    name = client.get(url_for("ping.main"), headers={"X-Profile": "1"}).headers["X-Profile-Name"]
+
+    listed = client.get(url_for("suscriber-profiles.list_profiles")).json["profiles"]
+    assert [profile["name"] for profile in listed] == [name]
+    assert listed[0]["endpoint"] == "ping.main"
+
+    report = client.get(url_for("suscriber-profiles.get_profile", name=name))
+    assert report.status_code == HTTPStatus.OK
+    assert "function calls" in report.text
+    missing = client.get(url_for("suscriber-profiles.get_profile", name="../secret.prof"))
+    assert missing.status_code == HTTPStatus.NOT_FOUND
@@ -0,0 +1,155 @@
+"""Tests for users views."""
+from typing import Iterator
+import importlib
+from http import HTTPStatus
+from pathlib import Path
+import pytest
+from flask import Response, url_for
+from flask.testing import FlaskClient
+from app import create_app
+from app.v1.clients import DummyConnector
+from app.v1.models import Client
+from app.v1.utils.errors import FetchDataError, SendDataError
+
+
+def test_batch_deduplicates_documents(client: FlaskClient) -> None:
+    """Each document is reported once."""
+    response = client.post(
+        url_for("suscriber-users.check_batch"), json={"documents": [10, 20, 10]}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.json == {
+        "results": [
+            {"document": 10, "exists": False, "error": None},
+            {"document": 20, "exists": False, "error": None},
+        ]
+    }
+
+
+def test_batch_rejects_empty_list(client: FlaskClient) -> None:
+    """An empty batch is an input error."""
+    response = client.post(url_for("suscriber-users.check_batch"), json={"documents": []})
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_queued_registration(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """New users are accepted with a ticket when registrations are queued."""
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("USERS_ASYNC_REGISTRATION", "true")
+    monkeypatch.setenv("REGISTRATIONS_DB_PATH", str(tmp_path / "registrations.sqlite3"))
+    client = create_app().test_client()
+    user = {"name": "client", "email": "client@mail.com", "document": 10, "document_type": 13}
+
+    response = client.post("/pos-connector/users", json=user)
+    assert response.status_code == HTTPStatus.ACCEPTED
+    status = client.get(response.headers["Location"])
+    assert status.status_code == HTTPStatus.OK
+    assert status.json["ticket"] == response.json["ticket"]
+    assert status.json["document"] == 10
+
+
+def test_repeated_idempotency_key(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """A retry with the same key gets the first response without running again."""
+    views = importlib.import_module("app.v1.api.users.views")
+    uploads = []
+    monkeypatch.setattr(views, "create_user", lambda users_manager, emails: uploads.append(1) or Response("created"))
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("IDEMPOTENCY_DB_PATH", str(tmp_path / "idempotency.sqlite3"))
+    client = create_app().test_client()
+    user = {"name": "client", "email": "client@mail.com", "document": 10, "document_type": 13}
+
+    first = client.post("/pos-connector/users", json=user, headers={"Idempotency-Key": "abc"})
+    second = client.post("/pos-connector/users", json=user, headers={"Idempotency-Key": "abc"})
+    assert first.text == second.text == "created"
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert len(uploads) == 1
+
+    user["name"] = "other"
+    conflict = client.post("/pos-connector/users", json=user, headers={"Idempotency-Key": "abc"})
+    assert conflict.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_upstream_failure_is_not_replayed(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """A retry after a PirPos failure runs again instead of getting the failure back."""
+    uploads = []
+
+    def flaky_upload(connector: DummyConnector, client: Client) -> None:
+        uploads.append(client.document)
+        if len(uploads) == 1:
+            raise SendDataError("Can't create a customer in PirPos\n Connection aborted")
+
+    monkeypatch.setattr(DummyConnector, "upload_client", flaky_upload)
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("IDEMPOTENCY_DB_PATH", str(tmp_path / "idempotency.sqlite3"))
+    client = create_app().test_client()
+    user = {"name": "client", "email": "client@mail.com", "document": 10, "document_type": 13}
+
+    first = client.post("/pos-connector/users", json=user, headers={"Idempotency-Key": "abc"})
+    assert first.status_code == HTTPStatus.BAD_REQUEST
+    second = client.post("/pos-connector/users", json=user, headers={"Idempotency-Key": "abc"})
+    assert second.status_code == HTTPStatus.OK
+    assert "Idempotent-Replayed" not in second.headers
+    third = client.post("/pos-connector/users", json=user, headers={"Idempotency-Key": "abc"})
+    assert third.status_code == HTTPStatus.OK and third.headers["Idempotent-Replayed"] == "true"
+    assert uploads == [10, 10]
+
+
+def test_import_requires_a_known_format(client: FlaskClient) -> None:
+    """Files other than CSV and NDJSON are rejected."""
+    response = client.post(
+        url_for("suscriber-users.post_import"), data=b"<xml/>", content_type="application/xml"
+    )
+    assert response.status_code == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+
+
+def test_import_status(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """An accepted import can be followed."""
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("IMPORTS_DIR", str(tmp_path / "imports"))
+    monkeypatch.setenv("IMPORTS_DB_PATH", str(tmp_path / "imports.sqlite3"))
+    client = create_app().test_client()
+
+    response = client.post(
+        "/pos-connector/users/imports",
+        data=b"name,email,document,document_type\nclient,client@mail.com,10,13\n",
+        content_type="text/csv",
+    )
+    assert response.status_code == HTTPStatus.ACCEPTED
+    status = client.get(response.headers["Location"])
+    assert status.status_code == HTTPStatus.OK
+    assert status.json["job_id"] == response.json["job_id"]
+    assert status.json["format"] == "csv"
+
+
+def test_export_csv(client: FlaskClient) -> None:
+    """The export starts with the columns accepted by the imports."""
+    response = client.get(url_for("suscriber-users.export_users", format="csv"))
+    assert response.status_code == HTTPStatus.OK
+    assert response.content_type.startswith("text/csv")
+    assert response.get_data(as_text=True).splitlines() == [
+        "name,last_name,email,document,check_digit,document_type,phone,address,responsibilities"
+    ]
+
+
+def test_export_failure_cuts_the_stream(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """An upstream failure after the first page doesn't end the export cleanly."""
+    def failing_clients(connector: DummyConnector, page_size: int, prefetch: int) -> Iterator[Client]:
+        yield Client(name="client", email="client@mail.com", document=10, document_type=13)
+        raise FetchDataError("PirPos client list is longer than 2 pages")
+
+    monkeypatch.setattr(DummyConnector, "iter_clients", failing_clients)
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path / "metrics"))
+    response = create_app().test_client().get("/pos-connector/users/export?format=csv")
+    assert response.status_code == HTTPStatus.OK
+    with pytest.raises(FetchDataError):
+        response.get_data()
+
+
+def test_lookups_tell_the_age_of_the_data(client: FlaskClient) -> None:
+    """A lookup answered by the upstream is a miss, the repeated one a hit."""
+    first = client.get(url_for("suscriber-users.check_exists", user_id=10))
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.headers["Age"] == "0"
+    second = client.get(url_for("suscriber-users.check_exists", user_id=10))
+    assert second.headers["X-Cache"] == "HIT"
+    assert "X-Cache" not in client.get(url_for("ping.main")).headers
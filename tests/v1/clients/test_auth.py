@@ -0,0 +1,37 @@
+"""Tests for the PirPos token manager."""
+import logging
+from pathlib import Path
+from typing import List
+from app.v1.clients.pos_system.auth import PirposTokenManager
+
+
+def test_login_is_lazy_and_shared(tmp_path: Path) -> None:
+    """Workers sharing the token file log in only once."""
+    logins: List[str] = []
+
+    def login() -> str:
+        logins.append("login")
+        return f"token-{len(logins)}"
+
+    token_file = str(tmp_path / "token.json")
+    first_worker = PirposTokenManager(login, logging.getLogger(__name__), token_file)
+    second_worker = PirposTokenManager(login, logging.getLogger(__name__), token_file)
+    assert not logins
+
+    assert first_worker.get_token() == "token-1"
+    assert second_worker.get_token() == "token-1"
+    assert len(logins) == 1
+
+
+def test_rejected_token_is_renewed(tmp_path: Path) -> None:
+    """An invalidated token triggers a new login."""
+    logins: List[str] = []
+
+    def login() -> str:
+        logins.append("login")
+        return f"token-{len(logins)}"
+
+    manager = PirposTokenManager(login, logging.getLogger(__name__), str(tmp_path / "token.json"))
+    token = manager.get_token()
+    manager.invalidate(token)
+    assert manager.get_token() == "token-2"
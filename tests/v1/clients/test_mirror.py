@@ -0,0 +1,82 @@
+"""Tests for the clients mirror sync."""
+import logging
+from pathlib import Path
+from typing import List, Tuple
+import pytest
+from app.v1.clients.pos_system.mirror import FetchPage, MirrorSync
+from app.v1.models import Client, DocumentType
+from app.v1.storage import ClientsMirror
+from app.v1.utils.errors import FetchDataError
+
+
+def build_client(document: int) -> Client:
+    """Build a minimal client."""
+    return Client(name="client", document=document, document_type=DocumentType.CEDULA_CIUDADANIA)
+
+
+def build_fetch_page(directory: List[Client], max_limit: int = 1000) -> FetchPage:
+    """Build a page download of a directory capping the clients per page."""
+    def fetch_page(page: int, limit: int) -> Tuple[List[Client], List[str]]:
+        limit = min(limit, max_limit)
+        clients = directory[page * limit:(page + 1) * limit]
+        return clients, [f"id-{client.document}" for client in clients]
+    return fetch_page
+
+
+def test_sync_walks_every_page_and_removes_missing_clients(tmp_path: Path) -> None:
+    """A complete sync replaces the mirrored clients."""
+    mirror = ClientsMirror(str(tmp_path / "clients.sqlite3"))
+    mirror.save([(build_client(99), "old-id")])
+    directory = [build_client(document) for document in range(5)]
+
+    sync = MirrorSync(
+        mirror, build_fetch_page(directory), logging.getLogger(__name__), str(tmp_path / "sync.lock"), page_size=2
+    )
+    assert sync.sync()
+
+    assert mirror.size() == 5
+    assert mirror.get(99) is None
+    mirrored = mirror.get(3)
+    assert mirrored is not None
+    assert mirrored[1] == "id-3"
+    assert not sync.sync()
+
+
+def test_sync_walks_pages_shorter_than_requested(tmp_path: Path) -> None:
+    """A PirPos answering fewer clients than asked doesn't cut the walk."""
+    mirror = ClientsMirror(str(tmp_path / "clients.sqlite3"))
+    directory = [build_client(document) for document in range(7)]
+    sync = MirrorSync(
+        mirror, build_fetch_page(directory, max_limit=2), logging.getLogger(__name__),
+        str(tmp_path / "sync.lock"), page_size=5,
+    )
+    assert sync.sync()
+    assert mirror.size() == 7
+
+
+def test_sync_keeps_the_mirror_when_the_walk_reads_less(tmp_path: Path) -> None:
+    """Mirrored clients are not removed by a walk shorter than the mirror."""
+    mirror = ClientsMirror(str(tmp_path / "clients.sqlite3"))
+    mirror.save([(build_client(document), f"id-{document}") for document in range(10, 15)])
+    sync = MirrorSync(
+        mirror, build_fetch_page([build_client(1), build_client(2)]), logging.getLogger(__name__),
+        str(tmp_path / "sync.lock"), page_size=2,
+    )
+    assert sync.sync()
+    assert mirror.size() == 7
+    assert mirror.last_sync() > 0
+
+
+def test_sync_past_the_max_pages_fails(tmp_path: Path) -> None:
+    """A walk cut by the max pages neither removes clients nor counts as a sync."""
+    mirror = ClientsMirror(str(tmp_path / "clients.sqlite3"))
+    mirror.save([(build_client(99), "old-id")])
+    directory = [build_client(document) for document in range(5)]
+    sync = MirrorSync(
+        mirror, build_fetch_page(directory), logging.getLogger(__name__),
+        str(tmp_path / "sync.lock"), page_size=2, max_pages=2,
+    )
+    with pytest.raises(FetchDataError):
+        sync.sync()
+    assert mirror.get(99) is not None
+    assert mirror.last_sync() == 0
@@ -0,0 +1,209 @@
+"""Tests for the PirPos connector."""
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, List, Tuple
+from urllib.parse import parse_qs, urlparse
+import pytest
+import requests
+from app.v1.clients import PirposConnector
+from app.v1.clients.pos_system.utils import PirposClient, get_invoice_from_json, iter_pages
+from app.v1.models import Client, DocumentType, InvoiceStatus
+from app.v1.storage import ClientsMirror
+from app.v1.utils.errors import FetchDataError
+
+
+class DownTransport:
+    """Transport of an unreachable PirPos."""
+
+    def __init__(self) -> None:
+        self.operations: List[str] = []
+
+    def request(self, method: str, url: str, operation: str = "other", **kwargs: Any) -> requests.Response:
+        """Fail every call."""
+        self.operations.append(operation)
+        raise requests.ConnectionError("PirPos is down")
+
+
+def test_startup_does_not_need_pirpos(tmp_path: Path) -> None:
+    """The connector is built without calls and readiness probes are reused."""
+    transport = DownTransport()
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"),
+    )
+    assert not transport.operations
+
+    assert not connector.check_ready()
+    assert not connector.check_ready()
+    assert transport.operations == ["ready"]
+
+
+class PagedTransport:
+    """Transport of a PirPos searching its clients by document substring.
+
+    Pages are capped at `max_limit` clients whatever the limit asked.
+    """
+
+    def __init__(self, documents: List[int], max_limit: int = 1000) -> None:
+        self.documents = documents
+        self.max_limit = max_limit
+        self.operations: List[str] = []
+
+    def request(self, method: str, url: str, operation: str = "other", **kwargs: Any) -> requests.Response:
+        """Answer a page of the clients matching the search."""
+        self.operations.append(operation)
+        query = parse_qs(urlparse(url).query)
+        page, limit = int(query["page"][0]), min(int(query["limit"][0]), self.max_limit)
+        search = query.get("clientData", [""])[0]
+        clients = [
+            {"_id": f"id-{document}", "name": "client", "document": document, "idDocumentType": 13}
+            for document in self.documents
+            if search in str(document)
+        ][page * limit:(page + 1) * limit]
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"data": clients}).encode()  # pylint: disable=protected-access
+        return response
+
+
+def test_iter_clients_walks_every_page(tmp_path: Path) -> None:
+    """Every client is returned once and in order."""
+    transport = PagedTransport(list(range(5)))
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"),
+    )
+
+    clients = list(connector.iter_clients(page_size=2, prefetch=2))
+    assert [client.document for client in clients] == [0, 1, 2, 3, 4]
+    assert set(transport.operations) == {"export"}
+    assert len(transport.operations) <= 4
+
+
+def test_iter_clients_walks_pages_shorter_than_requested(tmp_path: Path) -> None:
+    """A PirPos answering fewer clients than asked doesn't truncate the export."""
+    transport = PagedTransport(list(range(7)), max_limit=2)
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"),
+    )
+
+    clients = list(connector.iter_clients(page_size=5, prefetch=2))
+    assert [client.document for client in clients] == list(range(7))
+
+
+def test_iter_pages_fails_past_the_max_pages() -> None:
+    """A walk cut by the max pages is an error, not the end of the list."""
+    def fetch_page(page: int, limit: int) -> Tuple[List[Client], List[str]]:
+        clients = [
+            Client(name="client", email="client@mail.com", document=page * limit + index, document_type=13)
+            for index in range(limit)
+        ]
+        return clients, [str(client.document) for client in clients]
+
+    pages = iter_pages(fetch_page, page_size=2, prefetch=2, max_pages=3)
+    assert len(next(pages)[0]) == 2
+    with pytest.raises(FetchDataError):
+        list(pages)
+
+
+def test_search_reads_pages_until_the_exact_document(tmp_path: Path) -> None:
+    """A document hidden behind partial matches is found without reading further pages."""
+    transport = PagedTransport([17, 27, 37, 47, 57, 7, 70, 71])
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"), search_page_size=2,
+    )
+
+    client = connector.get_client(7)
+    assert client is not None and client.document == 7
+    assert transport.operations == ["search"] * 3
+
+    transport.operations.clear()
+    assert connector.get_client(8) is None
+    assert transport.operations == ["search"]
+
+
+def test_search_walks_pages_shorter_than_requested(tmp_path: Path) -> None:
+    """A PirPos answering fewer clients than asked doesn't end the search early."""
+    transport = PagedTransport([17, 27, 37, 47, 57, 7], max_limit=2)
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"), search_page_size=5,
+    )
+
+    client = connector.get_client(7)
+    assert client is not None and client.document == 7
+    assert transport.operations == ["search"] * 3
+
+    transport.documents = [17, 27, 37]
+    transport.operations.clear()
+    assert connector.get_client(7) is None
+    assert transport.operations == ["search"] * 2
+
+
+def test_search_fails_past_the_max_pages(tmp_path: Path) -> None:
+    """A search that may go on is an error, not a missing client."""
+    transport = PagedTransport([17, 27, 37, 47, 7])
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"), search_page_size=2, search_max_pages=2,
+    )
+    with pytest.raises(FetchDataError):
+        connector.get_client(7)
+
+
+def test_invoice_is_validated_from_the_response_bytes() -> None:
+    """The PirPos invoice fields are mapped to the invoice model in a single validation."""
+    line = {
+        "code": "P1", "name": "Café", "totalBruto": "12000", "quantity": 2,
+        "paymentMethod": "Efectivo", "value": 24000, "taxes": [{"taxName": "IVA", "taxValue": 19}],
+    }
+    body = json.dumps([{
+        "business": {"name": "business", "nit": "900"},
+        "seller": {"name": "seller"},
+        "cashier": {"name": "cashier"},
+        "client": {"name": "client", "document": 1, "idDocumentType": "13", "responsibilities": "R-99-PN"},
+        "products": [line],
+        "table": {"name": "table 1"},
+        "createdOn": "2025-01-01T10:00:00",
+        "canceled": {"date": "2025-01-02T10:00:00"},
+        "total": 24000,
+        "status": "Anulada",
+    }]).encode()
+
+    invoice = get_invoice_from_json(body, "FVE", 10)
+    assert invoice is not None
+    assert (invoice.invoice_prefix, invoice.invoice_number) == ("FVE", 10)
+    assert invoice.cachier.employee_id == "cashier" and invoice.sell_point == "table 1"
+    assert invoice.client.document_type == DocumentType.CEDULA_CIUDADANIA
+    assert invoice.status == InvoiceStatus.CANCELED and invoice.anulated_date is not None
+    assert invoice.payment_method[0].payment_value == 24000
+    product = invoice.products[0]
+    assert (product.product.product_id, product.price, product.quantity) == ("P1", 12000, 2)
+    assert product.tax and product.tax[0].tax_name == "IVA"
+    assert get_invoice_from_json(b"[]", "FVE", 10) is None
+
+
+def test_mirrored_client_keeps_when_it_was_read(tmp_path: Path) -> None:
+    """A client answered from the mirror tells its age, a fresh lookup searches PirPos."""
+    mirror = ClientsMirror(str(tmp_path / "clients.sqlite3"))
+    mirror.mark_synced(time.time())
+    transport = PagedTransport([7])
+    connector = PirposConnector(
+        "user", "password", logging.getLogger(__name__), transport,  # type: ignore
+        str(tmp_path / "token.json"), mirror=mirror,
+    )
+    mirror.save([(Client(name="client", document=7, document_type=13), "id-7")])
+
+    client = connector.get_client(7)
+    assert isinstance(client, PirposClient) and client.fetched_at is not None
+    assert client.fetched_at <= time.time()
+    assert "fetched_at" not in client.model_dump()
+    assert transport.operations == []
+
+    client = connector.get_fresh_client(7)
+    assert client is not None and client.document == 7
+    assert transport.operations == ["search"]
@@ -0,0 +1,84 @@
+"""Tests for the upstream protections."""
+import os
+import threading
+import time
+from pathlib import Path
+import pytest
+from app.v1.clients.pos_system.resilience import CircuitBreaker, Bulkhead, TokenBucket
+from app.v1.utils.errors import RateLimitedError, UpstreamUnavailableError
+
+
+def test_circuit_opens_and_recovers_after_probe() -> None:
+    """Failures open the circuit and a successful probe closes it."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+
+    with pytest.raises(UpstreamUnavailableError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    with pytest.raises(UpstreamUnavailableError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_open_check_leaves_the_probe() -> None:
+    """Checking the circuit before a call doesn't use up the half open probe."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    with pytest.raises(UpstreamUnavailableError):
+        breaker.reject_if_open()
+
+    time.sleep(0.06)
+    breaker.reject_if_open()
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_bulkhead_rejects_calls_over_capacity() -> None:
+    """Calls over the capacity fail after waiting."""
+    bulkhead = Bulkhead(max_concurrent=1, max_wait=0.01)
+    release = threading.Event()
+
+    def hold_slot() -> None:
+        with bulkhead.slot():
+            release.wait()
+
+    thread = threading.Thread(target=hold_slot)
+    thread.start()
+    time.sleep(0.02)
+    with pytest.raises(UpstreamUnavailableError):
+        with bulkhead.slot():
+            pass
+    release.set()
+    thread.join()
+    assert bulkhead.stats() == {"in_flight": 0, "bulkhead_rejections": 1}
+
+
+def test_token_bucket_is_shared_by_workers(tmp_path: Path) -> None:
+    """Tokens taken by a worker are not available to the others."""
+    bucket = TokenBucket(str(tmp_path / "search.bucket"), rate=5, burst=2)
+    pid = os.fork()
+    if pid == 0:  # worker process, it must never go back to pytest
+        code = 1
+        try:
+            bucket.acquire(0)
+            bucket.acquire(0)
+            code = 0
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    with pytest.raises(RateLimitedError) as error:
+        bucket.acquire(0)
+    assert error.value.retry_after and 0 < error.value.retry_after <= 0.2
+
+    start = time.monotonic()
+    bucket.acquire(1)
+    assert 0.1 < time.monotonic() - start < 0.5
+    assert bucket.stats() == {"rate_limit_waits": 1, "rate_limit_rejections": 1}
@@ -0,0 +1,118 @@
+"""Tests for the pooled transport."""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, List
+import pytest
+from app.v1.clients import PooledTransport
+from app.v1.clients.pos_system.auth import PirposTokenManager
+from app.v1.clients.pos_system.resilience import Bulkhead, CircuitBreaker, TokenBucket
+from app.v1.utils.deadline import deadline_scope
+from app.v1.utils.errors import DeadlineExceededError, UpstreamUnavailableError
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Answer every GET keeping the connection open."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Answer with a fixed body."""
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        """Silence the server log."""
+
+
+class TokenHandler(KeepAliveHandler):
+    """Answer 401 to the clients calls unless the second token is sent."""
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Reject the old tokens."""
+        if not self.path.startswith("/clients") or self.headers.get("Authorization") == "Bearer token-2":
+            super().do_GET()
+            return
+        self.send_response(401)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def server_url() -> Iterator[str]:
+    """Local keep-alive server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TokenHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(server_url: str) -> None:
+    """Sequential requests share one keep-alive connection."""
+    transport = PooledTransport(logging.getLogger(__name__))
+    for _ in range(3):
+        assert transport.request("GET", f"{server_url}/ping").ok
+
+    stats = transport.stats()
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 2
+
+
+def test_expired_deadline_is_not_sent(server_url: str) -> None:
+    """Calls made after the request deadline are abandoned."""
+    transport = PooledTransport(logging.getLogger(__name__))
+    with deadline_scope(0):
+        with pytest.raises(DeadlineExceededError):
+            transport.request("GET", f"{server_url}/ping")
+    assert transport.stats()["requests"] == 0
+
+
+def test_rejected_token_is_renewed_outside_the_bulkhead(server_url: str, tmp_path: Path) -> None:
+    """The login after a 401 takes its own slot once the rejected call released it."""
+    breaker = CircuitBreaker()
+    transport = PooledTransport(
+        logging.getLogger(__name__), breaker=breaker, bulkhead=Bulkhead(max_concurrent=1, max_wait=0.05)
+    )
+    logins: List[str] = []
+
+    def login() -> str:
+        assert transport.request("GET", f"{server_url}/login", "login").ok
+        logins.append("login")
+        return f"token-{len(logins)}"
+
+    auth = PirposTokenManager(login, logging.getLogger(__name__), str(tmp_path / "token.json"))
+    response = transport.request("GET", f"{server_url}/clients", "search", auth=auth)
+    assert response.ok
+    assert [previous.status_code for previous in response.history] == [401]
+    assert len(logins) == 2
+    assert transport.stats()["bulkhead_rejections"] == 0
+    assert transport.stats()["requests"] == 4
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_open_circuit_does_not_take_rate_limit_tokens(server_url: str, tmp_path: Path) -> None:
+    """Calls rejected by the open circuit fail at once and leave the tokens to others."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    bucket = TokenBucket(str(tmp_path / "bucket"), rate=0.1)
+    transport = PooledTransport(
+        logging.getLogger(__name__), breaker=breaker, rate_limits={"search": bucket}
+    )
+    breaker.record_failure()
+
+    with deadline_scope(5):
+        for _ in range(2):
+            with pytest.raises(UpstreamUnavailableError):
+                transport.request("GET", f"{server_url}/ping", "search")
+    assert transport.stats()["rate_limit_waits"] == 0
+    assert breaker.stats()["circuit_rejections"] == 2
+
+    breaker.record_success()
+    assert transport.request("GET", f"{server_url}/ping", "search").ok
+    assert transport.stats()["rate_limit_waits"] == 0
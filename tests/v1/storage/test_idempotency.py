@@ -0,0 +1,31 @@
+"""Tests for the idempotency key store."""
+from pathlib import Path
+from app.v1.storage import IdempotencyStore
+from app.v1.storage.idempotency import COMPLETED, CONFLICT, IN_FLIGHT, STARTED, StoredResponse
+
+
+def test_keys_run_once(tmp_path: Path) -> None:
+    """A key runs one request and returns its response to the repeated ones."""
+    store = IdempotencyStore(str(tmp_path / "idempotency.sqlite3"))
+    assert store.begin("key", "request") == (STARTED, None)
+    assert store.begin("key", "request") == (IN_FLIGHT, None)
+    assert store.begin("key", "other request") == (CONFLICT, None)
+
+    response = StoredResponse(status=200, headers={"Content-Type": "application/json"}, body=b"{}")
+    store.complete("key", response)
+    assert store.begin("key", "request") == (COMPLETED, response)
+
+
+def test_released_keys_run_again(tmp_path: Path) -> None:
+    """A request that failed without a response can be retried."""
+    store = IdempotencyStore(str(tmp_path / "idempotency.sqlite3"))
+    assert store.begin("key", "request") == (STARTED, None)
+    store.release("key")
+    assert store.begin("key", "request") == (STARTED, None)
+
+
+def test_expired_leases_are_taken_over(tmp_path: Path) -> None:
+    """A key held by a dead worker is claimed again once its lease expires."""
+    store = IdempotencyStore(str(tmp_path / "idempotency.sqlite3"), lease=0)
+    assert store.begin("key", "request") == (STARTED, None)
+    assert store.begin("key", "request") == (STARTED, None)
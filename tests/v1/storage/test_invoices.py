@@ -0,0 +1,35 @@
+"""Tests for the persistent invoice store."""
+from pathlib import Path
+from app.v1.models import Business, Client, DocumentType, Employee, Invoice, InvoiceStatus
+from app.v1.storage import InvoiceStore
+
+
+def build_invoice(number: int, status: InvoiceStatus) -> Invoice:
+    """Build a minimal invoice."""
+    employee = Employee(name="seller", employee_id="seller")
+    return Invoice(
+        business=Business(name="business", nit="123"),
+        cachier=employee,
+        sell_point="table 1",
+        seller=employee,
+        client=Client(name="client", document=1, document_type=DocumentType.CEDULA_CIUDADANIA),
+        created_on="2025-01-01T10:00:00",
+        invoice_prefix="FVE",
+        invoice_number=number,
+        payment_method=[],
+        products=[],
+        total=10.0,
+        status=status,
+    )
+
+
+def test_invoices_are_shared_and_replaced(tmp_path: Path) -> None:
+    """A second store on the same file sees the latest version."""
+    path = str(tmp_path / "invoices.sqlite3")
+    InvoiceStore(path).save(build_invoice(1, InvoiceStatus.PAID))
+    InvoiceStore(path).save(build_invoice(1, InvoiceStatus.CANCELED))
+
+    stored = InvoiceStore(path).get("FVE", 1)
+    assert stored is not None
+    assert stored[0].status == InvoiceStatus.CANCELED
+    assert InvoiceStore(path).get("FVE", 2) is None
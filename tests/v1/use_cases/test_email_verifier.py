@@ -0,0 +1,70 @@
+"""Tests for the email verifier."""
+import threading
+from typing import Any, Dict, List
+import pytest
+from email_validator import EmailNotValidError, EmailUndeliverableError
+from app.v1.use_cases import EmailVerifier
+
+
+class FakeDns:
+    """Resolver where only `mail.example` accepts email."""
+
+    def __init__(self) -> None:
+        self.lookups: List[str] = []
+        self.done = threading.Event()
+
+    def __call__(self, domain: str) -> Dict[str, Any]:
+        self.lookups.append(domain)
+        self.done.set()
+        if domain != "mail.example":
+            raise EmailUndeliverableError(f"The domain name {domain} does not exist.")
+        return {"mx": [(10, "mx.mail.example")]}
+
+
+def test_domains_are_looked_up_once() -> None:
+    """Common domains are never looked up and the others are cached."""
+    dns = FakeDns()
+    verifier = EmailVerifier(mode="sync", resolve=dns)
+
+    assert verifier.check("Client@Gmail.com") == "Client@gmail.com"
+    assert verifier.check("a@mail.example") == "a@mail.example"
+    assert verifier.check("b@mail.example") == "b@mail.example"
+    with pytest.raises(EmailUndeliverableError):
+        verifier.check("a@missing.example")
+    with pytest.raises(EmailUndeliverableError):
+        verifier.check("b@missing.example")
+    with pytest.raises(EmailNotValidError):
+        verifier.check("not an email")
+    assert dns.lookups == ["mail.example", "missing.example"]
+
+
+def test_async_mode_looks_up_in_background() -> None:
+    """An unknown domain is accepted and rejected once its lookup finishes."""
+    dns = FakeDns()
+    verifier = EmailVerifier(mode="async", resolve=dns)
+
+    assert verifier.check("a@missing.example") == "a@missing.example"
+    assert dns.done.wait(5)
+    for _ in range(100):
+        if not verifier.stats()["pending"]:
+            break
+        threading.Event().wait(0.01)
+    with pytest.raises(EmailUndeliverableError):
+        verifier.check("b@missing.example")
+    assert dns.lookups == ["missing.example"]
+
+
+def test_check_many() -> None:
+    """A batch reports the error of each address."""
+    dns = FakeDns()
+    verifier = EmailVerifier(mode="async", resolve=dns)
+
+    errors = verifier.check_many(
+        ["a@mail.example", "b@mail.example", "a@missing.example", "a@gmail.com", "wrong"]
+    )
+    assert errors["a@mail.example"] is None
+    assert errors["b@mail.example"] is None
+    assert errors["a@gmail.com"] is None
+    assert isinstance(errors["a@missing.example"], EmailUndeliverableError)
+    assert isinstance(errors["wrong"], EmailNotValidError)
+    assert sorted(dns.lookups) == ["mail.example", "missing.example"]
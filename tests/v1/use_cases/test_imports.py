@@ -0,0 +1,126 @@
+"""Tests for the bulk client imports."""
+import io
+import logging
+from pathlib import Path
+from typing import List, Optional
+from app.v1.api.users.utils import validate_fields
+from app.v1.clients import DummyConnector
+from app.v1.models import Client, DocumentType, ImportFormat, ImportStatus
+from app.v1.storage import ImportJobStore
+from app.v1.use_cases import EmailVerifier, ImportWorker, UsersManager
+from app.v1.utils.deadline import get_remaining
+
+
+class RecordingConnector(DummyConnector):
+    """Connector where document 1 already exists."""
+
+    def __init__(self) -> None:
+        self.uploads: List[int] = []
+        self.deadlines: List[Optional[float]] = []
+
+    def get_client(self, document: int) -> Optional[Client]:
+        """Return the existing client."""
+        if document == 1:
+            return Client(name="client", document=1, document_type=DocumentType.CEDULA_CIUDADANIA)
+        return None
+
+    def upload_client(self, client: Client) -> None:
+        """Record the upload and the time left to send it."""
+        self.uploads.append(client.document)
+        self.deadlines.append(get_remaining())
+
+
+def build_worker(tmp_path: Path, connector: RecordingConnector, lease: float = 300) -> ImportWorker:
+    """Build a worker without DNS lookups or background thread that processes two rows per chunk."""
+    return ImportWorker(
+        ImportJobStore(str(tmp_path / "imports.sqlite3")),
+        UsersManager(connector),
+        EmailVerifier(mode="off"),
+        validate_fields,
+        str(tmp_path / "imports"),
+        logging.getLogger(__name__),
+        chunk_size=2,
+        lease=lease,
+        autostart=False,
+    )
+
+
+def test_csv_import(tmp_path: Path) -> None:
+    """New clients are uploaded once, existing and repeated ones are skipped."""
+    connector = RecordingConnector()
+    worker = build_worker(tmp_path, connector)
+    content = (
+        "name,email,document,document_type,check_digit\n"
+        "one,one@mail.com,1,13,\n"
+        "two,two@mail.com,2,13,\n"
+        "company,company@mail.com,3,31,\n"
+        "two again,two@mail.com,2,13,\n"
+        "three,wrong,4,13,\n"
+        "four,four@mail.com,5,99,\n"
+        "five,five@mail.com,6,31,7\n"
+    )
+    job_id = worker.submit(io.BytesIO(content.encode()), ImportFormat.CSV)
+
+    assert worker.run_once()
+    assert not worker.run_once()
+    job = worker.get(job_id)
+    assert job and job.status == ImportStatus.DONE
+    assert (job.rows, job.created, job.duplicates, job.failed) == (7, 2, 2, 3)
+    assert connector.uploads == [2, 6]
+    assert all(remaining is not None and 0 < remaining <= 240 for remaining in connector.deadlines)
+    assert [(error.row, error.document) for error in worker.get_errors(job_id)] == [
+        (3, 3), (5, 4), (6, None)
+    ]
+    assert not list((tmp_path / "imports").iterdir())
+
+
+def test_ndjson_import(tmp_path: Path) -> None:
+    """Each line is a client, unreadable lines are reported."""
+    connector = RecordingConnector()
+    worker = build_worker(tmp_path, connector)
+    content = (
+        '{"name": "two", "email": "two@mail.com", "document": 2, "document_type": 13}\n'
+        "\n"
+        "not json\n"
+    )
+    job_id = worker.submit(io.BytesIO(content.encode()), ImportFormat.NDJSON)
+
+    assert worker.run_once()
+    job = worker.get(job_id)
+    assert job and (job.rows, job.created, job.failed) == (2, 1, 1)
+    assert [error.row for error in worker.get_errors(job_id)] == [3]
+
+
+class HandoverConnector(RecordingConnector):
+    """Connector running another worker during its first upload."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.other_worker: Optional[ImportWorker] = None
+
+    def upload_client(self, client: Client) -> None:
+        """Record the upload, letting the other worker take the job first."""
+        other_worker, self.other_worker = self.other_worker, None
+        if other_worker:
+            assert other_worker.run_once()
+        super().upload_client(client)
+
+
+def test_job_claimed_by_another_worker(tmp_path: Path) -> None:
+    """A worker whose lease expired stops without counting its chunk or closing the job."""
+    connector = HandoverConnector()
+    late_worker = build_worker(tmp_path, connector, lease=0)
+    connector.other_worker = build_worker(tmp_path, connector)
+    content = "".join(
+        f'{{"name": "client", "email": "client@mail.com", "document": {document}, "document_type": 13}}\n'
+        for document in range(2, 6)
+    )
+    job_id = late_worker.submit(io.BytesIO(content.encode()), ImportFormat.NDJSON)
+
+    assert late_worker.run_once()
+    job = late_worker.get(job_id)
+    assert job and job.status == ImportStatus.DONE
+    assert (job.rows, job.created, job.duplicates, job.failed) == (4, 4, 0, 0)
+    # only the chunk in flight when the lease expired was sent twice
+    assert sorted(connector.uploads) == [2, 2, 3, 3, 4, 5]
+    assert not list((tmp_path / "imports").iterdir())
@@ -0,0 +1,64 @@
+"""Tests for the invoices manager."""
+import threading
+import time
+from typing import Optional
+from app.v1.clients import AsyncConnector, DummyConnector
+from app.v1.models import Invoice
+from app.v1.use_cases import InvoicesManager
+
+
+class CountingConnector(DummyConnector):
+    """Connector counting the invoice lookups running at the same time."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def get_invoice(self, prefix: str, number: int) -> Optional[Invoice]:
+        """Return no invoice after a delay."""
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        if number == 3:
+            raise ValueError("broken invoice")
+        return None
+
+
+def test_range_uses_the_async_connector_pool() -> None:
+    """A range is fetched by the shared async connector, never above its pool size."""
+    connector = CountingConnector()
+    manager = InvoicesManager(connector, async_connector=AsyncConnector(connector, max_workers=2))
+    results = {
+        number: (invoice, error)
+        for number, invoice, error in manager.iter_invoices("FVE", 1, 10, window=8)
+    }
+
+    assert sorted(results) == list(range(1, 11))
+    assert isinstance(results[3][1], ValueError)
+    assert all(results[number] == (None, None) for number in results if number != 3)
+    assert connector.max_running == 2
+
+
+def test_range_stops_when_the_consumer_stops() -> None:
+    """Closing the iterator early cancels the invoices not fetched yet."""
+    connector = CountingConnector()
+    manager = InvoicesManager(connector, async_connector=AsyncConnector(connector, max_workers=2))
+    results = manager.iter_invoices("FVE", 1, 1000, window=4)
+    next(results)
+    results.close()
+    time.sleep(0.1)
+    assert connector.running == 0
+
+
+def test_range_window_stays_within_the_bulkhead() -> None:
+    """A window larger than the max concurrency only runs that many calls at once."""
+    connector = CountingConnector()
+    manager = InvoicesManager(
+        connector, async_connector=AsyncConnector(connector, max_workers=8), max_concurrency=3
+    )
+    assert len(list(manager.iter_invoices("FVE", 1, 12, window=8))) == 12
+    assert connector.max_running == 3
@@ -0,0 +1,90 @@
+"""Tests for the background registrations."""
+import logging
+from pathlib import Path
+from typing import List, Optional
+from app.v1.models import Client, DocumentType, RegistrationStatus
+from app.v1.storage import RegistrationJournal
+from app.v1.use_cases import RegistrationWorker
+from app.v1.utils.deadline import get_remaining
+from app.v1.utils.errors import AlreadyExistsError, SendDataError
+
+
+def build_client(document: int) -> Client:
+    """Build a valid client."""
+    return Client(name="client", document=document, document_type=DocumentType.CEDULA_CIUDADANIA)
+
+
+def test_failed_uploads_are_retried(tmp_path: Path) -> None:
+    """A registration survives upstream errors until it is sent."""
+    uploads: List[int] = []
+
+    def flaky_upload(client: Client) -> None:
+        uploads.append(client.document)
+        if len(uploads) == 1:
+            raise SendDataError("PirPos is down")
+
+    journal = RegistrationJournal(str(tmp_path / "registrations.sqlite3"))
+    worker = RegistrationWorker(journal, flaky_upload, logging.getLogger(__name__), base_delay=0)
+    ticket = journal.append(build_client(10))
+    assert journal.append(build_client(10)) == ticket
+
+    assert worker.drain_once()
+    registration = journal.get(ticket)
+    assert registration and registration.status == RegistrationStatus.PENDING
+    assert registration.last_error == "PirPos is down"
+
+    assert worker.drain_once()
+    assert not worker.drain_once()
+    registration = journal.get(ticket)
+    assert registration and registration.status == RegistrationStatus.DONE
+    assert registration.attempts == 2
+    assert uploads == [10, 10]
+
+
+def test_existing_clients_fail_without_retries(tmp_path: Path) -> None:
+    """A client already registered is reported and not sent again."""
+    def existing_upload(client: Client) -> None:
+        raise AlreadyExistsError("Client already exists")
+
+    journal = RegistrationJournal(str(tmp_path / "registrations.sqlite3"))
+    worker = RegistrationWorker(journal, existing_upload, logging.getLogger(__name__))
+    ticket = journal.append(build_client(10))
+
+    assert worker.drain_once()
+    registration = journal.get(ticket)
+    assert registration and registration.status == RegistrationStatus.FAILED
+    assert journal.pending() == 0
+
+
+def test_uploads_end_before_their_lease(tmp_path: Path) -> None:
+    """An upload gets less time than the lease of its registration."""
+    deadlines: List[Optional[float]] = []
+
+    def upload(client: Client) -> None:
+        deadlines.append(get_remaining())
+
+    journal = RegistrationJournal(str(tmp_path / "registrations.sqlite3"))
+    worker = RegistrationWorker(journal, upload, logging.getLogger(__name__), lease=60)
+    journal.append(build_client(10))
+
+    assert worker.drain_once()
+    assert len(deadlines) == 1 and deadlines[0] is not None and 0 < deadlines[0] <= 48
+
+
+def test_registration_claimed_by_another_worker(tmp_path: Path) -> None:
+    """A worker whose lease expired can't overwrite the result of the next one."""
+    journal = RegistrationJournal(str(tmp_path / "registrations.sqlite3"))
+    other_worker = RegistrationWorker(journal, lambda client: None, logging.getLogger(__name__))
+
+    def slow_upload(client: Client) -> None:
+        # the lease expired, the other worker sends it again and the client exists now
+        assert other_worker.drain_once()
+        raise AlreadyExistsError("Client already exists")
+
+    late_worker = RegistrationWorker(journal, slow_upload, logging.getLogger(__name__), lease=0)
+    ticket = journal.append(build_client(10))
+
+    assert late_worker.drain_once()
+    registration = journal.get(ticket)
+    assert registration and registration.status == RegistrationStatus.DONE
+    assert registration.attempts == 1 and registration.last_error is None
@@ -0,0 +1,197 @@
+"""Tests for the users manager."""
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+import pytest
+from app.v1.clients import AsyncConnector, DummyConnector
+from app.v1.clients.pos_system.resilience import Bulkhead
+from app.v1.clients.pos_system.utils import PirposClient
+from app.v1.models import Client, DocumentType
+from app.v1.storage import RegistrationJournal
+from app.v1.use_cases import RegistrationWorker, UsersManager
+from app.v1.utils.cache import HIT, MISS, STALE, TTLCache, get_cache_reads, reset_cache_reads, start_cache_reads
+from app.v1.utils.errors import SendDataError, UpstreamUnavailableError
+
+
+class SlowConnector(DummyConnector):
+    """Connector answering every lookup after a delay."""
+
+    def __init__(self) -> None:
+        self.lookups: List[int] = []
+
+    def get_client(self, document: int) -> Optional[Client]:
+        """Return a client after a delay."""
+        self.lookups.append(document)
+        time.sleep(0.1)
+        return Client(name="client", document=document, document_type=DocumentType.CEDULA_CIUDADANIA)
+
+
+def test_async_lookups_overlap() -> None:
+    """Async lookups wait for the upstream at the same time."""
+    connector = SlowConnector()
+    manager = UsersManager(connector)
+
+    async def lookup_all() -> List[Optional[Client]]:
+        return await asyncio.gather(*(manager.get_user_async(document) for document in range(4)))
+
+    start = time.monotonic()
+    users = asyncio.run(lookup_all())
+    assert time.monotonic() - start < 0.3
+    assert [user.document for user in users if user] == [0, 1, 2, 3]
+
+
+def test_lookups_are_cached_until_updated() -> None:
+    """Repeated lookups hit the cache until the user is updated."""
+    connector = SlowConnector()
+    manager = UsersManager(connector, TTLCache(maxsize=10, ttl=60))
+    user = manager.get_user(1)
+    manager.get_user(1)
+    assert connector.lookups == [1]
+
+    assert user is not None
+    manager.update_user(user)
+    manager.get_user(1)
+    assert connector.lookups == [1, 1]
+
+
+def test_cached_user_is_not_created_again() -> None:
+    """A user found in the cache is rejected without calling the connector."""
+    connector = SlowConnector()
+    manager = UsersManager(connector, TTLCache(maxsize=10, ttl=60))
+    user = manager.get_user(1)
+    assert user is not None
+
+    with pytest.raises(SendDataError):
+        manager.upload_user(user)
+
+
+def test_stale_user_is_served_while_refreshed() -> None:
+    """An expired user within the grace period is returned at once and refreshed."""
+    connector = SlowConnector()
+    manager = UsersManager(connector, TTLCache(maxsize=10, ttl=0.05, grace=60))
+    manager.get_user(1)
+    time.sleep(0.06)
+
+    start = time.monotonic()
+    user = manager.get_user(1)
+    assert time.monotonic() - start < 0.05
+    assert user is not None and user.document == 1
+    for _ in range(50):
+        if len(connector.lookups) == 2 and not manager.refresh_stats()["pending"]:
+            break
+        time.sleep(0.01)
+    assert connector.lookups == [1, 1]
+    assert manager.refresh_stats()["scheduled"] == 1
+
+
+class MirroredConnector(DummyConnector):
+    """Connector answering lookups from a copy read 100 seconds ago."""
+
+    def __init__(self) -> None:
+        self.fresh_lookups: List[int] = []
+
+    def get_client(self, document: int) -> Optional[Client]:
+        """Return the copied client."""
+        return PirposClient(
+            name="client", document=document, document_type=DocumentType.CEDULA_CIUDADANIA,
+            pirpos_id=f"id-{document}", fetched_at=time.time() - 100,
+        )
+
+    def get_fresh_client(self, document: int) -> Optional[Client]:
+        """Return the client read right now."""
+        self.fresh_lookups.append(document)
+        return Client(name="client", document=document, document_type=DocumentType.CEDULA_CIUDADANIA)
+
+
+def read_user(manager: UsersManager, document: int) -> Tuple[str, float]:
+    """Look up a user and get the freshness and age reported for it."""
+    token = start_cache_reads()
+    try:
+        manager.get_user(document)
+        reads = get_cache_reads()
+    finally:
+        reset_cache_reads(token)
+    assert reads is not None
+    return reads
+
+
+def test_mirrored_user_keeps_its_age_and_is_refreshed_upstream() -> None:
+    """A user copied by the connector is as old as the copy, and refreshes skip the copy."""
+    connector = MirroredConnector()
+    manager = UsersManager(connector, TTLCache(maxsize=10, ttl=0.2, grace=60))
+    freshness, age = read_user(manager, 1)
+    assert freshness == MISS and age >= 100
+    freshness, age = read_user(manager, 1)
+    assert freshness == HIT and age >= 100
+    time.sleep(0.25)
+
+    freshness, age = read_user(manager, 1)
+    assert freshness == STALE and age >= 100
+    for _ in range(50):
+        if connector.fresh_lookups and not manager.refresh_stats()["pending"]:
+            break
+        time.sleep(0.01)
+    assert connector.fresh_lookups == [1]
+    freshness, age = read_user(manager, 1)
+    assert freshness == HIT and age < 1
+
+
+class BulkheadConnector(DummyConnector):
+    """Connector running its lookups inside a small bulkhead."""
+
+    def __init__(self, max_concurrent: int) -> None:
+        self.bulkhead = Bulkhead(max_concurrent=max_concurrent, max_wait=0.01)
+
+    def get_client(self, document: int) -> Optional[Client]:
+        """Hold a slot while the upstream answers."""
+        with self.bulkhead.slot():
+            time.sleep(0.05)
+        return None
+
+
+def test_batch_lookups_stay_within_the_bulkhead() -> None:
+    """A batch asking for more concurrency than the bulkhead has is reduced to its size."""
+    connector = BulkheadConnector(max_concurrent=2)
+    async_connector = AsyncConnector(connector, max_workers=8)
+    unbounded = UsersManager(connector, async_connector=async_connector)
+    found = asyncio.run(unbounded.get_users_async(list(range(8)), max_concurrency=8))
+    assert any(isinstance(user, UpstreamUnavailableError) for user in found.values())
+
+    bounded = UsersManager(connector, async_connector=async_connector, max_concurrency=2)
+    found = asyncio.run(bounded.get_users_async(list(range(8, 16)), max_concurrency=8))
+    assert found == {document: None for document in range(8, 16)}
+
+
+class RegisteringConnector(DummyConnector):
+    """Connector finding the clients once they are uploaded."""
+
+    def __init__(self) -> None:
+        self.uploaded: List[int] = []
+
+    def get_client(self, document: int) -> Optional[Client]:
+        """Find the uploaded clients."""
+        if document in self.uploaded:
+            return Client(name="client", document=document, document_type=DocumentType.CEDULA_CIUDADANIA)
+        return None
+
+    def upload_client(self, client: Client) -> None:
+        """Keep the uploaded documents."""
+        self.uploaded.append(client.document)
+
+
+def test_background_registration_drops_the_cached_lookup(tmp_path: Path) -> None:
+    """A user created by the registration worker is not reported missing from the cache."""
+    connector = RegisteringConnector()
+    journal = RegistrationJournal(str(tmp_path / "registrations.sqlite3"))
+    worker = RegistrationWorker(
+        journal, lambda client: manager.upload_user(client), logging.getLogger(__name__), autostart=False
+    )
+    manager = UsersManager(connector, TTLCache(maxsize=10, ttl=60, negative_ttl=60), registrations=worker)
+    assert manager.get_user(5) is None
+
+    manager.enqueue_user(Client(name="client", document=5, document_type=DocumentType.CEDULA_CIUDADANIA))
+    assert worker.drain_once()
+    user = manager.get_user(5)
+    assert user is not None and user.document == 5
@@ -0,0 +1,39 @@
+"""Tests for the in-process caches."""
+import time
+from app.v1.utils.cache import TTLCache
+
+
+def test_hits_misses_and_lru_eviction() -> None:
+    """The least recently used key is evicted first."""
+    cache: TTLCache[str] = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, "one")
+    cache.set(2, "two")
+    assert cache.get(1) == (True, "one")
+    cache.set(3, "three")
+
+    assert cache.get(2) == (False, None)
+    assert cache.get(3) == (True, "three")
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "size": 2}
+
+
+def test_negative_results_expire_first() -> None:
+    """`None` values use the negative time to live."""
+    cache: TTLCache[str] = TTLCache(maxsize=2, ttl=60, negative_ttl=0.01)
+    cache.set(1, None)
+    assert cache.get(1) == (True, None)
+    time.sleep(0.02)
+    assert cache.get(1) == (False, None)
+
+
+def test_expired_values_are_stale_during_the_grace_period() -> None:
+    """Expired values stay available to `get_stale`, negative results don't."""
+    cache: TTLCache[str] = TTLCache(maxsize=2, ttl=0.01, grace=0.05)
+    cache.set(1, "one")
+    cache.set(2, None)
+    time.sleep(0.02)
+    assert cache.get(1) == (False, None)
+    stale = cache.get_stale(1)
+    assert stale is not None and stale[0] == "one" and stale[1] >= 0.01
+    assert cache.get_stale(2) is None
+    time.sleep(0.05)
+    assert cache.get_stale(1) is None
@@ -0,0 +1,73 @@
+"""Tests for the concurrency helpers."""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import pytest
+from app.v1.utils.concurrency import SingleFlight, run_in_each_worker
+from app.v1.utils.deadline import deadline_scope
+from app.v1.utils.errors import DeadlineExceededError
+
+
+def test_concurrent_calls_are_coalesced() -> None:
+    """Identical calls in flight share one execution and its result."""
+    flight: SingleFlight[int] = SingleFlight()
+    started = threading.Event()
+    executions: List[int] = []
+
+    def slow_call() -> int:
+        executions.append(1)
+        started.set()
+        time.sleep(0.1)
+        return 42
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(flight.do, "key", slow_call)
+        started.wait()
+        followers = [executor.submit(flight.do, "key", slow_call) for _ in range(3)]
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert results == [42] * 4
+    assert len(executions) == 1
+    assert flight.stats() == {"executed": 1, "coalesced": 3}
+
+
+def test_errors_are_raised_again() -> None:
+    """The error of a call is raised to the caller and the key is released."""
+    flight: SingleFlight[int] = SingleFlight()
+
+    def failing_call() -> int:
+        raise ValueError("upstream error")
+
+    with pytest.raises(ValueError):
+        flight.do("key", failing_call)
+    assert flight.do("key", lambda: 1) == 1
+
+
+def test_followers_stop_waiting_at_their_deadline() -> None:
+    """A caller doesn't wait for a call in flight past its own deadline."""
+    flight: SingleFlight[int] = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_call() -> int:
+        started.set()
+        release.wait()
+        return 42
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(flight.do, "key", slow_call)
+        started.wait()
+        with deadline_scope(0.05):
+            with pytest.raises(DeadlineExceededError):
+                flight.do("key", slow_call)
+        release.set()
+        assert leader.result() == 42
+
+
+def test_worker_start_runs_right_away_outside_uwsgi() -> None:
+    """Without uWSGI there is no fork to wait for."""
+    started: List[int] = []
+    run_in_each_worker(lambda: started.append(os.getpid()))
+    assert started == [os.getpid()]
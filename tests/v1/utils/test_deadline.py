@@ -0,0 +1,30 @@
+"""Tests for the request deadlines."""
+import pytest
+from app.v1.utils.deadline import DeadlinePolicy, deadline_scope, get_remaining, limit_timeout
+from app.v1.utils.errors import DeadlineExceededError
+
+
+def test_timeouts_are_limited_to_the_time_left() -> None:
+    """Calls only get the time left before the deadline."""
+    assert get_remaining() is None
+    assert limit_timeout(20) == 20
+    with deadline_scope(2):
+        assert 0 < limit_timeout(20) <= 2
+    with deadline_scope(0):
+        with pytest.raises(DeadlineExceededError):
+            limit_timeout(20)
+    assert get_remaining() is None
+
+
+def test_budget_by_endpoint_and_header() -> None:
+    """Endpoints have their own budget and callers can only shorten it."""
+    policy = DeadlinePolicy(
+        default=25, endpoints=DeadlinePolicy.parse_endpoints("batch=60, export=0")
+    )
+    assert policy.get_budget("users.get_user", None) == 25
+    assert policy.get_budget("batch", None) == 60
+    assert policy.get_budget("export", None) is None
+    assert policy.get_budget("users.get_user", "5") == 5
+    assert policy.get_budget("users.get_user", "90") == 25
+    assert policy.get_budget("export", "90") == 90
+    assert policy.get_budget("users.get_user", "invalid") == 25
@@ -0,0 +1,51 @@
+"""Tests for the logging pipeline."""
+import io
+import json
+import logging
+from app.v1.utils.log import (
+    JsonFormatter,
+    QueueLogHandler,
+    RateLimitFilter,
+    log_cache_outcome,
+    log_upstream_call,
+    reset_log_context,
+    start_log_context,
+)
+
+
+def test_records_carry_the_request_context() -> None:
+    """Records are written as JSON lines with the context they were logged in."""
+    output = io.StringIO()
+    stream = logging.StreamHandler(output)
+    stream.setFormatter(JsonFormatter())
+    handler = QueueLogHandler([stream])
+    logger = logging.getLogger("tests.log.context")
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    token = start_log_context(request_id="abc", route="users.get_user")
+    log_upstream_call("search", 0.25)
+    log_upstream_call("search", 0.5, "http_500")
+    log_cache_outcome("users", False)
+    logger.info("Request %s", "finished", extra={"status": 200})
+    reset_log_context(token)
+    logger.info("Outside a request")
+    handler.close()
+    logger.removeHandler(handler)
+
+    first, second = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert first["message"] == "Request finished"
+    assert first["request_id"] == "abc"
+    assert first["status"] == 200
+    assert first["upstream"] == {"search": {"calls": 2, "seconds": 0.75, "errors": 1}}
+    assert first["cache"] == {"users": {"hit": 0, "miss": 1}}
+    assert "request_id" not in second
+
+
+def test_rate_limited_records() -> None:
+    """Only marked records are limited."""
+    limiter = RateLimitFilter(max_records=2, interval=60)
+    marked = [logging.makeLogRecord({"rate_limit": "ping"}) for _ in range(5)]
+    assert [limiter.filter(record) for record in marked] == [True, True, False, False, False]
+    assert limiter.filter(logging.makeLogRecord({}))
@@ -0,0 +1,37 @@
+"""Tests for the metrics registry."""
+import os
+from pathlib import Path
+from app.v1.utils.metrics import MetricsRegistry
+
+
+def test_values_are_added_up_across_processes(tmp_path: Path) -> None:
+    """A scrape adds up the values of every worker, including finished ones."""
+    registry = MetricsRegistry(str(tmp_path))
+    calls = registry.counter("calls_total", "Calls.")
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1))
+    registry.add_collector("cache", lambda: {"size": 3, "nested": {"hits": 1}})
+
+    pid = os.fork()
+    if pid == 0:  # worker process, it must never go back to pytest
+        code = 1
+        try:
+            calls.inc(operation="search")
+            latency.observe(0.5, operation="search")
+            registry.flush()
+            code = 0
+        finally:
+            os._exit(code)  # pylint: disable=protected-access
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    calls.inc(2, operation="search")
+    latency.observe(0.05, operation="search")
+    rendered = registry.render()
+
+    assert 'pos_connector_calls_total{operation="search"} 3' in rendered
+    assert 'pos_connector_latency_seconds_bucket{operation="search",le="0.1"} 1' in rendered
+    assert 'pos_connector_latency_seconds_bucket{operation="search",le="1"} 2' in rendered
+    assert 'pos_connector_latency_seconds_count{operation="search"} 2' in rendered
+    # gauges only come from live workers
+    assert "pos_connector_cache_size 3" in rendered
+    assert "pos_connector_cache_nested_hits 1" in rendered